@@ -1,3 +1,9 @@
+# The sort helpers live in students.utils (roll order uses the stored roll_sort_key)
+from students.utils import sort_students_by_name, sort_students_by_roll
+
+__all__ = ['linear_search_students', 'sort_students_by_name', 'sort_students_by_roll']
+
+
 def linear_search_students(students, query):
    
     result = []
@@ -10,17 +16,3 @@ def linear_search_students(students, query):
             (student.phone_number and query in student.phone_number.lower())):
             result.append(student)
     return result
-
-def sort_students_by_name(students):
-  
-    return sorted(students, key=lambda s: s.first_name.lower())
-
-def sort_students_by_roll(students):
-    def roll_sort_key(s):
-        roll = s.roll_number
-        if not roll:
-            return (1, '', 0)
-        if roll.isdigit():
-            return (0, '', int(roll))
-        return (0, roll, 0)
-    return sorted(students, key=roll_sort_key)
\ No newline at end of file
@@ -0,0 +1,275 @@
+"""
+Per-person attendance bitmaps.
+
+Alongside the daily_attendance records, every person has one
+AttendanceBitmap per academic year: two bitsets with one bit per day of
+the year - ``marked`` (a record exists) and ``present`` - plus running
+totals. Bitsets are stored as 32-bit words keyed by word index, so one
+mark is a single $bit/$inc upsert, and any range statistic, streak or
+heatmap is computed from at most a few hundred bytes with popcount
+instead of counting documents.
+
+Marking code passes the state of the record each write replaced (its
+before-image) so the totals can be adjusted with $inc; concurrent marks
+of the same person and day each see the state they overwrote, so every
+change is counted once. rebuild_attendance_bitmaps recomputes everything
+from daily_attendance and then records that the bitmaps are built; it is
+required once, for records marked before bitmaps existed. Until then the
+bitmaps written by marking hold only recent marks, so readers build the
+person's bitmaps in memory from their daily_attendance records instead.
+"""
+
+import datetime
+
+from pymongo import ReplaceOne, UpdateOne
+
+ACADEMIC_YEAR_START_MONTH = 7  # Academic years run July to June
+WORD_BITS = 32
+WORD_MASK = (1 << WORD_BITS) - 1
+BUILD_NAME = 'bitmaps'  # AttendanceSummaryBuild marker set by rebuild_bitmaps
+
+
+def academic_year(date):
+    """Academic year ``date`` falls in, named by the calendar year it starts in"""
+    return date.year if date.month >= ACADEMIC_YEAR_START_MONTH else date.year - 1
+
+
+def year_start(year):
+    return datetime.date(year, ACADEMIC_YEAR_START_MONTH, 1)
+
+
+def year_end(year):
+    return year_start(year + 1) - datetime.timedelta(days=1)
+
+
+def day_index(date):
+    """Bit position of ``date`` within its academic year"""
+    return (date - year_start(academic_year(date))).days
+
+
+def _word(words, index):
+    return int(words.get(str(index), 0)) & WORD_MASK
+
+
+def count_bits(words, first, last):
+    """Number of set bits at positions first..last (inclusive) of a word dict"""
+    total = 0
+    for index in range(first // WORD_BITS, last // WORD_BITS + 1):
+        low = max(first - index * WORD_BITS, 0)
+        high = min(last - index * WORD_BITS, WORD_BITS - 1)
+        mask = ((1 << (high - low + 1)) - 1) << low
+        total += (_word(words, index) & mask).bit_count()
+    return total
+
+
+def is_set(words, position):
+    return bool(_word(words, position // WORD_BITS) >> (position % WORD_BITS) & 1)
+
+
+# ----------------------------------------------------------------------
+# Maintenance
+# ----------------------------------------------------------------------
+def bitmap_update(person_type, person, person_id, date, is_present, was_present=None, now=None):
+    """
+    Upsert applying one mark to the person's bitmap. ``was_present`` is the
+    previous state of the record (None when the day had not been marked).
+    """
+    position = day_index(date)
+    field = str(position // WORD_BITS)
+    mask = 1 << (position % WORD_BITS)
+    return UpdateOne(
+        {'person_type': person_type, 'person': person, 'academic_year': academic_year(date)},
+        {
+            '$bit': {
+                f'marked.{field}': {'or': mask},
+                f'present.{field}': {'or': mask} if is_present else {'and': ~mask & WORD_MASK},
+            },
+            '$inc': {
+                'marked_days': 0 if was_present is not None else 1,
+                'present_days': int(bool(is_present)) - int(bool(was_present)),
+            },
+            '$set': {'person_id': person_id, 'updated_at': now or datetime.datetime.now()},
+        },
+        upsert=True,
+    )
+
+
+def update_bitmaps(operations):
+    """Apply bitmap_update operations in one bulk write"""
+    from .marking import write_upserts
+    from .models import AttendanceBitmap
+
+    if operations:
+        write_upserts(AttendanceBitmap._get_collection(), operations)
+
+
+def build_bitmap_documents(records):
+    """
+    Bitmap documents computed from raw daily_attendance records (each with
+    person_type, student/teacher, person_id, date and is_present).
+    """
+    now = datetime.datetime.now()
+    bitmaps = {}
+    for record in records:
+        person_type = record.get('person_type')
+        person = record.get(person_type) if person_type in ('student', 'teacher') else None
+        if person is None or record.get('date') is None:
+            continue
+        date = record['date'].date()
+        key = (person_type, person, academic_year(date))
+        bitmap = bitmaps.get(key)
+        if bitmap is None:
+            bitmap = bitmaps[key] = {
+                'person_type': person_type,
+                'person': person,
+                'person_id': record.get('person_id'),
+                'academic_year': key[2],
+                'marked': {},
+                'present': {},
+                'marked_days': 0,
+                'present_days': 0,
+                'updated_at': now,
+            }
+        position = day_index(date)
+        field = str(position // WORD_BITS)
+        mask = 1 << (position % WORD_BITS)
+        if bitmap['marked'].get(field, 0) & mask:
+            continue  # Duplicate record for the day
+        bitmap['marked'][field] = bitmap['marked'].get(field, 0) | mask
+        bitmap['marked_days'] += 1
+        if record.get('is_present'):
+            bitmap['present'][field] = bitmap['present'].get(field, 0) | mask
+            bitmap['present_days'] += 1
+    return list(bitmaps.values())
+
+
+def rebuild_bitmaps(batch_size=1000):
+    """Recompute every bitmap from daily_attendance; returns how many were written"""
+    from .models import AttendanceBitmap, AttendanceSummaryBuild, DailyAttendance
+
+    started = datetime.datetime.now()
+    records = DailyAttendance._get_collection().find(
+        {}, {'person_type': 1, 'student': 1, 'teacher': 1, 'person_id': 1, 'date': 1, 'is_present': 1}
+    )
+    collection = AttendanceBitmap._get_collection()
+    documents = build_bitmap_documents(records)
+    for offset in range(0, len(documents), batch_size):
+        collection.bulk_write([
+            ReplaceOne(
+                {'person_type': doc['person_type'], 'person': doc['person'], 'academic_year': doc['academic_year']},
+                doc,
+                upsert=True,
+            )
+            for doc in documents[offset:offset + batch_size]
+        ], ordered=False)
+    # Bitmaps for people/years that no longer have any records
+    collection.delete_many({'updated_at': {'$lt': started}})
+    AttendanceSummaryBuild._get_collection().update_one(
+        {'name': BUILD_NAME}, {'$set': {'built_at': started}}, upsert=True,
+    )
+    return len(documents)
+
+
+def bitmaps_built():
+    """True once rebuild_bitmaps has run; bitmaps written before that only hold marks made since deploy"""
+    from .models import AttendanceSummaryBuild
+
+    return AttendanceSummaryBuild._get_collection().find_one({'name': BUILD_NAME}, {'_id': 1}) is not None
+
+
+# ----------------------------------------------------------------------
+# Queries
+# ----------------------------------------------------------------------
+def load_bitmaps(person_type, person, start, end):
+    """
+    {academic_year: raw bitmap} for the years overlapping start..end;
+    built from the person's daily_attendance records until the stored
+    bitmaps have been built.
+    """
+    from .models import AttendanceBitmap, DailyAttendance
+
+    years = list(range(academic_year(start), academic_year(end) + 1))
+    if not bitmaps_built():
+        records = DailyAttendance._get_collection().find(
+            {
+                person_type: person,
+                'date': {
+                    '$gte': datetime.datetime.combine(year_start(years[0]), datetime.time.min),
+                    '$lte': datetime.datetime.combine(year_end(years[-1]), datetime.time.min),
+                },
+            },
+            {'person_type': 1, person_type: 1, 'person_id': 1, 'date': 1, 'is_present': 1},
+        )
+        return {doc['academic_year']: doc for doc in build_bitmap_documents(records)}
+    return {
+        doc['academic_year']: doc
+        for doc in AttendanceBitmap._get_collection().find(
+            {'person_type': person_type, 'person': person, 'academic_year': {'$in': years}},
+            {'academic_year': 1, 'marked': 1, 'present': 1},
+        )
+    }
+
+
+def _year_ranges(start, end):
+    """(academic_year, first bit, last bit) covering start..end"""
+    for year in range(academic_year(start), academic_year(end) + 1):
+        first = day_index(max(start, year_start(year)))
+        last = day_index(min(end, year_end(year)))
+        yield year, first, last
+
+
+def range_stats(person_type, person, start, end, bitmaps=None):
+    """Attendance totals between start and end (inclusive), in get_*_attendance_stats form"""
+    if bitmaps is None:
+        bitmaps = load_bitmaps(person_type, person, start, end)
+    total_days = present_days = 0
+    for year, first, last in _year_ranges(start, end):
+        bitmap = bitmaps.get(year)
+        if bitmap:
+            total_days += count_bits(bitmap.get('marked', {}), first, last)
+            present_days += count_bits(bitmap.get('present', {}), first, last)
+    return {
+        'total_days': total_days,
+        'present_days': present_days,
+        'absent_days': total_days - present_days,
+        'attendance_percentage': round((present_days / total_days * 100), 1) if total_days > 0 else 0,
+    }
+
+
+def day_statuses(bitmaps, start, end):
+    """Yield (date, True/False/None) for every day from start to end"""
+    date = start
+    for year, first, last in _year_ranges(start, end):
+        bitmap = bitmaps.get(year) or {}
+        marked, present = bitmap.get('marked', {}), bitmap.get('present', {})
+        for position in range(first, last + 1):
+            yield date, (is_set(present, position) if is_set(marked, position) else None)
+            date += datetime.timedelta(days=1)
+
+
+def streaks(person_type, person, start, end, bitmaps=None):
+    """
+    Present-day streaks between start and end. Unmarked days (weekends,
+    holidays) neither extend nor break a streak. ``current`` is the run
+    ending at the last marked day.
+    """
+    if bitmaps is None:
+        bitmaps = load_bitmaps(person_type, person, start, end)
+    current = longest = 0
+    for _, status in day_statuses(bitmaps, start, end):
+        if status is None:
+            continue
+        current = current + 1 if status else 0
+        longest = max(longest, current)
+    return {'current': current, 'longest': longest}
+
+
+def heatmap(person_type, person, start, end, bitmaps=None):
+    """One {'date', 'status'} entry per day; status is 'present', 'absent' or None"""
+    if bitmaps is None:
+        bitmaps = load_bitmaps(person_type, person, start, end)
+    labels = {True: 'present', False: 'absent', None: None}
+    return [
+        {'date': date.isoformat(), 'status': labels[status]}
+        for date, status in day_statuses(bitmaps, start, end)
+    ]
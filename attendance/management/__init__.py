@@ -0,0 +1 @@
+# Attendance management module
\ No newline at end of file
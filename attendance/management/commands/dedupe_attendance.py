@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from attendance.marking import pick_attendance_record
+from attendance.models import DailyAttendance
+
+
+class Command(BaseCommand):
+    help = ('Remove duplicate daily attendance records of the same person and day (keeping the most '
+            'recently marked), then build the DailyAttendance indexes. Run before deploying the unique '
+            '(student, date) and (teacher, date) indexes; safe to re-run')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the duplicate records')
+
+    def handle(self, *args, **options):
+        # Raw collection: _get_collection() would try to build the unique indexes first and fail
+        records = DailyAttendance._get_db()[DailyAttendance._get_collection_name()]
+
+        removed = 0
+        for person_type in ('student', 'teacher'):
+            groups = records.aggregate([
+                {'$match': {'person_type': person_type}},
+                {'$group': {
+                    '_id': {'person': f'${person_type}', 'date': '$date'},
+                    'ids': {'$push': '$_id'},
+                    'count': {'$sum': 1},
+                }},
+                {'$match': {'count': {'$gt': 1}}},
+            ], allowDiskUse=True)
+            for group in groups:
+                _, duplicate_ids = pick_attendance_record(
+                    records.find({'_id': {'$in': group['ids']}}, {'marked_at': 1})
+                )
+                removed += len(duplicate_ids)
+                if not options['dry_run']:
+                    records.delete_many({'_id': {'$in': duplicate_ids}})
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"{removed} duplicate attendance records would be removed"))
+            return
+
+        DailyAttendance.ensure_indexes()
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} duplicate attendance records; indexes are up to date"
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from attendance.bitmaps import rebuild_bitmaps
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute every attendance bitmap from daily_attendance (required once before statistics are read '
+        'from bitmaps; also repairs drifted totals)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Bitmaps sent per bulk write (default: 1000)')
+
+    def handle(self, *args, **options):
+        written = rebuild_bitmaps(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} attendance bitmaps"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from attendance.rollups import backfill_semesters, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Backfill the semester of older student attendance records and recompute the daily attendance rollups '
+        'from daily_attendance (required once after dedupe_attendance when deploying rollups; also repairs counts)'
+    )
+
+    def handle(self, *args, **options):
+        backfilled = backfill_semesters()
+        if backfilled:
+            self.stdout.write(f"Backfilled the semester of {backfilled} student attendance records")
+        written = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} daily attendance rollups"))
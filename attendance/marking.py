@@ -0,0 +1,305 @@
+"""
+Attendance marking.
+
+Every student on a class sheet is resolved with one $in query and the
+sheet's existing records with another. The whole sheet is then written
+with one bulk_write: insert-only upserts keyed on (student, date) for
+first marks, and replaces filtered on the state just read for re-marks.
+The unique (student, date) and (teacher, date) indexes on
+daily_attendance guarantee one record per person per day, even when two
+people submit the same sheet at once; records duplicated by the old
+delete-then-insert marking are removed by the dedupe_attendance command,
+which must run before those indexes are built.
+
+Person name/id are copied from the documents already loaded here, so
+nothing is dereferenced while writing. Each mark is then applied to the
+person's attendance bitmap (attendance.bitmaps) and to the daily rollup
+counts (attendance.rollups), with one bulk write each. Their $inc deltas
+come from the record each write actually replaced: a re-mark only
+succeeds if the record still holds the state that was read, and the few
+marks that raced with another writer are redone one at a time with
+find_one_and_replace, so two submissions of the same sheet at once still
+count every change exactly once.
+"""
+
+import datetime
+
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from .bitmaps import bitmap_update, update_bitmaps
+from .rollups import merge_deltas, rollup_deltas, update_rollups
+
+DUPLICATE_KEY = 11000
+
+
+def _day(date):
+    """datetime at midnight for ``date`` (how DateField values are stored)"""
+    return datetime.datetime.combine(date, datetime.time.min)
+
+
+def check_mark(is_present):
+    """Reject marks that are not real booleans ("false", 0, None, ...) instead of coercing them"""
+    if not isinstance(is_present, bool):
+        raise ValueError(f'Attendance marks must be true or false, not {is_present!r}')
+    return is_present
+
+
+def _attendance_document(person_type, person, date, is_present, marked_by_id=None, notes='',
+                         self_marked=False, status='pending', now=None):
+    """
+    Raw daily_attendance document for one person and day. ``person`` is a
+    raw document (or dict) with _id, first_name, last_name and the
+    student_id/teacher_id field, plus current_semester for students.
+    """
+    document = {
+        person_type: person['_id'],
+        'date': _day(date),
+        'is_present': check_mark(is_present),
+        'status': status,
+        'self_marked': self_marked,
+        'marked_at': now or datetime.datetime.now(),
+        'person_type': person_type,
+        'person_name': f"{person.get('first_name', '')} {person.get('last_name', '')}"[:100],
+        'person_id': person[f'{person_type}_id'],
+    }
+    if person_type == 'student':
+        document['semester'] = person.get('current_semester')
+    if marked_by_id is not None:
+        document['marked_by'] = marked_by_id
+    if notes:
+        document['notes'] = notes
+    return document
+
+
+def _key(document, person_type):
+    return {person_type: document[person_type], 'date': document['date']}
+
+
+def write_upserts(collection, operations):
+    """
+    Run the upserts, returning (created, updated). Two sheets racing to
+    create the same record make one upsert fail on the unique index; those
+    are retried once, when they match the record the other sheet created.
+    """
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        return result.upserted_count, result.matched_count
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(error.get('code') != DUPLICATE_KEY for error in errors):
+            raise
+        created, updated = e.details.get('nUpserted', 0), e.details.get('nMatched', 0)
+        retry = [operations[error['index']] for error in errors]
+        result = collection.bulk_write(retry, ordered=False)
+        return created + result.upserted_count, updated + result.matched_count
+
+
+PREVIOUS_FIELDS = ('is_present', 'semester')
+
+
+def replace_record(collection, document, person_type):
+    """
+    Replace the person's record for the day with ``document`` (inserting it
+    if there is none) and return the replaced record's {'is_present',
+    'semester'}, or None. The before-image comes from the write itself, so
+    concurrent writers each see the state they actually replaced. The
+    record's _id is set on ``document``.
+    """
+    key = _key(document, person_type)
+    previous = collection.find_one_and_replace(
+        key, document, projection=list(PREVIOUS_FIELDS), return_document=ReturnDocument.BEFORE,
+    )
+    if previous is None:
+        try:
+            collection.insert_one(document)
+            return None
+        except DuplicateKeyError:
+            # A concurrent writer created it between our replace and insert
+            document.pop('_id', None)
+            previous = collection.find_one_and_replace(
+                key, document, projection=list(PREVIOUS_FIELDS), return_document=ReturnDocument.BEFORE,
+            )
+    document['_id'] = previous.pop('_id')
+    return previous
+
+
+def write_records(collection, documents, person_type):
+    """
+    Write one day's records, returning the before-image of each (None for
+    a first mark) in input order; every document gets its record's _id.
+
+    The sheet's existing records are read with one $in query, then every
+    document is written in one bulk write: an insert-only upsert for a
+    first mark, or a replace filtered on the state just read. A replace
+    whose record changed in between misses its filter and its upsert fails
+    on the unique index, so exactly the marks that raced with another
+    writer are retried, one at a time, with replace_record.
+    """
+    if not documents:
+        return []
+    day = documents[0]['date']
+    seen = {
+        record[person_type]: record
+        for record in collection.find(
+            {person_type: {'$in': [document[person_type] for document in documents]}, 'date': day},
+            [person_type, *PREVIOUS_FIELDS],
+        )
+    }
+
+    operations = []
+    for document in documents:
+        key = _key(document, person_type)
+        record = seen.get(document[person_type])
+        if record is None:
+            operations.append(UpdateOne(key, {'$setOnInsert': document}, upsert=True))
+        else:
+            document['_id'] = record['_id']
+            expected = dict(key, is_present=record.get('is_present'), semester=record.get('semester'))
+            operations.append(ReplaceOne(expected, document, upsert=True))
+
+    try:
+        result = collection.bulk_write(operations, ordered=False).bulk_api_result
+    except BulkWriteError as e:
+        if any(error.get('code') != DUPLICATE_KEY for error in e.details.get('writeErrors', [])):
+            raise
+        result = e.details
+    upserted = {upsert['index']: upsert['_id'] for upsert in result.get('upserted', [])}
+    failed = {error['index'] for error in result.get('writeErrors', [])}
+
+    previous = []
+    for index, document in enumerate(documents):
+        record = seen.get(document[person_type])
+        if index in upserted:
+            # Created here (a first mark, or the record was deleted since it was read)
+            document['_id'] = upserted[index]
+            previous.append(None)
+        elif record is not None and index not in failed:
+            previous.append({field: record.get(field) for field in PREVIOUS_FIELDS})
+        else:
+            # Another writer created or changed the record first
+            document.pop('_id', None)
+            previous.append(replace_record(collection, document, person_type))
+    return previous
+
+
+def apply_summaries(changes, now=None):
+    """
+    Bring the attendance bitmaps and daily rollups up to date with written
+    marks. Each change is (person_type, person ObjectId, person_id, date,
+    is_present, semester, previous), where previous is the replaced
+    record's {'is_present', 'semester'} or None for a first mark.
+    """
+    now = now or datetime.datetime.now()
+    bitmap_operations = []
+    deltas = {}
+    for person_type, person, person_id, date, is_present, semester, previous in changes:
+        bitmap_operations.append(bitmap_update(
+            person_type, person, person_id, date, is_present,
+            previous.get('is_present', False) if previous else None, now,
+        ))
+        merge_deltas(deltas, rollup_deltas(person_type, date, semester, is_present, previous))
+    update_bitmaps(bitmap_operations)
+    update_rollups(deltas)
+
+
+def mark_students(date, marks, marked_by=None, notes=''):
+    """
+    Mark attendance for many students on one day.
+
+    ``marks`` maps student_id (the roll/registration id, not the ObjectId)
+    to True/False; any other value raises ValueError before anything is
+    written. Returns {'present', 'absent', 'created', 'updated',
+    'unknown'}, where unknown lists the ids that matched no student.
+    """
+    from students.models import Student
+    from .models import DailyAttendance
+
+    marks = {str(student_id): check_mark(is_present) for student_id, is_present in marks.items()}
+    if not marks:
+        return {'present': 0, 'absent': 0, 'created': 0, 'updated': 0, 'unknown': []}
+
+    students = list(Student.objects.filter(student_id__in=list(marks)).only(
+        'id', 'student_id', 'first_name', 'last_name', 'current_semester'
+    ).as_pymongo())
+    now = datetime.datetime.now()
+    marked_by_id = marked_by.id if marked_by is not None else None
+    # Same fields as the old delete-then-insert, written atomically in place
+    documents = [
+        _attendance_document('student', student, date, marks[student['student_id']], marked_by_id, notes, now=now)
+        for student in students
+    ]
+
+    created = 0
+    changes = []
+    if documents:
+        previous = write_records(DailyAttendance._get_collection(), documents, 'student')
+        for student, document, before in zip(students, documents, previous):
+            created += before is None
+            changes.append((
+                'student', student['_id'], student['student_id'], date, document['is_present'],
+                document['semester'], before,
+            ))
+        apply_summaries(changes, now)
+
+    present = sum(document['is_present'] for document in documents)
+    return {
+        'present': present,
+        'absent': len(documents) - present,
+        'created': created,
+        'updated': len(documents) - created,
+        'unknown': sorted(set(marks) - {student['student_id'] for student in students}),
+    }
+
+
+def pick_attendance_record(records):
+    """
+    Choose which of several raw records for one person and day to keep:
+    the most recently marked. Returns (kept _id, _ids to delete).
+    """
+    records = list(records)
+    kept = max(records, key=lambda record: (record.get('marked_at') or datetime.datetime.min, record['_id']))
+    return kept['_id'], [record['_id'] for record in records if record['_id'] != kept['_id']]
+
+
+def mark_teacher(teacher, date, is_present, notes='', self_marked=False):
+    """
+    Replace a teacher's record for the day (admin-marked records are
+    auto-approved); returns the raw document written (with its _id)
+    """
+    from .models import DailyAttendance
+
+    person = {
+        '_id': teacher.id,
+        'first_name': teacher.first_name,
+        'last_name': teacher.last_name,
+        'teacher_id': teacher.teacher_id,
+    }
+    document = _attendance_document(
+        'teacher', person, date, is_present, notes=notes, self_marked=self_marked,
+        status='pending' if self_marked else 'auto_approved',
+    )
+    previous = replace_record(DailyAttendance._get_collection(), document, 'teacher')
+    apply_summaries([('teacher', teacher.id, teacher.teacher_id, date, is_present, None, previous)])
+    return document
+
+
+def mark_student(student, date, is_present, marked_by=None, notes=''):
+    """Replace one student's record for the day; returns the raw document written (with its _id)"""
+    from .models import DailyAttendance
+
+    person = {
+        '_id': student.id,
+        'first_name': student.first_name,
+        'last_name': student.last_name,
+        'student_id': student.student_id,
+        'current_semester': student.current_semester,
+    }
+    document = _attendance_document(
+        'student', person, date, is_present, marked_by.id if marked_by is not None else None, notes,
+    )
+    [previous] = write_records(DailyAttendance._get_collection(), [document], 'student')
+    apply_summaries([
+        ('student', student.id, student.student_id, date, is_present, document['semester'], previous),
+    ], document['marked_at'])
+    return document
@@ -1,6 +1,8 @@
 # attendance/models.py - FIXED VERSION with all imports
 
-from mongoengine import Document, StringField, DateField, DateTimeField, ReferenceField, BooleanField, IntField
+from mongoengine import (
+    Document, StringField, DateField, DateTimeField, ReferenceField, BooleanField, IntField, DictField, ObjectIdField
+)
 from datetime import datetime
 from students.models import Student
 from courses.models import Teacher
@@ -35,6 +37,9 @@ class DailyAttendance(Document):
     notes = StringField(max_length=200, required=False)
     admin_notes = StringField(max_length=200, required=False)  # Admin feedback
     
+    # Student's semester when marked (None for teachers); keys the daily rollups
+    semester = IntField(required=False)
+    
     # Auto-generated fields
     person_type = StringField(choices=['student', 'teacher'], required=True)
     person_name = StringField(max_length=100, required=True)
@@ -44,22 +49,37 @@ class DailyAttendance(Document):
         'collection': 'daily_attendance',
         'indexes': [
             ('date', 'person_type'),
-            ('date', 'student'),
-            ('date', 'teacher'),
+            # One record per person per day; also serve per-person date ranges.
+            # mongoengine builds them on first use, which fails while duplicates exist:
+            # run manage.py dedupe_attendance before deploying.
+            {
+                'fields': ['student', 'date'],
+                'name': 'one_record_per_student_per_day',
+                'unique': True,
+                'partialFilterExpression': {'person_type': 'student'},
+            },
+            {
+                'fields': ['teacher', 'date'],
+                'name': 'one_record_per_teacher_per_day',
+                'unique': True,
+                'partialFilterExpression': {'person_type': 'teacher'},
+            },
             ('person_id', 'date'),
         ]
     }
     
     def save(self, *args, **kwargs):
         """Auto-populate fields before saving"""
-        if self.student:
-            self.person_type = 'student'
-            self.person_name = f"{self.student.first_name} {self.student.last_name}"
-            self.person_id = self.student.student_id
-        elif self.teacher:
-            self.person_type = 'teacher'
-            self.person_name = f"{self.teacher.first_name} {self.teacher.last_name}"
-            self.person_id = self.teacher.teacher_id
+        # Filled in once; later saves (approvals etc.) skip dereferencing the person
+        if not (self.person_type and self.person_id and self.person_name):
+            if self.student:
+                self.person_type = 'student'
+                self.person_name = f"{self.student.first_name} {self.student.last_name}"
+                self.person_id = self.student.student_id
+            elif self.teacher:
+                self.person_type = 'teacher'
+                self.person_name = f"{self.teacher.first_name} {self.teacher.last_name}"
+                self.person_id = self.teacher.teacher_id
         
         super().save(*args, **kwargs)
     
@@ -70,65 +90,54 @@ class DailyAttendance(Document):
     @classmethod
     def mark_student_attendance(cls, student, date, is_present, marked_by=None, notes=""):
         """Mark attendance for a student on a specific date"""
-        # Delete existing record for this date
-        cls.objects.filter(student=student, date=date).delete()
-        
-        # Create new record
-        attendance = cls(
-            student=student,
-            date=date,
-            is_present=is_present,
-            marked_by=marked_by,
-            notes=notes
-        )
-        attendance.save()
-        return attendance
+        from .marking import mark_student
+        return cls._from_son(mark_student(student, date, is_present, marked_by=marked_by, notes=notes))
     
     @classmethod
     def mark_teacher_attendance(cls, teacher, date, is_present, notes="", self_marked=False):
         """Mark attendance for a teacher on a specific date"""
-        # Delete existing record for this date
-        cls.objects.filter(teacher=teacher, date=date).delete()
-        
-        # Create new record
-        attendance = cls(
-            teacher=teacher,
-            date=date,
-            is_present=is_present,
-            notes=notes,
-            self_marked=self_marked,
-            status='pending' if self_marked else 'auto_approved'
-        )
-        attendance.save()
-        return attendance
+        from .marking import mark_teacher
+        return cls._from_son(mark_teacher(teacher, date, is_present, notes=notes, self_marked=self_marked))
     
     @classmethod
     def teacher_self_mark_attendance(cls, teacher, date, is_present, notes=""):
         """Teacher marks their own attendance - requires admin approval"""
-        # Check if already marked for this date
-        existing = cls.objects.filter(teacher=teacher, date=date).first()
-        if existing:
-            # Update existing record
-            existing.is_present = is_present
-            existing.notes = notes
-            existing.self_marked = True
-            existing.status = 'pending'
-            existing.marked_at = datetime.now()
-            existing.save()
-            return existing
+        from bson import ObjectId
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+        from .marking import _day, apply_summaries, check_mark
         
-        # Create new self-marked record
-        attendance = cls(
-            teacher=teacher,
-            date=date,
-            is_present=is_present,
-            notes=notes,
-            self_marked=True,
-            status='pending',
-            marked_by=teacher
-        )
-        attendance.save()
-        return attendance
+        # One atomic upsert; the before-image feeds the bitmap/rollup deltas
+        # and, with the update applied, is the record returned
+        key = {'teacher': teacher.id, 'date': _day(date)}
+        update = {
+            '$set': {
+                'is_present': check_mark(is_present),
+                'notes': notes,
+                'self_marked': True,
+                'status': 'pending',
+                'marked_at': datetime.now(),
+            },
+            '$setOnInsert': {
+                '_id': ObjectId(),
+                'person_type': 'teacher',
+                'person_name': f"{teacher.first_name} {teacher.last_name}"[:100],
+                'person_id': teacher.teacher_id,
+                'marked_by': teacher.id,
+            },
+        }
+        collection = cls._get_collection()
+        try:
+            previous = collection.find_one_and_update(
+                key, update, upsert=True, return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            previous = collection.find_one_and_update(key, update, return_document=ReturnDocument.BEFORE)
+        
+        apply_summaries([('teacher', teacher.id, teacher.teacher_id, date, is_present, None, previous)])
+        record = dict(previous) if previous is not None else dict(key, **update['$setOnInsert'])
+        record.update(update['$set'])
+        return cls._from_son(record)
     
     def approve_attendance(self, approver, admin_notes=""):
         """Admin approves teacher attendance"""
@@ -160,51 +169,89 @@ class DailyAttendance(Document):
     
     @classmethod
     def get_student_attendance_stats(cls, student, days=30):
-        """Get attendance statistics for a student"""
+        """Get attendance statistics for a student (from their attendance bitmap once built)"""
         from datetime import timedelta
+        from .bitmaps import range_stats
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days)
-        
-        records = cls.objects.filter(
-            student=student,
-            date__gte=start_date
-        )
-        
-        total_days = records.count()
-        present_days = records.filter(is_present=True).count()
-        absent_days = total_days - present_days
-        
-        percentage = round((present_days / total_days * 100), 1) if total_days > 0 else 0
-        
-        return {
-            'total_days': total_days,
-            'present_days': present_days,
-            'absent_days': absent_days,
-            'attendance_percentage': percentage
-        }
+        return range_stats('student', student.id, start_date, end_date)
     
     @classmethod
     def get_teacher_attendance_stats(cls, teacher, days=30):
-        """Get attendance statistics for a teacher"""
+        """Get attendance statistics for a teacher (from their attendance bitmap once built)"""
         from datetime import timedelta
+        from .bitmaps import range_stats
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days)
-        
-        records = cls.objects.filter(
-            teacher=teacher,
-            date__gte=start_date,
-            date__lte=end_date
-        )
-        
-        total_days = records.count()
-        present_days = records.filter(is_present=True).count()
-        absent_days = total_days - present_days
-        
-        percentage = round((present_days / total_days * 100), 1) if total_days > 0 else 0
-        
-        return {
-            'total_days': total_days,
-            'present_days': present_days,
-            'absent_days': absent_days,
-            'attendance_percentage': percentage
-        }
\ No newline at end of file
+        return range_stats('teacher', teacher.id, start_date, end_date)
+
+
+class AttendanceBitmap(Document):
+    """
+    Compact attendance history: one document per person per academic year
+    with one bit per day (see attendance.bitmaps)
+    """
+    
+    person_type = StringField(choices=['student', 'teacher'], required=True)
+    person = ObjectIdField(required=True)  # Student or Teacher id
+    person_id = StringField(max_length=50)
+    academic_year = IntField(required=True)  # Calendar year the academic year starts in
+    
+    # Word index (as a string) -> 32-bit word; bit n of word w is day 32*w + n of the year
+    marked = DictField()
+    present = DictField()
+    
+    # Running totals for the whole year
+    marked_days = IntField(default=0)
+    present_days = IntField(default=0)
+    
+    updated_at = DateTimeField(default=datetime.now)
+    
+    meta = {
+        'collection': 'attendance_bitmaps',
+        'indexes': [
+            {'fields': ['person_type', 'person', 'academic_year'], 'unique': True},
+            ('person_type', 'academic_year'),
+        ]
+    }
+    
+    def __str__(self):
+        return f"{self.person_id} {self.academic_year}: {self.present_days}/{self.marked_days} days present"
+
+
+class AttendanceDailyRollup(Document):
+    """Marked/present/absent counts for one day, person type and semester (see attendance.rollups)"""
+    
+    date = DateField(required=True)
+    person_type = StringField(choices=['student', 'teacher'], required=True)
+    semester = IntField()  # None for teachers
+    
+    marked = IntField(default=0)
+    present = IntField(default=0)
+    absent = IntField(default=0)
+    
+    updated_at = DateTimeField(default=datetime.now)
+    
+    meta = {
+        'collection': 'attendance_daily_rollups',
+        'indexes': [
+            {'fields': ['date', 'person_type', 'semester'], 'unique': True},
+        ]
+    }
+    
+    def __str__(self):
+        return f"{self.date} {self.person_type} sem {self.semester}: {self.present}/{self.marked} present"
+
+
+class AttendanceSummaryBuild(Document):
+    """Records that a summary collection has been fully built from daily_attendance (see attendance.bitmaps)"""
+    
+    name = StringField(max_length=50, required=True, unique=True)
+    built_at = DateTimeField(default=datetime.now)
+    
+    meta = {
+        'collection': 'attendance_summary_builds',
+    }
+    
+    def __str__(self):
+        return f"{self.name} built {self.built_at}"
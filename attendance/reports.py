@@ -0,0 +1,100 @@
+"""
+Per-person attendance reports.
+
+A report is one $group pipeline over daily_attendance keyed on the
+denormalised person_id/person_name fields, so no Student or Teacher
+document is loaded or dereferenced. Sorting and pagination run in the
+database; exports iterate the same pipeline's cursor row by row.
+"""
+
+import datetime
+
+# Sort option -> field of the grouped rows
+REPORT_SORTS = {
+    'percentage': 'percentage',
+    'name': 'name',
+    'id': '_id',
+    'present': 'present',
+    'absent': 'absent',
+    'total': 'total',
+}
+DEFAULT_SORT = 'percentage'
+
+EXPORT_COLUMNS = [
+    ('id', 'ID'),
+    ('name', 'Name'),
+    ('present', 'Present'),
+    ('absent', 'Absent'),
+    ('total', 'Total'),
+    ('percentage', 'Attendance %'),
+]
+
+
+def person_report_pipeline(person_type, start, end, semester=None, sort=DEFAULT_SORT, descending=True):
+    """Aggregation over daily_attendance: one sorted row per person with present/absent/total/percentage"""
+    match = {
+        'date': {
+            '$gte': datetime.datetime.combine(start, datetime.time.min),
+            '$lte': datetime.datetime.combine(end, datetime.time.min),
+        },
+        'person_type': person_type,
+    }
+    if semester is not None:
+        match['semester'] = semester
+
+    direction = -1 if descending else 1
+    order = {REPORT_SORTS.get(sort, REPORT_SORTS[DEFAULT_SORT]): direction}
+    order.setdefault('_id', 1)  # Stable order across pages
+
+    return [
+        {'$match': match},
+        # Date order (served by the (date, person_type) index) makes $last the newest record
+        {'$sort': {'date': 1}},
+        {'$group': {
+            '_id': '$person_id',
+            'name': {'$last': '$person_name'},  # The newest name: people can be renamed
+            'present': {'$sum': {'$cond': ['$is_present', 1, 0]}},
+            'total': {'$sum': 1},
+        }},
+        {'$addFields': {
+            'absent': {'$subtract': ['$total', '$present']},
+            # Rounded per row in _row(); sorting on the exact ratio keeps near-ties in order
+            'percentage': {'$multiply': [{'$divide': ['$present', '$total']}, 100]},
+        }},
+        {'$sort': order},
+    ]
+
+
+def _row(doc):
+    return {
+        'id': doc['_id'],
+        'name': doc.get('name') or '',
+        'present': doc['present'],
+        'absent': doc['absent'],
+        'total': doc['total'],
+        'percentage': round(doc['percentage'], 1),
+    }
+
+
+def person_report_page(person_type, start, end, semester=None, sort=DEFAULT_SORT, descending=True,
+                       page=1, page_size=50):
+    """One page of the report as (rows, total number of people)"""
+    from .models import DailyAttendance
+
+    pipeline = person_report_pipeline(person_type, start, end, semester, sort, descending)
+    pipeline.append({'$facet': {
+        'total': [{'$count': 'count'}],
+        'rows': [{'$skip': (page - 1) * page_size}, {'$limit': page_size}],
+    }})
+    result = next(iter(DailyAttendance.objects.aggregate(pipeline, allowDiskUse=True)), None) or {}
+    total = (result.get('total') or [{'count': 0}])[0]['count']
+    return [_row(doc) for doc in result.get('rows', [])], total
+
+
+def iter_person_report(person_type, start, end, semester=None, sort=DEFAULT_SORT, descending=True):
+    """Every row of the report, yielded as the cursor returns them"""
+    from .models import DailyAttendance
+
+    pipeline = person_report_pipeline(person_type, start, end, semester, sort, descending)
+    for doc in DailyAttendance.objects.aggregate(pipeline, allowDiskUse=True):
+        yield _row(doc)
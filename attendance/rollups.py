@@ -0,0 +1,187 @@
+"""
+Daily attendance rollups.
+
+AttendanceDailyRollup keeps marked/present/absent counts per day, person
+type and semester (None for teachers). Marking code turns every change
+into $inc deltas against the previous state of the record - a first
+mark, a present/absent flip, or a move between semesters - so the
+dashboard and report totals read a handful of small documents instead of
+the day's attendance records.
+
+The rollups only start counting once rebuild_attendance_rollups has built
+them from daily_attendance (after backfilling the semester of records
+marked before rollups existed); it is a required step when deploying
+them, after dedupe_attendance. Until then marking leaves the empty
+collection alone and totals are counted from daily_attendance directly.
+"""
+
+import datetime
+
+from pymongo import ReplaceOne, UpdateMany, UpdateOne
+
+
+def rollup_deltas(person_type, date, semester, is_present, previous=None):
+    """
+    {(date, person_type, semester): {'marked', 'present', 'absent'}} deltas
+    for one mark. ``previous`` is the record being replaced (with
+    is_present and semester), or None for a first mark.
+    """
+    deltas = {}
+
+    def add(bucket_semester, present, sign):
+        counts = deltas.setdefault((date, person_type, bucket_semester), {'marked': 0, 'present': 0, 'absent': 0})
+        counts['marked'] += sign
+        counts['present' if present else 'absent'] += sign
+
+    if previous is not None:
+        add(previous.get('semester'), previous.get('is_present', False), -1)
+    add(semester, is_present, 1)
+    return {key: counts for key, counts in deltas.items() if any(counts.values())}
+
+
+def merge_deltas(total, deltas):
+    """Add one mark's deltas into a running {key: counts} dict"""
+    for key, counts in deltas.items():
+        bucket = total.setdefault(key, {'marked': 0, 'present': 0, 'absent': 0})
+        for field, value in counts.items():
+            bucket[field] += value
+    return total
+
+
+def rollup_updates(deltas, now=None):
+    """$inc upserts applying merged deltas, one per (date, person type, semester)"""
+    now = now or datetime.datetime.now()
+    operations = []
+    for (date, person_type, semester), counts in deltas.items():
+        if not any(counts.values()):
+            continue
+        operations.append(UpdateOne(
+            {'date': datetime.datetime.combine(date, datetime.time.min),
+             'person_type': person_type, 'semester': semester},
+            {'$inc': counts, '$set': {'updated_at': now}},
+            upsert=True,
+        ))
+    return operations
+
+
+def rollups_built():
+    """True once rebuild_rollups has run (the rollup collection is never empty after that)"""
+    from .models import AttendanceDailyRollup
+
+    return AttendanceDailyRollup._get_collection().find_one({}, {'_id': 1}) is not None
+
+
+def update_rollups(deltas):
+    """Apply merged deltas in one bulk write (skipped until the rollups have been built)"""
+    from .marking import write_upserts
+    from .models import AttendanceDailyRollup
+
+    operations = rollup_updates(deltas)
+    if operations and rollups_built():
+        write_upserts(AttendanceDailyRollup._get_collection(), operations)
+
+
+def totals_pipeline(start, end, person_type=None, semester=None, from_rollups=True):
+    """
+    $group pipeline summing marked/present/absent per person type over
+    start..end, run over the rollups or, with from_rollups=False, over the
+    daily_attendance records themselves (both store date, person_type and
+    semester under the same names).
+    """
+    match = {'date': {
+        '$gte': datetime.datetime.combine(start, datetime.time.min),
+        '$lte': datetime.datetime.combine(end, datetime.time.min),
+    }}
+    if person_type:
+        match['person_type'] = person_type
+    if semester is not None:
+        match['semester'] = semester
+
+    if from_rollups:
+        counts = {'marked': {'$sum': '$marked'}, 'present': {'$sum': '$present'}, 'absent': {'$sum': '$absent'}}
+    else:
+        counts = {
+            'marked': {'$sum': 1},
+            'present': {'$sum': {'$cond': ['$is_present', 1, 0]}},
+            'absent': {'$sum': {'$cond': ['$is_present', 0, 1]}},
+        }
+    return [{'$match': match}, {'$group': dict(counts, _id='$person_type')}]
+
+
+def rollup_totals(start, end, person_type=None, semester=None):
+    """
+    Summed counts for start..end (inclusive), as {person_type: {'marked',
+    'present', 'absent'}}; optionally narrowed to one type and semester.
+    Read from the daily rollups, or from daily_attendance until they have
+    been built.
+    """
+    from .models import AttendanceDailyRollup, DailyAttendance
+
+    from_rollups = rollups_built()
+    source = AttendanceDailyRollup if from_rollups else DailyAttendance
+    return {
+        row['_id']: {'marked': row['marked'], 'present': row['present'], 'absent': row['absent']}
+        for row in source.objects.aggregate(totals_pipeline(start, end, person_type, semester, from_rollups))
+    }
+
+
+def backfill_semesters():
+    """
+    Give student records marked before rollups existed the semester their
+    student is in now (the best record available); returns how many were
+    updated. Their rollup buckets and semester-filtered totals need it.
+    """
+    from students.models import Student
+    from .models import DailyAttendance
+
+    collection = DailyAttendance._get_collection()
+    missing = {'person_type': 'student', 'semester': None}
+    student_ids = collection.distinct('student', missing)
+    if not student_ids:
+        return 0
+
+    operations = [
+        UpdateMany(dict(missing, student=row['_id']), {'$set': {'semester': row['current_semester']}})
+        for row in Student.objects.filter(id__in=student_ids).only('id', 'current_semester').as_pymongo()
+        if row.get('current_semester') is not None
+    ]
+    if not operations:
+        return 0
+    return collection.bulk_write(operations, ordered=False).modified_count
+
+
+def rebuild_rollups():
+    """
+    Recompute every rollup from daily_attendance; returns how many were
+    written. With no attendance at all, an empty rollup for today is kept
+    so the rollups count as built and marking starts updating them.
+    """
+    from .models import AttendanceDailyRollup, DailyAttendance
+
+    started = datetime.datetime.now()
+    rows = DailyAttendance.objects.aggregate([
+        {'$group': {
+            '_id': {'date': '$date', 'person_type': '$person_type', 'semester': {'$ifNull': ['$semester', None]}},
+            'marked': {'$sum': 1},
+            'present': {'$sum': {'$cond': ['$is_present', 1, 0]}},
+        }},
+    ])
+    operations = [
+        ReplaceOne(
+            dict(row['_id']),
+            dict(row['_id'], marked=row['marked'], present=row['present'],
+                 absent=row['marked'] - row['present'], updated_at=started),
+            upsert=True,
+        )
+        for row in rows
+    ]
+    if not operations:
+        today = {'date': datetime.datetime.combine(started.date(), datetime.time.min),
+                 'person_type': 'student', 'semester': None}
+        operations.append(ReplaceOne(
+            today, dict(today, marked=0, present=0, absent=0, updated_at=started), upsert=True,
+        ))
+    collection = AttendanceDailyRollup._get_collection()
+    collection.bulk_write(operations, ordered=False)
+    collection.delete_many({'updated_at': {'$lt': started}})
+    return len(operations)
@@ -5,7 +5,20 @@ Tests: view access control, URL resolution, role-based permissions.
 from django.test import TestCase
 from django.urls import reverse
 from accounts.models import User
-from test_helpers import SafeClient as Client
+from test_helpers import DereferenceError, SafeClient as Client, forbid_dereferences, mongomock_database
+from attendance.marking import _attendance_document, _key, check_mark, pick_attendance_record, write_records
+from attendance.bitmaps import (
+    academic_year, bitmap_update, build_bitmap_documents, count_bits, day_index, heatmap, range_stats, streaks
+)
+from attendance.reports import person_report_pipeline
+from attendance.rollups import merge_deltas, rollup_deltas, rollup_updates, totals_pipeline
+from bson import ObjectId
+from students.feature_extraction import attendance_by_student
+from types import SimpleNamespace
+from pymongo import UpdateOne
+import datetime
+import json
+import mongomock
 
 
 class AttendanceURLResolutionTest(TestCase):
@@ -181,6 +194,18 @@ class QuickMarkAttendanceSecurityTest(TestCase):
         )
         self.assertEqual(response.status_code, 302)  # Redirects to login
 
+    def test_bulk_mark_requires_login(self):
+        response = self.client.post(
+            reverse('attendance:bulk-mark'),
+            data='{"date":"2025-01-01","attendance":{"STU001":true}}',
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 302)  # Redirects to login
+
+    def test_report_export_requires_login(self):
+        response = self.client.get(reverse('attendance:reports-export'))
+        self.assertEqual(response.status_code, 302)  # Redirects to login
+
     def test_approve_requires_login(self):
         """Bug fix: Previously had no @login_required"""
         response = self.client.post(
@@ -188,3 +213,480 @@ class QuickMarkAttendanceSecurityTest(TestCase):
             {'attendance_id': 'fake', 'action': 'approve'}
         )
         self.assertEqual(response.status_code, 302)  # Redirects to login
+
+
+class BulkMarkValidationTest(TestCase):
+    """Test that the bulk endpoint only accepts JSON booleans as marks"""
+
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(email='admin@test.com', password='pass123', role='admin', is_staff=True)
+        self.client.login(email='admin@test.com', password='pass123')
+
+    def post(self, attendance):
+        return self.client.post(
+            reverse('attendance:bulk-mark'),
+            data=json.dumps({'date': '2025-01-06', 'attendance': attendance}),
+            content_type='application/json'
+        )
+
+    def test_non_boolean_marks_are_rejected(self):
+        for value in ['false', '0', 0, 1, None]:
+            response = self.post({'STU001': True, 'STU002': value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn('STU002', response.json()['error'])
+
+    def test_marking_engine_refuses_coercion(self):
+        with self.assertRaises(ValueError):
+            check_mark('false')
+        self.assertIs(check_mark(False), False)
+
+
+class BulkAttendanceMarkingTest(TestCase):
+    """Test the documents and keys written by the bulk marking engine"""
+
+    def setUp(self):
+        self.student = {'_id': ObjectId(), 'student_id': 'STU001', 'first_name': 'Asha', 'last_name': 'Rai'}
+
+    def test_document_denormalises_person_without_dereferencing(self):
+        marker = ObjectId()
+        doc = _attendance_document('student', self.student, datetime.date(2025, 1, 6), True, marker, 'late')
+        self.assertEqual(doc['student'], self.student['_id'])
+        self.assertEqual(doc['date'], datetime.datetime(2025, 1, 6))
+        self.assertEqual(doc['person_type'], 'student')
+        self.assertEqual(doc['person_id'], 'STU001')
+        self.assertEqual(doc['person_name'], 'Asha Rai')
+        self.assertEqual(doc['marked_by'], marker)
+        self.assertEqual(doc['notes'], 'late')
+
+    def test_upserts_keyed_on_person_and_day(self):
+        doc = _attendance_document('student', self.student, datetime.date(2025, 1, 6), False)
+        self.assertEqual(_key(doc, 'student'), {'student': self.student['_id'], 'date': datetime.datetime(2025, 1, 6)})
+        self.assertNotIn('marked_by', doc)
+
+    def test_document_loads_as_model(self):
+        from attendance.models import DailyAttendance
+        doc = _attendance_document('student', self.student, datetime.date(2025, 1, 6), True)
+        record = DailyAttendance._from_son(doc)
+        record.validate()
+        self.assertTrue(record.is_present)
+
+    def test_dedupe_keeps_the_most_recently_marked_record(self):
+        kept_id, duplicate_ids = pick_attendance_record([
+            {'_id': ObjectId(), 'marked_at': datetime.datetime(2025, 1, 6, 9, 0)},
+            {'_id': 'latest', 'marked_at': datetime.datetime(2025, 1, 6, 15, 30)},
+            {'_id': ObjectId(), 'marked_at': None},
+        ])
+        self.assertEqual(kept_id, 'latest')
+        self.assertEqual(len(duplicate_ids), 2)
+
+    def test_one_record_per_person_per_day_enforced_by_index(self):
+        from attendance.models import DailyAttendance
+        unique = {
+            tuple(spec['fields']): spec['partialFilterExpression']
+            for spec in DailyAttendance._meta['index_specs'] if spec.get('unique')
+        }
+        self.assertEqual(unique[(('student', 1), ('date', 1))], {'person_type': 'student'})
+        self.assertEqual(unique[(('teacher', 1), ('date', 1))], {'person_type': 'teacher'})
+
+
+class DereferenceGuardTest(TestCase):
+    """Test forbid_dereferences() and the reference-free reads it guards"""
+
+    def setUp(self):
+        from attendance.models import DailyAttendance
+        self.student_id = ObjectId()
+        person = {'_id': self.student_id, 'student_id': 'STU001', 'first_name': 'Asha', 'last_name': 'Rai'}
+        self.document = _attendance_document('student', person, datetime.date(2025, 1, 6), True)
+        self.record = DailyAttendance._from_son(self.document)
+
+    def test_reference_access_is_refused(self):
+        with self.assertRaises(DereferenceError):
+            with forbid_dereferences():
+                self.record.student
+
+    def test_swallowed_dereference_still_fails_the_block(self):
+        with self.assertRaises(DereferenceError):
+            with forbid_dereferences():
+                try:
+                    self.record.student
+                except Exception:
+                    pass  # Views report errors as messages instead of raising
+
+    def test_denormalised_fields_read_without_dereferencing(self):
+        with forbid_dereferences() as dereferenced:
+            self.assertEqual(self.record.person_id, 'STU001')
+            self.assertTrue(self.record.is_present)
+        self.assertEqual(dereferenced, [])
+
+    def test_no_dereference_records_keep_the_reference_id(self):
+        from attendance.models import DailyAttendance
+        record = DailyAttendance._from_son(self.document, _auto_dereference=False)
+        with forbid_dereferences():
+            self.assertEqual(record.student.id, self.student_id)
+
+
+class AttendanceReadPathTest(TestCase):
+    """Render the attendance pages over seeded records with dereferencing forbidden"""
+
+    def setUp(self):
+        from attendance.models import DailyAttendance
+        from courses.models import Teacher
+        from students.models import Student
+
+        self.db = self.enterContext(mongomock_database())
+        self.client = Client()
+        User.objects.create_user(email='admin@test.com', password='pass123', role='admin', is_staff=True)
+        self.client.login(email='admin@test.com', password='pass123')
+
+        self.today = datetime.date.today()
+        students = []
+        for n, name in enumerate(['Asha', 'Bikram', 'Chandra']):
+            student = Student(
+                student_id=f'STU00{n}', first_name=name, last_name='Rai', email=f'{name.lower()}@example.com',
+                program='BCA', current_semester=1, admission_date=datetime.date(2024, 7, 1), roll_number=str(n + 1),
+            )
+            student.save()
+            students.append(student)
+        teacher = Teacher(
+            teacher_id='TCH001', first_name='Dipa', last_name='Shah', email='dipa@example.com',
+            department='Computing', designation='Lecturer',
+        )
+        teacher.save()
+
+        documents = [
+            _attendance_document('student', student.to_mongo(), self.today, n != 1)
+            for n, student in enumerate(students)
+        ]
+        documents.append(_attendance_document('teacher', teacher.to_mongo(), self.today, True))
+        DailyAttendance._get_collection().insert_many(documents)
+
+    def get(self, name, **params):
+        with forbid_dereferences():
+            response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([str(message) for message in response.context['messages']], [])
+        return response.context
+
+    def test_mark_students_page_lists_the_section(self):
+        context = self.get('attendance:mark-students', semester=1, date=self.today.isoformat())
+        self.assertEqual(
+            [(row['student'].student_id, row['current_status']) for row in context['student_list']],
+            [('STU000', True), ('STU001', False), ('STU002', True)],
+        )
+        self.assertEqual((context['present_students'], context['absent_students']), (2, 1))
+
+    def test_dashboard_counts_today(self):
+        context = self.get('attendance:dashboard')
+        self.assertEqual(context['total_students'], 3)
+        self.assertEqual((context['students_present_today'], context['students_absent_today']), (2, 1))
+        self.assertEqual(context['teachers_present_today'], 1)
+
+    def test_reports_list_every_person(self):
+        context = self.get('attendance:reports', type='student', date_from=self.today.isoformat(),
+                           date_to=self.today.isoformat(), sort='name', order='asc')
+        self.assertEqual(context['total_records'], 3)
+        self.assertEqual(context['total_people'], 3)
+        self.assertEqual(len(context['person_list']), 3)
+
+
+class AttendanceBitmapTest(TestCase):
+    """Test the per-year attendance bitsets and the statistics read from them"""
+
+    def setUp(self):
+        self.student = ObjectId()
+        # Mon 6 Jan - Fri 10 Jan 2025: P P A P P, then Mon 13 Jan: P
+        days = {6: True, 7: True, 8: False, 9: True, 10: True, 13: True}
+        records = [
+            {'person_type': 'student', 'student': self.student, 'person_id': 'STU001',
+             'date': datetime.datetime(2025, 1, day), 'is_present': present}
+            for day, present in days.items()
+        ]
+        documents = build_bitmap_documents(records)
+        self.assertEqual(len(documents), 1)
+        self.bitmap = documents[0]
+        self.bitmaps = {self.bitmap['academic_year']: self.bitmap}
+
+    def test_academic_year_starts_in_july(self):
+        self.assertEqual(academic_year(datetime.date(2025, 6, 30)), 2024)
+        self.assertEqual(academic_year(datetime.date(2025, 7, 1)), 2025)
+        self.assertEqual(day_index(datetime.date(2025, 7, 1)), 0)
+        self.assertEqual(day_index(datetime.date(2025, 6, 30)), 364)
+
+    def test_count_bits_across_word_boundaries(self):
+        words = {'0': 1 << 31, '1': 0b11, '2': 1}
+        self.assertEqual(count_bits(words, 0, 95), 4)
+        self.assertEqual(count_bits(words, 31, 32), 2)
+        self.assertEqual(count_bits(words, 33, 63), 1)
+
+    def test_running_totals(self):
+        self.assertEqual(self.bitmap['marked_days'], 6)
+        self.assertEqual(self.bitmap['present_days'], 5)
+
+    def test_range_stats(self):
+        stats = range_stats('student', self.student, datetime.date(2025, 1, 7), datetime.date(2025, 1, 10),
+                            self.bitmaps)
+        self.assertEqual(stats, {'total_days': 4, 'present_days': 3, 'absent_days': 1,
+                                 'attendance_percentage': 75.0})
+
+    def test_streaks_skip_unmarked_days(self):
+        result = streaks('student', self.student, datetime.date(2025, 1, 1), datetime.date(2025, 1, 31),
+                         self.bitmaps)
+        self.assertEqual(result, {'current': 3, 'longest': 3})
+
+    def test_heatmap(self):
+        days = heatmap('student', self.student, datetime.date(2025, 1, 7), datetime.date(2025, 1, 11),
+                       self.bitmaps)
+        self.assertEqual([day['status'] for day in days], ['present', 'absent', 'present', 'present', None])
+        self.assertEqual(days[0]['date'], '2025-01-07')
+
+    def test_update_sets_bits_and_adjusts_totals_from_previous_state(self):
+        date = datetime.date(2025, 7, 2)  # day 1 of the 2025 academic year
+        now = datetime.datetime(2025, 7, 2, 9, 0)
+        key = {'person_type': 'student', 'person': self.student, 'academic_year': 2025}
+        stamp = {'person_id': 'STU001', 'updated_at': now}
+
+        flip = bitmap_update('student', self.student, 'STU001', date, False, was_present=True, now=now)
+        self.assertEqual(flip, UpdateOne(key, {
+            '$bit': {'marked.0': {'or': 0b10}, 'present.0': {'and': 0xFFFFFFFD}},
+            '$inc': {'marked_days': 0, 'present_days': -1},
+            '$set': stamp,
+        }, upsert=True))
+
+        first_mark = bitmap_update('student', self.student, 'STU001', date, True, now=now)
+        self.assertEqual(first_mark, UpdateOne(key, {
+            '$bit': {'marked.0': {'or': 0b10}, 'present.0': {'or': 0b10}},
+            '$inc': {'marked_days': 1, 'present_days': 1},
+            '$set': stamp,
+        }, upsert=True))
+
+
+class AttendanceRollupTest(TestCase):
+    """Test the $inc deltas that keep the daily rollups in step with marks"""
+
+    def setUp(self):
+        self.day = datetime.date(2025, 1, 6)
+
+    def test_first_mark_counts_once(self):
+        self.assertEqual(rollup_deltas('student', self.day, 3, True), {
+            (self.day, 'student', 3): {'marked': 1, 'present': 1, 'absent': 0},
+        })
+
+    def test_flip_moves_between_present_and_absent(self):
+        deltas = rollup_deltas('student', self.day, 3, False, {'is_present': True, 'semester': 3})
+        self.assertEqual(deltas, {(self.day, 'student', 3): {'marked': 0, 'present': -1, 'absent': 1}})
+
+    def test_unchanged_mark_produces_no_update(self):
+        deltas = rollup_deltas('student', self.day, 3, True, {'is_present': True, 'semester': 3})
+        self.assertEqual(deltas, {})
+        self.assertEqual(rollup_updates(deltas), [])
+
+    def test_semester_change_moves_the_count(self):
+        deltas = rollup_deltas('student', self.day, 4, True, {'is_present': True, 'semester': 3})
+        self.assertEqual(deltas, {
+            (self.day, 'student', 3): {'marked': -1, 'present': -1, 'absent': 0},
+            (self.day, 'student', 4): {'marked': 1, 'present': 1, 'absent': 0},
+        })
+
+    def test_sheet_merges_into_one_update_per_bucket(self):
+        total = {}
+        merge_deltas(total, rollup_deltas('student', self.day, 3, True))
+        merge_deltas(total, rollup_deltas('student', self.day, 3, False))
+        merge_deltas(total, rollup_deltas('student', self.day, 3, True, {'is_present': False, 'semester': 3}))
+        self.assertEqual(total, {(self.day, 'student', 3): {'marked': 2, 'present': 2, 'absent': 0}})
+
+        collection = mongomock.MongoClient().db.attendance_daily_rollups
+        collection.bulk_write(rollup_updates(total), ordered=False)
+        rollup = collection.find_one({}, {'_id': 0, 'updated_at': 0})
+        self.assertEqual(rollup, {
+            'date': datetime.datetime(2025, 1, 6), 'person_type': 'student', 'semester': 3,
+            'marked': 2, 'present': 2, 'absent': 0,
+        })
+
+    def test_totals_from_daily_attendance_before_rollups_are_built(self):
+        records = mongomock.MongoClient().db.daily_attendance
+        records.insert_many([
+            {'date': datetime.datetime(2025, 1, 6), 'person_type': 'student', 'semester': 3, 'is_present': True},
+            {'date': datetime.datetime(2025, 1, 6), 'person_type': 'student', 'semester': 3, 'is_present': False},
+            {'date': datetime.datetime(2025, 1, 6), 'person_type': 'student', 'semester': 4, 'is_present': True},
+            {'date': datetime.datetime(2025, 1, 6), 'person_type': 'teacher', 'is_present': True},
+            {'date': datetime.datetime(2025, 1, 7), 'person_type': 'student', 'semester': 3, 'is_present': True},
+        ])
+        pipeline = totals_pipeline(self.day, self.day, 'student', 3, from_rollups=False)
+        rows = list(records.aggregate(pipeline))
+        self.assertEqual(rows, [{'_id': 'student', 'marked': 2, 'present': 1, 'absent': 1}])
+        everyone = {row['_id']: row['marked'] for row in records.aggregate(
+            totals_pipeline(self.day, self.day, from_rollups=False)
+        )}
+        self.assertEqual(everyone, {'student': 3, 'teacher': 1})
+
+
+class AttendanceWriteTest(TestCase):
+    """Test that marks are written with the before-image of the record they replace"""
+
+    def setUp(self):
+        self.records = mongomock.MongoClient().db.daily_attendance
+        self.records.create_index([('student', 1), ('date', 1)], unique=True)
+        self.day = datetime.date(2025, 1, 6)
+        self.students = [
+            {'_id': ObjectId(), 'student_id': f'STU00{n}', 'first_name': 'S', 'last_name': str(n),
+             'current_semester': 3}
+            for n in range(2)
+        ]
+
+    def documents(self, *marks, semester=3):
+        return [
+            _attendance_document('student', dict(student, current_semester=semester), self.day, mark)
+            for student, mark in zip(self.students, marks)
+        ]
+
+    def test_first_marks_have_no_previous_record(self):
+        self.assertEqual(write_records(self.records, self.documents(True, False), 'student'), [None, None])
+        self.assertEqual(self.records.count_documents({}), 2)
+
+    def test_re_marks_return_the_replaced_record(self):
+        write_records(self.records, self.documents(True, False), 'student')
+        previous = write_records(self.records, self.documents(False, False, semester=4), 'student')
+        self.assertEqual(previous, [{'is_present': True, 'semester': 3}, {'is_present': False, 'semester': 3}])
+        self.assertEqual(self.records.count_documents({}), 2)
+        self.assertEqual(self.records.find_one({'student': self.students[0]['_id']})['is_present'], False)
+
+    def test_re_marking_a_sheet_is_one_read_and_one_bulk_write(self):
+        write_records(self.records, self.documents(True, False), 'student')
+        collection = CountingCollection(self.records)
+        documents = self.documents(False, True)
+        write_records(collection, documents, 'student')
+        self.assertEqual(collection.calls, ['find', 'bulk_write'])
+        stored = {record['_id'] for record in self.records.find()}
+        self.assertEqual({document['_id'] for document in documents}, stored)
+
+    def test_mark_changed_after_the_read_is_redone_against_the_new_state(self):
+        write_records(self.records, self.documents(True, True), 'student')
+        student = self.students[0]['_id']
+
+        def concurrent_absent():
+            self.records.update_one({'student': student}, {'$set': {'is_present': False}})
+
+        collection = CountingCollection(self.records, after_find=concurrent_absent)
+        previous = write_records(collection, self.documents(True, True), 'student')
+        # The other writer's absent mark is what this sheet replaced
+        self.assertEqual(previous, [{'is_present': False, 'semester': 3}, {'is_present': True, 'semester': 3}])
+        self.assertEqual(collection.calls, ['find', 'bulk_write', 'find_one_and_replace'])
+        self.assertEqual(self.records.find_one({'student': student})['is_present'], True)
+
+    def test_record_created_after_the_read_is_replaced_not_duplicated(self):
+        [first] = self.documents(True)
+
+        def concurrent_first_mark():
+            self.records.insert_one(dict(first))
+
+        collection = CountingCollection(self.records, after_find=concurrent_first_mark)
+        previous = write_records(collection, self.documents(False), 'student')
+        self.assertEqual(previous, [{'is_present': True, 'semester': 3}])
+        self.assertEqual(self.records.count_documents({}), 1)
+        self.assertEqual(self.records.find_one()['is_present'], False)
+
+
+class CountingCollection:
+    """Collection wrapper recording the calls made, optionally running a concurrent write after find()"""
+
+    def __init__(self, collection, after_find=None):
+        self.collection = collection
+        self.after_find = after_find
+        self.calls = []
+
+    def __getattr__(self, name):
+        self.calls.append(name)
+        return getattr(self.collection, name)
+
+    def find(self, *args, **kwargs):
+        self.calls.append('find')
+        records = list(self.collection.find(*args, **kwargs))
+        if self.after_find:
+            self.after_find()
+        return records
+
+
+class AttendanceBitmapBuildTest(TestCase):
+    """Test that statistics come from daily_attendance until the bitmaps have been rebuilt"""
+
+    def setUp(self):
+        from attendance.models import AttendanceBitmap, DailyAttendance
+
+        self.enterContext(mongomock_database())
+        self.student = SimpleNamespace(id=ObjectId())
+        person = {'_id': self.student.id, 'student_id': 'STU001', 'first_name': 'Asha', 'last_name': 'Rai'}
+        today = datetime.date.today()
+        DailyAttendance._get_collection().insert_many([
+            _attendance_document('student', person, today - datetime.timedelta(days=days), days != 2)
+            for days in range(1, 5)
+        ])
+        # Written by marking since deploy: holds only today's mark
+        AttendanceBitmap._get_collection().insert_one({
+            'person_type': 'student', 'person': self.student.id, 'academic_year': academic_year(today),
+            'marked': {str(day_index(today) // 32): 1 << day_index(today) % 32},
+            'present': {str(day_index(today) // 32): 1 << day_index(today) % 32},
+            'marked_days': 1, 'present_days': 1,
+        })
+
+    def stats(self):
+        from attendance.models import DailyAttendance
+        stats = DailyAttendance.get_student_attendance_stats(self.student, days=30)
+        return stats['total_days'], stats['present_days']
+
+    def test_partial_bitmaps_are_ignored_until_rebuilt(self):
+        from attendance.bitmaps import bitmaps_built, rebuild_bitmaps
+
+        self.assertFalse(bitmaps_built())
+        self.assertEqual(self.stats(), (4, 3))
+        rebuild_bitmaps()
+        self.assertTrue(bitmaps_built())
+        self.assertEqual(self.stats(), (4, 3))
+        self.assertEqual(attendance_by_student([self.student.id]), {self.student.id: (4, 3)})
+
+    def test_features_count_daily_attendance_until_rebuilt(self):
+        self.assertEqual(attendance_by_student([self.student.id]), {self.student.id: (4, 3)})
+
+
+class AttendanceReportPipelineTest(TestCase):
+    """Test the single-pipeline per-person attendance report"""
+
+    def test_groups_on_denormalised_person_fields(self):
+        records = mongomock.MongoClient().db.daily_attendance
+        person = {'_id': ObjectId(), 'student_id': 'STU001', 'first_name': 'Asha', 'last_name': 'Rai'}
+        renamed = dict(person, last_name='Shah')
+        # Newest record inserted first: the name must come from the latest date, not insertion order
+        records.insert_many([
+            _attendance_document('student', renamed, datetime.date(2025, 1, 20), True),
+            _attendance_document('student', person, datetime.date(2025, 1, 6), False),
+            _attendance_document('student', person, datetime.date(2025, 1, 7), True),
+            _attendance_document('student', person, datetime.date(2025, 2, 3), True),
+        ])
+        pipeline = person_report_pipeline('student', datetime.date(2025, 1, 1), datetime.date(2025, 1, 31))
+        [row] = records.aggregate(pipeline)
+        self.assertAlmostEqual(row.pop('percentage'), 200 / 3)
+        self.assertEqual(row, {'_id': 'STU001', 'name': 'Asha Shah', 'present': 2, 'absent': 1, 'total': 3})
+
+    def test_sorts_in_database_with_stable_tie_break(self):
+        pipeline = person_report_pipeline('student', datetime.date(2025, 1, 1), datetime.date(2025, 1, 31),
+                                          sort='name', descending=False)
+        self.assertEqual(list(pipeline[-1]['$sort'].items()), [('name', 1), ('_id', 1)])
+        default = person_report_pipeline('teacher', datetime.date(2025, 1, 1), datetime.date(2025, 1, 31),
+                                          sort='bogus')
+        self.assertEqual(list(default[-1]['$sort'].items()), [('percentage', -1), ('_id', 1)])
+
+    def test_semester_filter(self):
+        pipeline = person_report_pipeline('student', datetime.date(2025, 1, 1), datetime.date(2025, 3, 31),
+                                          semester=4)
+        self.assertEqual(pipeline[0]['$match']['semester'], 4)
+
+    def test_report_filters(self):
+        from attendance.views import _report_filters
+        person_type, start, end, semester, sort, descending = _report_filters({
+            'type': 'student', 'date_from': '2025-01-01', 'date_to': '2025-01-31',
+            'semester': '3', 'sort': 'name', 'order': 'asc',
+        })
+        self.assertEqual((person_type, start, end), ('student', datetime.date(2025, 1, 1), datetime.date(2025, 1, 31)))
+        self.assertEqual((semester, sort, descending), (3, 'name', False))
+        # Semesters only apply to students
+        self.assertIsNone(_report_filters({'type': 'teacher', 'semester': '3'})[3])
@@ -17,10 +17,13 @@ urlpatterns = [
     
     # Student View
     path('student/', views.StudentAttendanceView.as_view(), name='student-view'),
+    path('student/<str:student_id>/calendar/', views.student_attendance_calendar, name='student-calendar'),
     
     # Reports
     path('reports/', views.AttendanceReportsView.as_view(), name='reports'),
+    path('reports/export/', views.export_attendance_report, name='reports-export'),
     
     # AJAX Endpoints
     path('quick-mark/', views.quick_mark_attendance, name='quick-mark'),
+    path('bulk-mark/', views.bulk_mark_attendance, name='bulk-mark'),
 ]
\ No newline at end of file
@@ -5,10 +5,15 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.views.generic import TemplateView
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from datetime import datetime, timedelta
+import csv
 import json
 
+from .bitmaps import academic_year, heatmap, load_bitmaps, range_stats, streaks, year_end, year_start
+from .marking import mark_students
+from .reports import DEFAULT_SORT, EXPORT_COLUMNS, REPORT_SORTS, iter_person_report, person_report_page
+from .rollups import rollup_totals
 from .models import DailyAttendance
 from courses.models import Teacher
 from students.models import Student
@@ -32,30 +37,21 @@ class AttendanceDashboardView(LoginRequiredMixin, TemplateView):
             # Get today's date
             today = datetime.now().date()
             
-            # Get all students and teachers
-            all_students = Student.objects.all()
-            all_teachers = Teacher.objects.all()
-            
-            # Get today's attendance records
-            today_student_attendance = {}
-            today_teacher_attendance = {}
-            
-            for record in DailyAttendance.objects.filter(date=today):
-                if record.student:
-                    today_student_attendance[record.student.student_id] = record.is_present
-                elif record.teacher:
-                    today_teacher_attendance[record.teacher.teacher_id] = record.is_present
+            # Today's counts come from the daily rollups: a few small documents
+            today_counts = rollup_totals(today, today)
+            students_today = today_counts.get('student', {'marked': 0, 'present': 0})
+            teachers_today = today_counts.get('teacher', {'marked': 0, 'present': 0})
             
             # Calculate statistics
-            total_students = all_students.count()
-            total_teachers = all_teachers.count()
+            total_students = Student.objects.count()
+            total_teachers = Teacher.objects.count()
             
-            students_present_today = sum(1 for present in today_student_attendance.values() if present)
-            students_marked_today = len(today_student_attendance)
+            students_present_today = students_today['present']
+            students_marked_today = students_today['marked']
             students_not_marked = total_students - students_marked_today
             
-            teachers_present_today = sum(1 for present in today_teacher_attendance.values() if present)
-            teachers_marked_today = len(today_teacher_attendance)
+            teachers_present_today = teachers_today['present']
+            teachers_marked_today = teachers_today['marked']
             teachers_not_marked = total_teachers - teachers_marked_today
             
             context.update({
@@ -66,7 +62,6 @@ class AttendanceDashboardView(LoginRequiredMixin, TemplateView):
                 'students_absent_today': students_marked_today - students_present_today,
                 'students_not_marked': students_not_marked,
                 'student_attendance_percentage': round((students_present_today / students_marked_today * 100), 1) if students_marked_today > 0 else 0,
-                'today_student_attendance': today_student_attendance,
                 'teachers_present_today': teachers_present_today,
                 'teachers_absent_today': teachers_marked_today - teachers_present_today,
                 'teachers_not_marked': teachers_not_marked,
@@ -105,7 +100,7 @@ class TeacherSelfAttendanceView(LoginRequiredMixin, TemplateView):
             existing_attendance = DailyAttendance.objects.filter(
                 teacher=teacher,
                 date=selected_date
-            ).first()
+            ).only('is_present', 'status', 'notes', 'admin_notes').first()
             
             context.update({
                 'is_teacher_self_marking': True,
@@ -196,20 +191,28 @@ class MarkTeacherAttendanceView(LoginRequiredMixin, TemplateView):
             if status_filter != 'all':
                 query['status'] = status_filter
             
-            # Get attendance records
-            attendance_records = DailyAttendance.objects.filter(**query).order_by('-date', 'teacher__first_name')
+            # Get attendance records; record.teacher stays a DBRef so no
+            # teacher is loaded per row
+            attendance_records = list(DailyAttendance.objects.filter(**query).only(
+                'teacher', 'date', 'is_present', 'notes', 'status'
+            ).order_by('-date', 'person_name').no_dereference())
+            
+            # Load every teacher on the page with one query
+            teachers = Teacher.objects.in_bulk(list({
+                record.teacher.id for record in attendance_records if record.teacher
+            }))
             
             # Group records by teacher
             teacher_attendance_data = {}
             for record in attendance_records:
-                if record.teacher:
-                    teacher_id = record.teacher.teacher_id
-                    if teacher_id not in teacher_attendance_data:
-                        teacher_attendance_data[teacher_id] = {
-                            'teacher': record.teacher,
+                teacher = teachers.get(record.teacher.id) if record.teacher else None
+                if teacher:
+                    if teacher.teacher_id not in teacher_attendance_data:
+                        teacher_attendance_data[teacher.teacher_id] = {
+                            'teacher': teacher,
                             'records': []
                         }
-                    teacher_attendance_data[teacher_id]['records'].append(record)
+                    teacher_attendance_data[teacher.teacher_id]['records'].append(record)
             
             # Get pending counts for dashboard
             pending_count = DailyAttendance.objects.filter(
@@ -298,18 +301,18 @@ class MarkStudentAttendanceView(LoginRequiredMixin, TemplateView):
             students_in_semester = Student.objects.filter(
                 current_semester=selected_semester,
                 is_active=True
-            ).order_by('student_id')
+            ).only('student_id', 'first_name', 'last_name', 'current_semester').order_by('roll_sort_key', 'student_id')
             
             # Get existing attendance for the selected date
-            existing_attendance = {}
-            attendance_records = DailyAttendance.objects.filter(
-                date=datetime.strptime(selected_date, '%Y-%m-%d').date(),
-                person_type='student'
-            )
-            
-            for record in attendance_records:
-                if record.student:
-                    existing_attendance[record.student.student_id] = record.is_present
+            # (keyed on the denormalised person_id; no student is loaded)
+            existing_attendance = {
+                record['person_id']: record.get('is_present', False)
+                for record in DailyAttendance.objects.filter(
+                    date=datetime.strptime(selected_date, '%Y-%m-%d').date(),
+                    person_type='student'
+                ).only('person_id', 'is_present').as_pymongo()
+                if record.get('person_id')
+            }
             
             # Prepare student list with attendance status
             student_data = []
@@ -349,36 +352,16 @@ class MarkStudentAttendanceView(LoginRequiredMixin, TemplateView):
             attendance_date = datetime.strptime(request.POST.get('attendance_date'), '%Y-%m-%d').date()
             selected_semester = int(request.POST.get('semester', 1))
             
-            present_count = 0
-            absent_count = 0
-            
             # Get marker (teacher if role is teacher)
             marker = Teacher.objects.filter(email=request.user.email).first() if request.user.role == 'teacher' else None
             
-            # Process attendance data
-            for key, value in request.POST.items():
-                if key.startswith('attendance_'):
-                    student_id = key.replace('attendance_', '')
-                    is_present = value == 'present'
-                    
-                    try:
-                        student = Student.objects.get(student_id=student_id)
-                        
-                        # Mark attendance for this student
-                        DailyAttendance.mark_student_attendance(
-                            student=student,
-                            date=attendance_date,
-                            is_present=is_present,
-                            marked_by=marker
-                        )
-                        
-                        if is_present:
-                            present_count += 1
-                        else:
-                            absent_count += 1
-                            
-                    except Student.DoesNotExist:
-                        continue
+            # Whole sheet in one student lookup and one bulk write
+            marks = {
+                key.replace('attendance_', '', 1): value == 'present'
+                for key, value in request.POST.items() if key.startswith('attendance_')
+            }
+            result = mark_students(attendance_date, marks, marked_by=marker)
+            present_count, absent_count = result['present'], result['absent']
             
             messages.success(request, f'Student attendance marked successfully! Present: {present_count}, Absent: {absent_count}')
             return redirect(f'{request.path}?semester={selected_semester}&date={attendance_date.strftime("%Y-%m-%d")}')
@@ -411,7 +394,7 @@ class StudentAttendanceView(LoginRequiredMixin, TemplateView):
                 student=student,
                 date__gte=start_date,
                 date__lte=end_date
-            ).order_by('-date')
+            ).only('date', 'is_present', 'notes').order_by('-date')
             
             # Calculate statistics
             stats = DailyAttendance.get_student_attendance_stats(student, days=30)
@@ -437,9 +420,35 @@ class StudentAttendanceView(LoginRequiredMixin, TemplateView):
 # REPORTS AND AJAX
 # ============================================================================
 
+def _report_filters(params):
+    """Parse the report filters shared by the reports page and its export"""
+    person_type = params.get('type', 'student')
+    if person_type not in ('student', 'teacher'):
+        person_type = 'student'
+    date_from_str = params.get('date_from', '')
+    date_to_str = params.get('date_to', '')
+    
+    # Set default date range (last 30 days)
+    if not date_from_str or not date_to_str:
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=30)
+    else:
+        start_date = datetime.strptime(date_from_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(date_to_str, '%Y-%m-%d').date()
+    
+    semester = params.get('semester', '')
+    semester = int(semester) if person_type == 'student' and semester.isdigit() else None
+    sort = params.get('sort', DEFAULT_SORT)
+    if sort not in REPORT_SORTS:
+        sort = DEFAULT_SORT
+    descending = params.get('order', 'desc') != 'asc'
+    return person_type, start_date, end_date, semester, sort, descending
+
+
 class AttendanceReportsView(LoginRequiredMixin, TemplateView):
     """Generate attendance reports"""
     template_name = 'attendance/reports.html'
+    paginate_by = 50
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -448,90 +457,50 @@ class AttendanceReportsView(LoginRequiredMixin, TemplateView):
             messages.error(self.request, 'Access denied!')
             return context
         
-        # Get filter parameters
         person_type = self.request.GET.get('type', 'student')
-        date_from_str = self.request.GET.get('date_from', '')
-        date_to_str = self.request.GET.get('date_to', '')
-        
-        # Set default date range (last 30 days)
-        if not date_from_str or not date_to_str:
-            end_date = datetime.now().date()
-            start_date = end_date - timedelta(days=30)
-        else:
-            start_date = datetime.strptime(date_from_str, '%Y-%m-%d').date()
-            end_date = datetime.strptime(date_to_str, '%Y-%m-%d').date()
-        
         try:
-            # Get attendance records in date range
-            attendance_records = DailyAttendance.objects.filter(
-                date__gte=start_date,
-                date__lte=end_date,
-                person_type=person_type
-            )
-            
-            # Calculate summary statistics
-            total_records = attendance_records.count()
-            present_records = attendance_records.filter(is_present=True).count()
-            absent_records = total_records - present_records
+            person_type, start_date, end_date, semester, sort, descending = _report_filters(self.request.GET)
+            try:
+                page = max(int(self.request.GET.get('page', 1)), 1)
+            except ValueError:
+                page = 1
+            
+            # Summary statistics from the daily rollups
+            totals = rollup_totals(start_date, end_date, person_type, semester).get(person_type, {})
+            total_records = totals.get('marked', 0)
+            present_records = totals.get('present', 0)
+            absent_records = totals.get('absent', 0)
             overall_percentage = round((present_records / total_records * 100), 1) if total_records > 0 else 0
             
-            # Generate individual statistics
-            person_list = []
-            
-            if person_type == 'student':
-                # Get all students who have attendance records in this period
-                student_ids = set(r.student.id for r in attendance_records if r.student)
-                for student_id in student_ids:
-                    student = Student.objects.get(id=student_id)
-                    student_records = attendance_records.filter(student=student)
-                    
-                    present_days = student_records.filter(is_present=True).count()
-                    total_days = student_records.count()
-                    absent_days = total_days - present_days
-                    percentage = round((present_days / total_days * 100), 1) if total_days > 0 else 0
-                    
-                    person_list.append({
-                        'name': student.full_name,
-                        'id': student.student_id,
-                        'present': present_days,
-                        'absent': absent_days,
-                        'total': total_days,
-                        'percentage': percentage
-                    })
-            
-            elif person_type == 'teacher':
-                # Get all teachers who have attendance records in this period
-                teacher_ids = set(r.teacher.id for r in attendance_records if r.teacher)
-                for teacher_id in teacher_ids:
-                    teacher = Teacher.objects.get(id=teacher_id)
-                    teacher_records = attendance_records.filter(teacher=teacher)
-                    
-                    present_days = teacher_records.filter(is_present=True).count()
-                    total_days = teacher_records.count()
-                    absent_days = total_days - present_days
-                    percentage = round((present_days / total_days * 100), 1) if total_days > 0 else 0
-                    
-                    person_list.append({
-                        'name': teacher.full_name,
-                        'id': teacher.teacher_id,
-                        'present': present_days,
-                        'absent': absent_days,
-                        'total': total_days,
-                        'percentage': percentage
-                    })
-            
-            # Sort by percentage (highest first)
-            person_list.sort(key=lambda x: x['percentage'], reverse=True)
+            # Individual statistics: one $group pipeline, sorted and paged in the database
+            person_list, total_people = person_report_page(
+                person_type, start_date, end_date, semester, sort, descending,
+                page=page, page_size=self.paginate_by,
+            )
+            num_pages = max((total_people + self.paginate_by - 1) // self.paginate_by, 1)
+            query_params = self.request.GET.copy()
+            query_params.pop('page', None)
             
             context.update({
                 'person_type': person_type,
                 'date_from': start_date.strftime('%Y-%m-%d'),
                 'date_to': end_date.strftime('%Y-%m-%d'),
+                'semester_filter': semester,
+                'all_semesters': list(range(1, 9)),
+                'sort': sort,
+                'order': 'desc' if descending else 'asc',
                 'total_records': total_records,
                 'present_records': present_records,
                 'absent_records': absent_records,
                 'overall_percentage': overall_percentage,
                 'person_list': person_list,
+                'total_people': total_people,
+                'page_number': page,
+                'num_pages': num_pages,
+                'page_range': range(max(page - 2, 1), min(page + 2, num_pages) + 1),
+                'has_previous': page > 1,
+                'has_next': page < num_pages,
+                'page_query': query_params.urlencode(),
                 'date_range_display': f"{start_date.strftime('%B %d, %Y')} to {end_date.strftime('%B %d, %Y')}"
             })
                 
@@ -551,6 +520,114 @@ class AttendanceReportsView(LoginRequiredMixin, TemplateView):
         return context
 
 
+class _Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output"""
+    
+    def write(self, value):
+        return value
+
+
+@login_required
+def export_attendance_report(request):
+    """Stream the full report for the current filters as CSV, row by row from the aggregation cursor"""
+    if request.user.role not in ['admin', 'teacher']:
+        messages.error(request, 'Access denied!')
+        return redirect('attendance:dashboard')
+    try:
+        person_type, start_date, end_date, semester, sort, descending = _report_filters(request.GET)
+    except ValueError:
+        messages.error(request, 'Invalid report dates!')
+        return redirect('attendance:reports')
+    
+    writer = csv.writer(_Echo())
+    
+    def rows():
+        yield writer.writerow([label for _, label in EXPORT_COLUMNS])
+        for row in iter_person_report(person_type, start_date, end_date, semester, sort, descending):
+            yield writer.writerow([row[field] for field, _ in EXPORT_COLUMNS])
+    
+    filename = f"attendance_{person_type}s_{start_date:%Y%m%d}_{end_date:%Y%m%d}"
+    if semester is not None:
+        filename += f"_sem{semester}"
+    response = StreamingHttpResponse(rows(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+@login_required
+def student_attendance_calendar(request, student_id):
+    """
+    AJAX endpoint: a student's attendance for one academic year
+    (?year=<start year>, default current) as totals, streaks and a
+    day-by-day heatmap, all read from their attendance bitmap.
+    """
+    try:
+        if request.user.role == 'student':
+            student = Student.objects.only('id', 'student_id', 'first_name', 'last_name').get(email=request.user.email)
+            if student.student_id != student_id:
+                return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+        elif request.user.role in ['admin', 'teacher']:
+            student = Student.objects.only('id', 'student_id', 'first_name', 'last_name').get(student_id=student_id)
+        else:
+            return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+    except Student.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Student not found'}, status=404)
+    
+    try:
+        today = datetime.now().date()
+        year = int(request.GET.get('year', academic_year(today)))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'year must be an integer'}, status=400)
+    
+    try:
+        start_date, end_date = year_start(year), min(year_end(year), today)
+        if start_date > end_date:
+            return JsonResponse({'success': False, 'error': 'Academic year has not started'}, status=400)
+        bitmaps = load_bitmaps('student', student.id, start_date, end_date)
+        return JsonResponse({
+            'success': True,
+            'student_id': student.student_id,
+            'student_name': student.full_name,
+            'academic_year': year,
+            'stats': range_stats('student', student.id, start_date, end_date, bitmaps),
+            'streaks': streaks('student', student.id, start_date, end_date, bitmaps),
+            'heatmap': heatmap('student', student.id, start_date, end_date, bitmaps),
+        })
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@login_required
+def bulk_mark_attendance(request):
+    """
+    AJAX endpoint marking a whole class sheet at once.
+    Body: {"date": "YYYY-MM-DD", "attendance": {"<student_id>": true/false, ...}, "notes": ""}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+    if request.user.role not in ['admin', 'teacher']:
+        return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+    try:
+        data = json.loads(request.body)
+        attendance_date = datetime.strptime(data.get('date', ''), '%Y-%m-%d').date()
+        marks = data.get('attendance')
+        if not isinstance(marks, dict):
+            raise ValueError("'attendance' must map student ids to true/false")
+        # JSON strings like "false" or numbers like 0 would otherwise be stored as present
+        invalid = sorted(str(student_id) for student_id, value in marks.items() if not isinstance(value, bool))
+        if invalid:
+            raise ValueError(f"attendance marks must be true or false (check {', '.join(invalid[:5])})")
+    except (ValueError, TypeError) as e:
+        return JsonResponse({'success': False, 'error': f'Invalid data: {e}'}, status=400)
+    
+    try:
+        marker = Teacher.objects.filter(email=request.user.email).first() if request.user.role == 'teacher' else None
+        result = mark_students(attendance_date, marks, marked_by=marker, notes=data.get('notes', ''))
+        return JsonResponse(dict(result, success=True))
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
 @login_required
 def quick_mark_attendance(request):
     """AJAX endpoint for quick attendance marking"""
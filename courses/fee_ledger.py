@@ -0,0 +1,536 @@
+"""
+Fee ledger provisioning.
+
+Every student has one StudentFeeRecord per semester up to their current
+semester. Records are provisioned here - when a student is created or
+promoted, and by the provision_fee_records command for backfills - with
+bulk upserts keyed on (student, semester), so page views never have to
+create them and repeated provisioning is harmless. Duplicates left by the
+old create-on-view code are merged by the dedupe_fee_records command,
+which must run before the unique (student, semester) index is built.
+
+Individual payments are appended to the fee_payments collection, which
+backs the per-student payment history (keyset-paginated, newest first)
+and the daily collections rollup. A payment's ledger row is written after
+the balance update, so the update also queues the row on the fee record
+(pending_payments) under the payment's _id; the row is inserted with that
+_id and then dequeued. A row lost to a crash in between is replayed by
+the reconcile_fee_payments command, and replaying twice is harmless.
+"""
+
+import datetime
+import re
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+SEMESTER_FEE = 50000.0  # Rs.50,000 per semester
+MAX_SEMESTER = 8
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+
+def _new_record_fields(now):
+    """Fields of a freshly provisioned, unpaid fee record"""
+    return {
+        'total_fee': SEMESTER_FEE,
+        'paid_amount': 0.0,
+        'remaining_amount': SEMESTER_FEE,
+        'payment_status': 'pending',
+        'is_completed': False,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+def _ledger_operations(student_id, current_semester, now):
+    """Upserts that create any missing records for semesters 1..current_semester"""
+    return [
+        UpdateOne(
+            {'student': student_id, 'semester': semester},
+            {'$setOnInsert': _new_record_fields(now)},
+            upsert=True,
+        )
+        for semester in range(1, min(current_semester or 1, MAX_SEMESTER) + 1)
+    ]
+
+
+def provision_fee_records(students, batch_size=1000):
+    """
+    Create missing fee records for ``students`` - Student documents or
+    (student ObjectId, current_semester) pairs. Returns how many were created.
+    """
+    from .models import StudentFeeRecord
+
+    collection = StudentFeeRecord._get_collection()
+    now = datetime.datetime.now()
+    created = 0
+    operations = []
+    for student in students:
+        if isinstance(student, tuple):
+            student_id, current_semester = student
+        else:
+            student_id, current_semester = student.id, student.current_semester
+        operations.extend(_ledger_operations(student_id, current_semester, now))
+        if len(operations) >= batch_size:
+            created += collection.bulk_write(operations, ordered=False).upserted_count
+            operations = []
+    if operations:
+        created += collection.bulk_write(operations, ordered=False).upserted_count
+    return created
+
+
+def _balance_fields(paid_amount, total_fee):
+    """remaining_amount/payment_status/is_completed for a paid amount (StudentFeeRecord.save() rules)"""
+    if paid_amount == 0:
+        return {'remaining_amount': total_fee, 'payment_status': 'pending', 'is_completed': False}
+    if paid_amount >= total_fee:
+        return {'remaining_amount': 0.0, 'payment_status': 'paid', 'is_completed': True}
+    return {'remaining_amount': total_fee - paid_amount, 'payment_status': 'partial', 'is_completed': False}
+
+
+def merge_fee_records(records):
+    """
+    Merge duplicate raw fee records of one (student, semester) into the
+    oldest. Returns (kept _id, fields to $set on it, _ids to delete): paid
+    amounts are added up, the payment details come from the latest paid
+    record and notes are joined.
+    """
+    records = sorted(records, key=lambda record: (record.get('created_at') or datetime.datetime.min, record['_id']))
+    kept = records[0]
+    paid_amount = sum(record.get('paid_amount') or 0.0 for record in records)
+    fields = {'paid_amount': paid_amount}
+    fields.update(_balance_fields(paid_amount, kept.get('total_fee', SEMESTER_FEE)))
+
+    paid = [record for record in records if record.get('payment_date')]
+    if paid:
+        latest = max(paid, key=lambda record: record['payment_date'])
+        for field in ('payment_date', 'payment_method', 'receipt_number', 'bank_reference', 'recorded_by'):
+            if latest.get(field) is not None:
+                fields[field] = latest[field]
+
+    notes = []
+    for record in records:
+        if record.get('notes') and record['notes'] not in notes:
+            notes.append(record['notes'])
+    if notes:
+        fields['notes'] = '; '.join(notes)
+
+    pending = [entry for record in records for entry in record.get('pending_payments') or []]
+    if pending:
+        fields['pending_payments'] = pending
+
+    fields['updated_at'] = max(
+        (record['updated_at'] for record in records if record.get('updated_at')), default=datetime.datetime.now()
+    )
+    return kept['_id'], fields, [record['_id'] for record in records[1:]]
+
+
+class FeePaymentError(Exception):
+    """A payment that cannot be applied (already paid, exceeds the balance, ...)"""
+
+
+def _payment_update(amount, payment_method, notes, recorded_by_id, now, payment_id=None):
+    """
+    Update pipeline that adds ``amount`` to paid_amount and re-derives the
+    remaining balance and status from the new value, all in the same
+    atomic write (the same rules as StudentFeeRecord.save()). With a
+    ``payment_id``, the payment's ledger row is queued on the record too.
+    """
+    details = {
+        'payment_method': {'$literal': payment_method},
+        'notes': {'$literal': notes},
+        'payment_date': now,
+        'updated_at': now,
+    }
+    if recorded_by_id is not None:
+        details['recorded_by'] = recorded_by_id
+    queue = []
+    if payment_id is not None:
+        entry = {'_id': payment_id, 'amount': amount, 'payment_method': payment_method, 'notes': notes,
+                 'recorded_by': recorded_by_id, 'timestamp': now}
+        queue = [{'$set': {'pending_payments': {
+            '$concatArrays': [{'$ifNull': ['$pending_payments', []]}, {'$literal': [entry]}],
+        }}}]
+    return [
+        {'$set': dict(details, paid_amount={'$add': ['$paid_amount', amount]})},
+        {'$set': {
+            'remaining_amount': {'$subtract': ['$total_fee', '$paid_amount']},
+            'is_completed': {'$gte': ['$paid_amount', '$total_fee']},
+            'payment_status': {'$switch': {
+                'branches': [
+                    {'case': {'$lte': ['$paid_amount', 0]}, 'then': 'pending'},
+                    {'case': {'$gte': ['$paid_amount', '$total_fee']}, 'then': 'paid'},
+                ],
+                'default': 'partial',
+            }},
+        }},
+    ] + queue
+
+
+def _ledger_payment(record, entry):
+    """
+    FeePayment for a payment queued on ``record`` (its _id is the payment's).
+    The balance right after the payment is only known to the request that
+    made it; replayed rows leave it unset.
+    """
+    from .models import FeePayment
+
+    return FeePayment(
+        id=entry['_id'],
+        student=record['student'],
+        semester=record['semester'],
+        fee_record=record['_id'],
+        amount=entry['amount'],
+        payment_method=entry.get('payment_method'),
+        notes=entry.get('notes'),
+        paid_amount_after=entry.get('paid_amount_after'),
+        remaining_after=entry.get('remaining_after'),
+        recorded_by=entry.get('recorded_by'),
+        timestamp=entry['timestamp'],
+        date=entry['timestamp'].date(),
+    )
+
+
+def write_ledger_payment(record, entry):
+    """Insert a queued payment's ledger row (unless already there) and dequeue it from the fee record"""
+    from .models import FeePayment, StudentFeeRecord
+
+    try:
+        FeePayment._get_collection().insert_one(_ledger_payment(record, entry).to_mongo().to_dict())
+    except DuplicateKeyError:
+        pass  # Already written, by a retry or a reconcile run
+    StudentFeeRecord._get_collection().update_one(
+        {'_id': record['_id']}, {'$pull': {'pending_payments': {'_id': entry['_id']}}},
+    )
+
+
+def replay_pending_payments():
+    """Write the ledger rows of payments still queued on fee records; returns how many were replayed"""
+    from .models import StudentFeeRecord
+
+    replayed = 0
+    for record in StudentFeeRecord._get_collection().find(
+        {'pending_payments.0': {'$exists': True}}, {'student': 1, 'semester': 1, 'pending_payments': 1},
+    ):
+        for entry in record['pending_payments']:
+            write_ledger_payment(record, entry)
+            replayed += 1
+    return replayed
+
+
+def record_fee_payment(student_id, semester, amount, payment_method='cash', notes='', recorded_by_id=None):
+    """
+    Apply a payment to a student's semester fee record.
+
+    The balance check and the increment happen in one find_one_and_update
+    whose filter only matches while paid_amount + amount <= total_fee, so
+    concurrent cashiers cannot overpay a semester. The same write queues
+    the payment's ledger row, which is then appended to the fee_payments
+    collection. Returns the updated record as a raw document; raises
+    FeePaymentError when the payment is refused.
+    """
+    from .models import StudentFeeRecord
+
+    collection = StudentFeeRecord._get_collection()
+    key = {'student': student_id, 'semester': semester}
+    guarded = dict(key, **{'$expr': {'$lte': [{'$add': ['$paid_amount', amount]}, '$total_fee']}})
+    now = datetime.datetime.now()
+    payment_id = ObjectId()
+
+    for attempt in range(2):
+        record = collection.find_one_and_update(
+            guarded,
+            _payment_update(amount, payment_method, notes, recorded_by_id, now, payment_id),
+            return_document=ReturnDocument.AFTER,
+        )
+        if record is not None:
+            break
+
+        # Refused: find out why (only on this slow path)
+        current = collection.find_one(key, {'paid_amount': 1, 'total_fee': 1})
+        if current is None and attempt == 0:
+            # Semester not provisioned yet: create its record and try once more
+            try:
+                collection.update_one(key, {'$setOnInsert': _new_record_fields(now)}, upsert=True)
+            except DuplicateKeyError:
+                pass  # A concurrent payment created it
+            continue
+        if current is None:
+            raise FeePaymentError('Fee record not found')
+        remaining = current['total_fee'] - current['paid_amount']
+        if remaining <= 0:
+            raise FeePaymentError(
+                f"This semester is already fully paid (Rs.{current['paid_amount']:.2f}/Rs.{current['total_fee']:.2f})"
+            )
+        raise FeePaymentError(
+            f'Payment amount (Rs.{amount:.2f}) exceeds remaining balance (Rs.{remaining:.2f}). '
+            f'Please enter Rs.{remaining:.2f} or less.'
+        )
+
+    entry = next(entry for entry in record.pop('pending_payments') if entry['_id'] == payment_id)
+    entry.update(paid_amount_after=record['paid_amount'], remaining_after=record['remaining_amount'])
+    write_ledger_payment(record, entry)
+    return record
+
+
+def encode_payment_cursor(payment):
+    """Opaque keyset cursor ("<timestamp>_<id>") pointing just past ``payment``"""
+    return f"{payment['timestamp'].isoformat()}_{payment['_id']}"
+
+
+def decode_payment_cursor(cursor):
+    """Inverse of encode_payment_cursor; raises ValueError on a malformed cursor"""
+    timestamp, _, payment_id = cursor.rpartition('_')
+    try:
+        return datetime.datetime.fromisoformat(timestamp), ObjectId(payment_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+
+def payment_history_filter(student_id, before=None):
+    """
+    Filter for one student's payments older than the ``before`` cursor.
+    Together with the (timestamp, _id) descending sort it walks the
+    (student, -timestamp, -_id) index, so every page costs the same.
+    """
+    query = {'student': student_id}
+    if before:
+        timestamp, payment_id = decode_payment_cursor(before)
+        query['$or'] = [
+            {'timestamp': {'$lt': timestamp}},
+            {'timestamp': timestamp, '_id': {'$lt': payment_id}},
+        ]
+    return query
+
+
+def payment_history(student_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """
+    One page of a student's payments, newest first, as raw documents.
+    Returns (payments, next_cursor); next_cursor is None on the last page.
+    """
+    from .models import FeePayment
+
+    limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+    payments = list(
+        FeePayment._get_collection()
+        .find(payment_history_filter(student_id, before))
+        .sort([('timestamp', -1), ('_id', -1)])
+        .limit(limit + 1)
+    )
+    next_cursor = encode_payment_cursor(payments[limit - 1]) if len(payments) > limit else None
+    return payments[:limit], next_cursor
+
+
+def total_paid_by_student(student_id):
+    """Sum of all of a student's ledger payments"""
+    from .models import FeePayment
+
+    result = next(iter(FeePayment.objects.aggregate([
+        {'$match': {'student': student_id}},
+        {'$group': {'_id': None, 'total': {'$sum': '$amount'}}},
+    ])), None)
+    return result['total'] if result else 0.0
+
+
+def daily_collections_pipeline(start, end):
+    """
+    Aggregation over fee_payments: one row per calendar day in
+    [start, end] (datetime.date values) with the amount collected, the
+    number of payments and a per-method breakdown, newest day first.
+    """
+    return [
+        {'$match': {'date': {
+            '$gte': datetime.datetime.combine(start, datetime.time.min),
+            '$lte': datetime.datetime.combine(end, datetime.time.min),
+        }}},
+        {'$group': {
+            '_id': {'date': '$date', 'method': '$payment_method'},
+            'amount': {'$sum': '$amount'},
+            'payments': {'$sum': 1},
+        }},
+        {'$group': {
+            '_id': '$_id.date',
+            'amount': {'$sum': '$amount'},
+            'payments': {'$sum': '$payments'},
+            'methods': {'$push': {'method': '$_id.method', 'amount': '$amount', 'payments': '$payments'}},
+        }},
+        {'$sort': {'_id': -1}},
+    ]
+
+
+def daily_collections(start, end):
+    """Run daily_collections_pipeline; returns JSON-ready rows"""
+    from .models import FeePayment
+
+    return [
+        {
+            'date': row['_id'].date().isoformat(),
+            'amount': row['amount'],
+            'payments': row['payments'],
+            'methods': sorted(row['methods'], key=lambda method: -method['amount']),
+        }
+        for row in FeePayment.objects.aggregate(daily_collections_pipeline(start, end))
+    ]
+
+
+def fee_records_by_student(student_ids, max_semester=MAX_SEMESTER):
+    """
+    Read-only lookup for views: {student ObjectId: {semester: StudentFeeRecord}}
+    for all given students in a single query.
+    """
+    from .models import StudentFeeRecord
+
+    records = {}
+    for record in StudentFeeRecord.objects.filter(
+        student__in=list(student_ids), semester__lte=max_semester
+    ).no_dereference():
+        records.setdefault(record.student.id, {}).setdefault(record.semester, record)
+    return records
+
+
+def placeholder_fee_record(student, semester):
+    """Unsaved, unpaid record shown for a semester that has not been provisioned yet"""
+    from .models import StudentFeeRecord
+
+    return StudentFeeRecord(
+        student=student,
+        semester=semester,
+        total_fee=SEMESTER_FEE,
+        paid_amount=0.0,
+        remaining_amount=SEMESTER_FEE,
+    )
+
+
+def fee_overview_pipeline(search='', semester=None, status='', skip=0, limit=50):
+    """
+    Aggregation over students for the fee admin page.
+
+    Filters active students by search/semester first, so fee records are
+    only joined for matching students, each through the (student,
+    semester) index; then applies the status filter and returns one
+    document with a 'summary' (student count, expected and collected
+    revenue over all matches) and the requested 'page' of per-student rows.
+    Students without any fee records yet are included with nothing paid.
+    """
+    from .models import StudentFeeRecord
+
+    student_match = {'is_active': True}
+    if search:
+        # Substring match (as the page always offered): no index can serve an
+        # unanchored case-insensitive regex, so a search scans the active students
+        pattern = re.compile(re.escape(search.strip()), re.IGNORECASE)
+        student_match['$or'] = [
+            {'first_name': pattern},
+            {'last_name': pattern},
+            {'student_id': pattern},
+        ]
+    if semester:
+        student_match['current_semester'] = {'$gte': int(semester)}
+
+    pipeline = [
+        {'$match': student_match},
+        {'$addFields': {'max_semester': {'$min': ['$current_semester', MAX_SEMESTER]}}},
+        {'$lookup': {
+            'from': StudentFeeRecord._get_collection_name(),
+            'let': {'student': '$_id', 'max_semester': '$max_semester'},
+            'pipeline': [
+                {'$match': {'$expr': {'$and': [
+                    {'$eq': ['$student', '$$student']},
+                    {'$lte': ['$semester', '$$max_semester']},
+                ]}}},
+                {'$project': {
+                    '_id': 0,
+                    'semester': 1,
+                    'paid_amount': 1,
+                    'total_fee': 1,
+                    'is_completed': 1,
+                    'notes': 1,
+                }},
+            ],
+            'as': 'records',
+        }},
+        {'$addFields': {
+            'total_paid': {'$sum': '$records.paid_amount'},
+            'total_expected': {'$multiply': ['$max_semester', SEMESTER_FEE]},
+        }},
+    ]
+
+    if status == 'pending':
+        pipeline.append({'$match': {'$expr': {'$lt': ['$total_paid', '$total_expected']}}})
+    elif status == 'completed':
+        pipeline.append({'$match': {'$expr': {'$gte': ['$total_paid', '$total_expected']}}})
+
+    pipeline.append({'$facet': {
+        'summary': [{'$group': {
+            '_id': None,
+            'students': {'$sum': 1},
+            'expected': {'$sum': '$total_expected'},
+            'collected': {'$sum': '$total_paid'},
+        }}],
+        'page': [
+            {'$sort': {'student_id': 1}},
+            {'$skip': skip},
+            {'$limit': limit},
+            {'$project': {
+                '_id': 0,
+                'student_id': '$_id',
+                'student': {
+                    'student_id': '$student_id',
+                    'first_name': '$first_name',
+                    'last_name': '$last_name',
+                    'current_semester': '$current_semester',
+                },
+                'max_semester': 1,
+                'records': 1,
+                'total_paid': 1,
+                'total_expected': 1,
+            }},
+        ],
+    }})
+    return pipeline
+
+
+def fee_overview(search='', semester=None, status='', page=1, page_size=50):
+    """
+    Run fee_overview_pipeline and shape the result for the fee admin
+    template. Returns (rows, summary).
+    """
+    from students.models import Student
+
+    result = next(iter(Student.objects.aggregate(
+        fee_overview_pipeline(search, semester, status, (page - 1) * page_size, page_size)
+    )), None) or {}
+
+    summary = (result.get('summary') or [{}])[0]
+    summary = {
+        'students': summary.get('students', 0),
+        'expected': summary.get('expected', 0),
+        'collected': summary.get('collected', 0),
+    }
+
+    rows = []
+    for row in result.get('page', []):
+        student = row['student']
+        student['id'] = str(row['student_id'])
+        student['full_name'] = f"{student.get('first_name', '')} {student.get('last_name', '')}".strip()
+
+        by_semester = {}
+        for record in row['records']:
+            by_semester.setdefault(record['semester'], record)
+        fee_records = [
+            by_semester.get(sem) or {'semester': sem, 'paid_amount': 0.0, 'total_fee': SEMESTER_FEE,
+                                     'is_completed': False, 'notes': None}
+            for sem in range(1, int(row['max_semester']) + 1)
+        ]
+
+        total_expected = row['total_expected']
+        rows.append({
+            'student': student,
+            'fee_records': fee_records,
+            'total_paid': row['total_paid'],
+            'total_expected': total_expected,
+            'completion_percentage': round(row['total_paid'] / total_expected * 100, 1) if total_expected > 0 else 0,
+        })
+    return rows, summary
@@ -0,0 +1,74 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from courses.fee_ledger import replay_pending_payments
+from courses.models import FeePayment, StudentFeeRecord
+
+
+class Command(BaseCommand):
+    help = ('Add fee_payments ledger entries for amounts paid before the ledger existed, '
+            'so payment history and daily collections include them (safe to re-run)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Payments inserted per bulk write (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the fee records that need a ledger entry')
+
+    def handle(self, *args, **options):
+        # Queued payments have exact ledger rows; write those rather than guessing them below
+        if not options['dry_run']:
+            replay_pending_payments()
+
+        # Amount already in the ledger per (student, semester)
+        ledgered = {
+            (row['_id']['student'], row['_id']['semester']): row['amount']
+            for row in FeePayment.objects.aggregate([
+                {'$group': {'_id': {'student': '$student', 'semester': '$semester'},
+                            'amount': {'$sum': '$amount'}}},
+            ])
+        }
+
+        collection = FeePayment._get_collection()
+        payments = []
+        missing = inserted = 0
+        records = StudentFeeRecord._get_collection().find(
+            {'paid_amount': {'$gt': 0}},
+            {'student': 1, 'semester': 1, 'paid_amount': 1, 'remaining_amount': 1, 'payment_method': 1,
+             'notes': 1, 'recorded_by': 1, 'payment_date': 1, 'updated_at': 1},
+        )
+        for record in records:
+            amount = record['paid_amount'] - ledgered.get((record['student'], record['semester']), 0)
+            if amount <= 0:
+                continue
+            missing += 1
+            if options['dry_run']:
+                continue
+
+            timestamp = record.get('payment_date') or record.get('updated_at') or datetime.datetime.now()
+            payment = FeePayment(
+                student=record['student'],
+                semester=record['semester'],
+                fee_record=record['_id'],
+                amount=amount,
+                payment_method=record.get('payment_method'),
+                notes=record.get('notes') or 'Carried over from the fee record',
+                paid_amount_after=record['paid_amount'],
+                remaining_after=record.get('remaining_amount'),
+                recorded_by=record.get('recorded_by'),
+                timestamp=timestamp,
+                date=timestamp.date(),
+            )
+            payments.append(payment.to_mongo().to_dict())
+            if len(payments) >= options['batch_size']:
+                inserted += len(collection.insert_many(payments, ordered=False).inserted_ids)
+                payments = []
+
+        if payments:
+            inserted += len(collection.insert_many(payments, ordered=False).inserted_ids)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"{missing} fee records would get a ledger entry"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Added {inserted} ledger entries"))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from courses.fee_ledger import merge_fee_records
+from courses.models import FeePayment, StudentFeeRecord
+
+
+class Command(BaseCommand):
+    help = ('Merge duplicate fee records of the same student and semester (adding up paid amounts and '
+            'keeping their ledger entries), then build the StudentFeeRecord indexes. Run before deploying '
+            'the unique (student, semester) index; safe to re-run')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the duplicate records')
+
+    def handle(self, *args, **options):
+        # Raw collection: _get_collection() would try to build the unique index first and fail
+        records = StudentFeeRecord._get_db()[StudentFeeRecord._get_collection_name()]
+        payments = FeePayment._get_collection()
+
+        groups = records.aggregate([
+            {'$group': {
+                '_id': {'student': '$student', 'semester': '$semester'},
+                'ids': {'$push': '$_id'},
+                'count': {'$sum': 1},
+            }},
+            {'$match': {'count': {'$gt': 1}}},
+        ], allowDiskUse=True)
+
+        merged = removed = 0
+        for group in groups:
+            kept_id, fields, duplicate_ids = merge_fee_records(records.find({'_id': {'$in': group['ids']}}))
+            merged += 1
+            removed += len(duplicate_ids)
+            if options['dry_run']:
+                continue
+            records.update_one({'_id': kept_id}, {'$set': fields})
+            payments.update_many({'fee_record': {'$in': duplicate_ids}}, {'$set': {'fee_record': kept_id}})
+            records.delete_many({'_id': {'$in': duplicate_ids}})
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{removed} duplicate fee records would be merged into {merged} records"
+            ))
+            return
+
+        StudentFeeRecord.ensure_indexes()
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {removed} duplicate fee records into {merged} records; indexes are up to date"
+        ))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import TeacherSalaryRecord
+from courses.payroll import invalidate_payroll_period, pick_salary_record
+
+
+class Command(BaseCommand):
+    help = ('Remove duplicate salary records of the same teacher and month (keeping the paid one, or the '
+            'oldest), then build the TeacherSalaryRecord indexes. Run before deploying the unique '
+            '(teacher, month, year) index; safe to re-run')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the duplicate records')
+
+    def handle(self, *args, **options):
+        # Raw collection: _get_collection() would try to build the unique index first and fail
+        records = TeacherSalaryRecord._get_db()[TeacherSalaryRecord._get_collection_name()]
+
+        groups = records.aggregate([
+            {'$group': {
+                '_id': {'teacher': '$teacher', 'month': '$month', 'year': '$year'},
+                'ids': {'$push': '$_id'},
+                'count': {'$sum': 1},
+            }},
+            {'$match': {'count': {'$gt': 1}}},
+        ], allowDiskUse=True)
+
+        removed = 0
+        periods = set()
+        for group in groups:
+            _, duplicate_ids = pick_salary_record(records.find(
+                {'_id': {'$in': group['ids']}},
+                {'is_paid': 1, 'payment_status': 1, 'payment_date': 1, 'created_at': 1},
+            ))
+            removed += len(duplicate_ids)
+            periods.add((group['_id']['month'], group['_id']['year']))
+            if not options['dry_run']:
+                records.delete_many({'_id': {'$in': duplicate_ids}})
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"{removed} duplicate salary records would be removed"))
+            return
+
+        # Cached payroll summaries for those months counted the duplicates
+        for month, year in periods:
+            invalidate_payroll_period(month, year)
+        TeacherSalaryRecord.ensure_indexes()
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} duplicate salary records; indexes are up to date"
+        ))
@@ -0,0 +1,26 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.payroll import generate_salary_records
+
+
+class Command(BaseCommand):
+    help = 'Create the missing salary records for a month (intended for a month-start cron job; safe to re-run)'
+
+    def add_arguments(self, parser):
+        today = datetime.date.today()
+        parser.add_argument('--month', type=int, default=today.month,
+                            help='Month to generate (default: the current month)')
+        parser.add_argument('--year', type=int, default=today.year,
+                            help='Year to generate (default: the current year)')
+
+    def handle(self, *args, **options):
+        try:
+            counts = generate_salary_records(options['month'], options['year'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['created']} salary records for {options['month']}/{options['year']} "
+            f"({counts['skipped']} already existed)"
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from courses.fee_ledger import provision_fee_records
+from students.models import Student
+
+
+class Command(BaseCommand):
+    help = 'Create missing per-semester fee records for every student (safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Upserts sent per bulk write (default: 1000)')
+        parser.add_argument('--include-inactive', action='store_true',
+                            help='Also provision records for inactive students')
+
+    def handle(self, *args, **options):
+        students = Student.objects.all() if options['include_inactive'] else Student.objects.filter(is_active=True)
+        pairs = ((row['_id'], row.get('current_semester')) for row in
+                 students.only('id', 'current_semester').as_pymongo())
+
+        created = provision_fee_records(pairs, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} missing fee records"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from courses.fee_ledger import replay_pending_payments
+
+
+class Command(BaseCommand):
+    help = ('Write the fee_payments ledger rows of payments applied to a fee record but never logged '
+            '(e.g. after a crash between the two writes); safe to re-run')
+
+    def handle(self, *args, **options):
+        replayed = replay_pending_payments()
+        self.stdout.write(self.style.SUCCESS(f"Replayed {replayed} pending ledger entries"))
@@ -1,9 +1,10 @@
 # Complete updated courses/models.py
 
-from mongoengine import Document, StringField, EmailField, DateTimeField, ReferenceField, ListField, FloatField, IntField, BooleanField, DateField, FileField
+from mongoengine import Document, StringField, EmailField, DateTimeField, ReferenceField, ListField, FloatField, IntField, BooleanField, DateField, FileField, DictField
 from accounts.models import UserProfile
 from django.core.exceptions import ValidationError
 from mongoengine import Q
+from mongoengine.queryset import QuerySet
 from students.models import Student
 import datetime
 
@@ -65,7 +66,20 @@ class Teacher(Document):
     
     def save(self, *args, **kwargs):
         self.updated_at = datetime.datetime.now()
-        return super().save(*args, **kwargs)
+        regrouped = self.pk is not None and 'department' in (self._get_changed_fields() or [])
+        result = super().save(*args, **kwargs)
+        if regrouped:
+            # Payroll reports group this teacher's past months by department
+            from .payroll import invalidate_payroll_periods
+            invalidate_payroll_periods({'teacher': self.pk})
+        return result
+    
+    def delete(self, *args, **kwargs):
+        """Delete the teacher; payroll reports then count their months as Unassigned"""
+        from .payroll import invalidate_payroll_periods
+        result = super().delete(*args, **kwargs)
+        invalidate_payroll_periods({'teacher': self.pk})
+        return result
     
     def get_assigned_subjects(self):
         """Get BCASubject objects assigned to this teacher"""
@@ -399,13 +413,24 @@ class StudentFeeRecord(Document):
     recorded_by = ReferenceField('accounts.UserProfile')  # Admin who recorded payment
     notes = StringField()
     
+    # Ledger rows of applied payments not yet written to fee_payments (see courses.fee_ledger)
+    pending_payments = ListField(DictField())
+    
     # Timestamps
     created_at = DateTimeField(default=datetime.datetime.now)
     updated_at = DateTimeField(default=datetime.datetime.now)
     
     meta = {
         'collection': 'student_fee_records',
-        'indexes': ['student', 'semester', 'payment_status', 'created_at']
+        'indexes': [
+            # One record per student per semester; also serves the atomic payment update.
+            # mongoengine builds it on first use, which fails while duplicates exist:
+            # run manage.py dedupe_fee_records before deploying.
+            {'fields': ['student', 'semester'], 'unique': True},
+            'semester',
+            'payment_status',
+            'created_at'
+        ]
     }
     
     def save(self, *args, **kwargs):
@@ -438,6 +463,55 @@ class StudentFeeRecord(Document):
         return 0
 
 
+class FeePayment(Document):
+    """Append-only log of fee payments; one document per payment, never updated"""
+    
+    student = ReferenceField('students.Student', required=True)
+    semester = IntField(min_value=1, max_value=8, required=True)
+    fee_record = ReferenceField(StudentFeeRecord)
+    
+    amount = FloatField(required=True)
+    payment_method = StringField(choices=StudentFeeRecord.PAYMENT_METHODS)
+    notes = StringField()
+    
+    # Fee record state right after this payment
+    paid_amount_after = FloatField()
+    remaining_after = FloatField()
+    
+    recorded_by = ReferenceField('accounts.UserProfile')
+    timestamp = DateTimeField(default=datetime.datetime.now)
+    date = DateField()  # Calendar day of timestamp, for the daily collections rollup
+    
+    meta = {
+        'collection': 'fee_payments',
+        'indexes': [
+            # Newest-first history per student, keyset-paginated on (timestamp, _id)
+            ('student', '-timestamp', '-id'),
+            'date',
+        ]
+    }
+    
+    def save(self, *args, **kwargs):
+        if self.timestamp and not self.date:
+            self.date = self.timestamp.date()
+        return super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"Rs.{self.amount} for semester {self.semester} on {self.timestamp:%Y-%m-%d}"
+
+
+class SalaryRecordQuerySet(QuerySet):
+    """Marks the cached payroll summaries of deleted records' months stale (document deletes come here too)"""
+    
+    def delete(self, *args, **kwargs):
+        from .payroll import invalidate_payroll_period
+        periods = {(record['month'], record['year']) for record in self.clone().only('month', 'year').as_pymongo()}
+        result = super().delete(*args, **kwargs)
+        for month, year in periods:
+            invalidate_payroll_period(month, year)
+        return result
+
+
 class TeacherSalaryRecord(Document):
     """Track teacher monthly salary payments"""
     
@@ -483,8 +557,14 @@ class TeacherSalaryRecord(Document):
     
     meta = {
         'collection': 'teacher_salary_records',
-        'indexes': ['teacher', 'month', 'year', 'payment_status', 'created_at'],
-        'unique_together': [('teacher', 'month', 'year')]  # One record per teacher per month
+        'queryset_class': SalaryRecordQuerySet,
+        'indexes': [
+            # One record per teacher per month; also serves per-teacher lookups.
+            # mongoengine builds it on first use, which fails while duplicates exist:
+            # run manage.py dedupe_salary_records before deploying.
+            {'fields': ['teacher', 'month', 'year'], 'unique': True},
+            'month', 'year', 'payment_status', 'created_at',
+        ]
     }
     
     def save(self, *args, **kwargs):
@@ -499,7 +579,12 @@ class TeacherSalaryRecord(Document):
         else:
             self.is_paid = False
         
-        return super().save(*args, **kwargs)
+        result = super().save(*args, **kwargs)
+        
+        # Payroll reports for this month must be recomputed
+        from .payroll import invalidate_payroll_period
+        invalidate_payroll_period(self.month, self.year)
+        return result
     
     def __str__(self):
         return f"{self.teacher.full_name} - {self.month}/{self.year} - Rs.{self.net_salary}"
@@ -514,25 +599,39 @@ class TeacherSalaryRecord(Document):
     
     @classmethod
     def generate_monthly_records(cls, month, year):
-        """Generate monthly salary records for all active teachers"""
-        active_teachers = Teacher.objects.filter(is_active=True)
-        created_count = 0
-        
-        for teacher in active_teachers:
-            # Check if record already exists
-            existing = cls.objects.filter(teacher=teacher, month=month, year=year).first()
-            if not existing and teacher.salary:
-                salary_record = cls(
-                    teacher=teacher,
-                    month=month,
-                    year=year,
-                    base_salary=teacher.salary,
-                    net_salary=teacher.salary
-                )
-                salary_record.save()
-                created_count += 1
-        
-        return created_count
+        """Generate monthly salary records for all active teachers; returns how many were created"""
+        from .payroll import generate_salary_records
+        return generate_salary_records(month, year)['created']
+
+
+class PayrollPeriodSummary(Document):
+    """
+    Cached payroll totals for one month, maintained by courses.payroll.
+    Any change to a salary record in the month bumps ``version`` and marks
+    the summary stale; it is recomputed by aggregation on the next read.
+    """
+    
+    year = IntField(required=True)
+    month = IntField(min_value=1, max_value=12, required=True)
+    version = IntField(default=0)
+    is_current = BooleanField(default=False)
+    
+    expense = FloatField(default=0.0)
+    paid = FloatField(default=0.0)
+    teachers = IntField(default=0)
+    paid_teachers = IntField(default=0)
+    # [{'department', 'expense', 'paid', 'teachers', 'paid_teachers'}]
+    departments = ListField(DictField())
+    
+    computed_at = DateTimeField()
+    
+    meta = {
+        'collection': 'payroll_period_summaries',
+        'indexes': [{'fields': ['year', 'month'], 'unique': True}]
+    }
+    
+    def __str__(self):
+        return f"Payroll {self.month}/{self.year}: Rs.{self.paid} of Rs.{self.expense}"
 
 
 # Pre-populate BCA subjects from your textbook
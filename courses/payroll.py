@@ -0,0 +1,318 @@
+"""
+Teacher payroll generation.
+
+Every active teacher with a salary gets one TeacherSalaryRecord per month.
+Month-end generation finds the teachers still missing a record for the
+month with a single aggregation and inserts them with one unordered bulk
+insert; the unique (teacher, month, year) index makes concurrent or
+repeated runs harmless, since duplicates are rejected by the database and
+counted as skipped. Generation runs from the "generate" endpoint or the
+generate_salary_records command, never on page views. Duplicates created
+before the index existed are removed by the dedupe_salary_records command,
+which must run before the index is built.
+
+Payroll reports are built from per-month summaries (PayrollPeriodSummary)
+computed with one $group aggregation over the salary records. Summaries
+are cached in MongoDB so every web worker shares them. Anything that
+changes a month's totals bumps its version - saving or deleting a salary
+record, generating records, and changing or deleting a teacher (whose
+department groups their past months) - and a summary computed against an
+older version is never stored.
+"""
+
+import calendar
+import datetime
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+DUPLICATE_KEY = 11000
+MAX_REPORT_MONTHS = 120
+UNASSIGNED_DEPARTMENT = 'Unassigned'
+
+
+def missing_salary_records_pipeline(month, year):
+    """
+    Aggregation over teachers: active salaried teachers without a salary
+    record for month/year, as {_id, salary} documents.
+    """
+    from .models import TeacherSalaryRecord
+
+    return [
+        {'$match': {'is_active': True, 'salary': {'$gt': 0}}},
+        {'$lookup': {
+            'from': TeacherSalaryRecord._get_collection_name(),
+            'let': {'teacher': '$_id'},
+            'pipeline': [
+                {'$match': {'month': month, 'year': year, '$expr': {'$eq': ['$teacher', '$$teacher']}}},
+                {'$project': {'_id': 1}},
+                {'$limit': 1},
+            ],
+            'as': 'existing',
+        }},
+        {'$facet': {
+            'missing': [
+                {'$match': {'existing': {'$size': 0}}},
+                {'$project': {'salary': 1}},
+            ],
+            'existing': [
+                {'$match': {'existing': {'$ne': []}}},
+                {'$count': 'count'},
+            ],
+        }},
+    ]
+
+
+def _new_salary_record(teacher_id, salary, month, year, now):
+    """Raw document for a pending salary record (mirrors TeacherSalaryRecord.save())"""
+    return {
+        'teacher': teacher_id,
+        'month': month,
+        'year': year,
+        'base_salary': salary,
+        'bonus': 0.0,
+        'deductions': 0.0,
+        'net_salary': salary,
+        'payment_status': 'pending',
+        'is_paid': False,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+def generate_salary_records(month, year):
+    """
+    Create the missing salary records for month/year.
+
+    Returns {'created': n, 'skipped': n}; skipped counts teachers that
+    already had a record, including ones created concurrently by another
+    request while this one was running.
+    """
+    from .models import Teacher, TeacherSalaryRecord
+
+    # Raw inserts bypass field validation, so check the period here
+    if not 1 <= month <= 12:
+        raise ValueError(f'Invalid month: {month}')
+
+    result = next(iter(Teacher.objects.aggregate(missing_salary_records_pipeline(month, year))), None) or {}
+    missing = result.get('missing', [])
+    skipped = (result.get('existing') or [{'count': 0}])[0]['count']
+    if not missing:
+        return {'created': 0, 'skipped': skipped}
+
+    now = datetime.datetime.now()
+    documents = [_new_salary_record(row['_id'], row['salary'], month, year, now) for row in missing]
+    try:
+        created = len(TeacherSalaryRecord._get_collection().insert_many(documents, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(error.get('code') != DUPLICATE_KEY for error in errors):
+            raise
+        created = e.details.get('nInserted', 0)
+        skipped += len(errors)
+    finally:
+        # Also when the insert fails part-way: the records it did insert are in the month now
+        invalidate_payroll_period(month, year)
+    return {'created': created, 'skipped': skipped}
+
+
+def pick_salary_record(records):
+    """
+    Choose which of several raw salary records for one teacher and month
+    to keep: the most recently paid one, otherwise the oldest. Returns
+    (kept _id, _ids to delete).
+    """
+    records = list(records)
+    paid = [record for record in records if record.get('is_paid') or record.get('payment_status') == 'paid']
+    if paid:
+        kept = max(paid, key=lambda record: record.get('payment_date') or datetime.datetime.min)
+    else:
+        kept = min(records, key=lambda record: (record.get('created_at') or datetime.datetime.min, record['_id']))
+    return kept['_id'], [record['_id'] for record in records if record['_id'] != kept['_id']]
+
+
+# ----------------------------------------------------------------------
+# Reporting
+# ----------------------------------------------------------------------
+def invalidate_payroll_period(month, year):
+    """Mark the cached summary for month/year stale (called on every salary record change)"""
+    from .models import PayrollPeriodSummary
+
+    PayrollPeriodSummary._get_collection().update_one(
+        {'year': year, 'month': month},
+        {'$inc': {'version': 1}, '$set': {'is_current': False}},
+        upsert=True,
+    )
+
+
+def invalidate_payroll_periods(match):
+    """Mark stale every month that has salary records matching the raw ``match`` filter"""
+    from .models import TeacherSalaryRecord
+
+    periods = TeacherSalaryRecord._get_collection().aggregate([
+        {'$match': match},
+        {'$group': {'_id': {'month': '$month', 'year': '$year'}}},
+    ])
+    for period in periods:
+        invalidate_payroll_period(period['_id']['month'], period['_id']['year'])
+
+
+def report_periods(start, end):
+    """(year, month) pairs from ``start`` to ``end`` inclusive, both (year, month) pairs"""
+    if start > end:
+        raise ValueError('Report start must not be after its end')
+    periods = []
+    year, month = start
+    while (year, month) <= end:
+        periods.append((year, month))
+        if len(periods) > MAX_REPORT_MONTHS:
+            raise ValueError(f'Reports can cover at most {MAX_REPORT_MONTHS} months')
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return periods
+
+
+def payroll_totals_pipeline(periods):
+    """
+    Aggregation over teacher_salary_records: expense/paid totals and
+    teacher counts per (year, month, department) for the given periods.
+    """
+    from .models import Teacher
+
+    months_by_year = {}
+    for year, month in periods:
+        months_by_year.setdefault(year, []).append(month)
+
+    return [
+        {'$match': {'$or': [
+            {'year': year, 'month': {'$in': months}} for year, months in sorted(months_by_year.items())
+        ]}},
+        {'$lookup': {
+            'from': Teacher._get_collection_name(),
+            'localField': 'teacher',
+            'foreignField': '_id',
+            'as': 'teacher',
+        }},
+        {'$group': {
+            '_id': {
+                'year': '$year',
+                'month': '$month',
+                'department': {'$ifNull': [{'$arrayElemAt': ['$teacher.department', 0]}, UNASSIGNED_DEPARTMENT]},
+            },
+            'expense': {'$sum': '$net_salary'},
+            'paid': {'$sum': {'$cond': ['$is_paid', '$net_salary', 0]}},
+            'teachers': {'$sum': 1},
+            'paid_teachers': {'$sum': {'$cond': ['$is_paid', 1, 0]}},
+        }},
+    ]
+
+
+def _summarise(departments):
+    """Period totals from its per-department rows"""
+    return {
+        'expense': sum(row['expense'] for row in departments),
+        'paid': sum(row['paid'] for row in departments),
+        'teachers': sum(row['teachers'] for row in departments),
+        'paid_teachers': sum(row['paid_teachers'] for row in departments),
+        'departments': sorted(departments, key=lambda row: row['department']),
+    }
+
+
+def period_summaries(periods):
+    """
+    {(year, month): summary dict} for ``periods``, served from the cache
+    where current and recomputed in one aggregation where not.
+    """
+    from .models import PayrollPeriodSummary, TeacherSalaryRecord
+
+    collection = PayrollPeriodSummary._get_collection()
+    summaries = {}
+    versions = {}
+    cached = collection.find({'$or': [{'year': year, 'month': month} for year, month in periods]})
+    for doc in cached:
+        key = (doc['year'], doc['month'])
+        if doc.get('is_current'):
+            summaries[key] = doc
+        else:
+            versions[key] = doc.get('version', 0)
+
+    stale = [period for period in periods if period not in summaries]
+    if not stale:
+        return summaries
+
+    # Versions were read above, before aggregating: a record saved after
+    # that point bumps the version and the write below no longer matches
+    departments = {period: [] for period in stale}
+    for row in TeacherSalaryRecord.objects.aggregate(payroll_totals_pipeline(stale)):
+        key = (row['_id']['year'], row['_id']['month'])
+        departments[key].append({
+            'department': row['_id']['department'],
+            'expense': row['expense'],
+            'paid': row['paid'],
+            'teachers': row['teachers'],
+            'paid_teachers': row['paid_teachers'],
+        })
+
+    now = datetime.datetime.now()
+    for (year, month), rows in departments.items():
+        summary = dict(_summarise(rows), year=year, month=month, is_current=True, computed_at=now)
+        summaries[(year, month)] = summary
+        version = versions.get((year, month), 0)
+        try:
+            collection.update_one(
+                {'year': year, 'month': month, 'version': version},
+                {'$set': summary},
+                upsert=(year, month) not in versions,
+            )
+        except DuplicateKeyError:
+            pass  # Invalidated while computing; the next read recomputes it
+    return summaries
+
+
+def _with_percentage(row):
+    row['payment_percentage'] = round(row['paid'] / row['expense'] * 100, 1) if row['expense'] > 0 else 0
+    return row
+
+
+def payroll_report(start, end):
+    """
+    Payroll expense/paid totals from ``start`` to ``end`` ((year, month)
+    pairs, inclusive): per month, per department and per year over the
+    whole range, plus grand totals.
+    """
+    periods = report_periods(start, end)
+    summaries = period_summaries(periods)
+
+    months = []
+    departments = {}
+    years = {}
+    totals = {'expense': 0.0, 'paid': 0.0}
+    for year, month in periods:
+        summary = summaries[(year, month)]
+        months.append(_with_percentage({
+            'year': year,
+            'month': month,
+            'month_name': calendar.month_name[month],
+            'expense': summary['expense'],
+            'paid': summary['paid'],
+            'teachers': summary['teachers'],
+            'paid_teachers': summary['paid_teachers'],
+        }))
+        year_row = years.setdefault(year, {'year': year, 'expense': 0.0, 'paid': 0.0})
+        year_row['expense'] += summary['expense']
+        year_row['paid'] += summary['paid']
+        totals['expense'] += summary['expense']
+        totals['paid'] += summary['paid']
+        for row in summary['departments']:
+            department = departments.setdefault(
+                row['department'], {'department': row['department'], 'expense': 0.0, 'paid': 0.0}
+            )
+            department['expense'] += row['expense']
+            department['paid'] += row['paid']
+
+    return {
+        'from': f'{start[0]:04d}-{start[1]:02d}',
+        'to': f'{end[0]:04d}-{end[1]:02d}',
+        'months': months,
+        'departments': [_with_percentage(row) for row in sorted(departments.values(), key=lambda row: -row['expense'])],
+        'years': [_with_percentage(row) for _, row in sorted(years.items())],
+        'totals': _with_percentage(totals),
+    }
@@ -5,7 +5,19 @@ Tests: URL resolution, view access control, serializer imports.
 from django.test import TestCase
 from django.urls import reverse
 from accounts.models import User
-from test_helpers import SafeClient as Client
+from test_helpers import SafeClient as Client, mongomock_database
+from courses.fee_ledger import (
+    SEMESTER_FEE, _ledger_operations, _new_record_fields, _payment_update, daily_collections_pipeline,
+    decode_payment_cursor, encode_payment_cursor, fee_overview_pipeline, merge_fee_records, payment_history_filter,
+    record_fee_payment, replay_pending_payments
+)
+from courses.payroll import (
+    _new_salary_record, _summarise, generate_salary_records, missing_salary_records_pipeline, payroll_totals_pipeline,
+    period_summaries, pick_salary_record, report_periods
+)
+from bson import ObjectId
+import datetime
+import mongomock
 
 
 class CourseURLResolutionTest(TestCase):
@@ -167,3 +179,389 @@ class SalaryManagementViewTest(TestCase):
         self.client.login(email='admin@test.com', password='pass123')
         response = self.client.get(reverse('courses:salary-management'))
         self.assertNotEqual(response.status_code, 302)  # Not redirected to login
+
+
+class FeeLedgerProvisioningTest(TestCase):
+    """Test the bulk upserts that provision per-semester fee records"""
+
+    def test_creates_one_record_per_semester_and_never_overwrites(self):
+        collection = mongomock.MongoClient().db.student_fee_records
+        now = datetime.datetime.now()
+        result = collection.bulk_write(_ledger_operations('student-1', 3, now), ordered=False)
+        self.assertEqual(result.upserted_count, 3)
+        records = {doc['semester']: doc for doc in collection.find({'student': 'student-1'})}
+        self.assertEqual(sorted(records), [1, 2, 3])
+        self.assertEqual(records[1]['total_fee'], SEMESTER_FEE)
+        self.assertEqual(records[1]['paid_amount'], 0.0)
+
+        # Re-provisioning after a payment leaves the recorded amount alone
+        collection.update_one({'student': 'student-1', 'semester': 2}, {'$set': {'paid_amount': 1000.0}})
+        result = collection.bulk_write(_ledger_operations('student-1', 4, now), ordered=False)
+        self.assertEqual(result.upserted_count, 1)
+        self.assertEqual(collection.count_documents({'student': 'student-1'}), 4)
+        self.assertEqual(collection.find_one({'student': 'student-1', 'semester': 2})['paid_amount'], 1000.0)
+
+    def test_semester_range_is_clamped(self):
+        now = datetime.datetime.now()
+        self.assertEqual(len(_ledger_operations('student-1', 12, now)), 8)
+        self.assertEqual(len(_ledger_operations('student-1', None, now)), 1)
+
+
+class FeeOverviewPipelineTest(TestCase):
+    """Test the aggregation behind the fee admin page"""
+
+    def setUp(self):
+        self.students = mongomock.MongoClient().db.students
+        self.students.insert_many([
+            {'student_id': 'STU002', 'first_name': 'Bob', 'last_name': 'Jones', 'current_semester': 2,
+             'is_active': True},
+            {'student_id': 'STU001', 'first_name': 'Alice', 'last_name': 'Smith', 'current_semester': 4,
+             'is_active': True},
+            {'student_id': 'STU003', 'first_name': 'Carl', 'last_name': 'Smith', 'current_semester': 4,
+             'is_active': False},
+        ])
+
+    def run_without_lookup(self, pipeline):
+        """mongomock cannot run the correlated $lookup; it is replaced by an empty join (no fee records)"""
+        no_records = {'$addFields': {'records': {'$literal': []}}}
+        return next(self.students.aggregate([no_records if '$lookup' in stage else stage for stage in pipeline]))
+
+    def test_filters_students_before_joining_fee_records(self):
+        pipeline = fee_overview_pipeline(search='a.b', semester='3')
+        first = pipeline[0]['$match']
+        self.assertEqual(first['is_active'], True)
+        self.assertEqual(first['current_semester'], {'$gte': 3})
+        search = first['$or'][0]['first_name']
+        self.assertTrue(search.search('xA.By'))
+        self.assertIsNone(search.search('axb'))
+        lookup = next(stage['$lookup'] for stage in pipeline if '$lookup' in stage)
+        self.assertEqual(lookup['from'], 'student_fee_records')
+
+    def test_students_without_fee_records_are_listed_as_unpaid(self):
+        result = self.run_without_lookup(fee_overview_pipeline(status='pending'))
+        self.assertEqual(result['summary'][0]['students'], 2)
+        self.assertEqual(result['summary'][0]['expected'], 6 * SEMESTER_FEE)
+        self.assertEqual(result['summary'][0]['collected'], 0)
+        self.assertEqual([row['student']['student_id'] for row in result['page']], ['STU001', 'STU002'])
+
+        completed = self.run_without_lookup(fee_overview_pipeline(status='completed'))
+        self.assertEqual(completed['page'], [])
+
+    def test_search_semester_and_paging(self):
+        result = self.run_without_lookup(fee_overview_pipeline(search='smith', semester='3'))
+        self.assertEqual([row['student']['first_name'] for row in result['page']], ['Alice'])
+        self.assertEqual(result['page'][0]['max_semester'], 4)
+
+        page = self.run_without_lookup(fee_overview_pipeline(skip=1, limit=1))['page']
+        self.assertEqual([row['student']['student_id'] for row in page], ['STU002'])
+
+
+class FeePaymentUpdateTest(TestCase):
+    """Test the atomic update pipeline used to record fee payments"""
+
+    def setUp(self):
+        self.records = mongomock.MongoClient().db.student_fee_records
+        self.records.insert_one({
+            '_id': 'record-1', 'total_fee': 1000.0, 'paid_amount': 0.0, 'remaining_amount': 1000.0,
+            'payment_status': 'pending', 'is_completed': False,
+        })
+
+    def pay(self, amount, recorded_by_id=None):
+        now = datetime.datetime(2026, 3, 4, 10, 30)
+        self.records.update_one({'_id': 'record-1'}, _payment_update(amount, 'cash', 'note', recorded_by_id, now))
+        return self.records.find_one({'_id': 'record-1'})
+
+    def test_increments_paid_amount_and_derives_status_in_one_write(self):
+        record = self.pay(400.0)
+        self.assertEqual(record['paid_amount'], 400.0)
+        self.assertEqual(record['remaining_amount'], 600.0)
+        self.assertEqual(record['payment_status'], 'partial')
+        self.assertFalse(record['is_completed'])
+        self.assertEqual(record['payment_date'], datetime.datetime(2026, 3, 4, 10, 30))
+        self.assertNotIn('recorded_by', record)
+
+        record = self.pay(600.0)
+        self.assertEqual(record['remaining_amount'], 0.0)
+        self.assertEqual(record['payment_status'], 'paid')
+        self.assertTrue(record['is_completed'])
+
+    def test_records_who_took_the_payment(self):
+        self.assertEqual(self.pay(10.0, 'profile-id')['recorded_by'], 'profile-id')
+
+
+class FeePaymentLedgerWriteTest(TestCase):
+    """Test that every applied payment ends up in the fee_payments ledger exactly once"""
+
+    def setUp(self):
+        from courses.models import StudentFeeRecord
+
+        self.db = self.enterContext(mongomock_database())
+        self.student = ObjectId()
+        StudentFeeRecord._get_collection().insert_one(
+            dict(_new_record_fields(datetime.datetime(2026, 1, 1)), student=self.student, semester=1)
+        )
+
+    def ledger(self):
+        return list(self.db.fee_payments.find({}, {'_id': 0, 'amount': 1, 'paid_amount_after': 1, 'notes': 1}))
+
+    def test_payment_is_logged_and_dequeued(self):
+        record = record_fee_payment(self.student, 1, 20000.0, notes='$first instalment')
+        self.assertEqual(record['paid_amount'], 20000.0)
+        self.assertNotIn('pending_payments', record)
+        self.assertEqual(self.ledger(), [{'amount': 20000.0, 'paid_amount_after': 20000.0,
+                                          'notes': '$first instalment'}])
+        self.assertEqual(self.db.student_fee_records.find_one()['pending_payments'], [])
+
+    def test_row_lost_after_the_balance_update_is_replayed_once(self):
+        from courses import fee_ledger
+
+        def crash(record, entry):
+            raise ConnectionError('lost the server after the balance update')
+
+        original, fee_ledger.write_ledger_payment = fee_ledger.write_ledger_payment, crash
+        try:
+            with self.assertRaises(ConnectionError):
+                record_fee_payment(self.student, 1, 15000.0)
+        finally:
+            fee_ledger.write_ledger_payment = original
+        self.assertEqual(self.ledger(), [])
+
+        self.assertEqual(replay_pending_payments(), 1)
+        self.assertEqual(replay_pending_payments(), 0)
+        self.assertEqual(self.ledger(), [{'amount': 15000.0, 'notes': ''}])
+        payment = self.db.fee_payments.find_one()
+        self.assertEqual((payment['student'], payment['semester']), (self.student, 1))
+
+    def test_replaying_a_row_already_written_does_not_duplicate_it(self):
+        from courses.fee_ledger import write_ledger_payment
+
+        record_fee_payment(self.student, 1, 5000.0)
+        payment = self.db.fee_payments.find_one()
+        record = self.db.student_fee_records.find_one()
+        entry = {'_id': payment['_id'], 'amount': 5000.0, 'timestamp': payment['timestamp']}
+        write_ledger_payment(record, entry)
+        self.assertEqual(self.db.fee_payments.count_documents({}), 1)
+
+
+class FeeRecordMergeTest(TestCase):
+    """Test merging duplicate fee records before the unique index is built"""
+
+    def test_paid_amounts_are_added_into_the_oldest_record(self):
+        duplicates = [
+            {'_id': 'newer', 'created_at': datetime.datetime(2025, 2, 1), 'total_fee': SEMESTER_FEE,
+             'paid_amount': 20000.0, 'payment_date': datetime.datetime(2025, 2, 3), 'payment_method': 'online',
+             'notes': 'second counter'},
+            {'_id': 'oldest', 'created_at': datetime.datetime(2025, 1, 1), 'total_fee': SEMESTER_FEE,
+             'paid_amount': 10000.0, 'payment_date': datetime.datetime(2025, 1, 5), 'payment_method': 'cash',
+             'notes': 'first counter'},
+            {'_id': 'unpaid', 'created_at': datetime.datetime(2025, 3, 1), 'total_fee': SEMESTER_FEE,
+             'paid_amount': 0.0},
+        ]
+        kept_id, fields, duplicate_ids = merge_fee_records(duplicates)
+        self.assertEqual(kept_id, 'oldest')
+        self.assertEqual(sorted(duplicate_ids), ['newer', 'unpaid'])
+        self.assertEqual(fields['paid_amount'], 30000.0)
+        self.assertEqual(fields['remaining_amount'], 20000.0)
+        self.assertEqual(fields['payment_status'], 'partial')
+        self.assertEqual(fields['payment_method'], 'online')
+        self.assertEqual(fields['notes'], 'first counter; second counter')
+
+    def test_merged_overpayment_is_marked_paid(self):
+        kept_id, fields, _ = merge_fee_records([
+            {'_id': 'a', 'total_fee': SEMESTER_FEE, 'paid_amount': SEMESTER_FEE},
+            {'_id': 'b', 'total_fee': SEMESTER_FEE, 'paid_amount': 5000.0},
+        ])
+        self.assertEqual(kept_id, 'a')
+        self.assertEqual(fields['paid_amount'], SEMESTER_FEE + 5000.0)
+        self.assertEqual(fields['remaining_amount'], 0.0)
+        self.assertTrue(fields['is_completed'])
+
+
+class FeePaymentLedgerQueryTest(TestCase):
+    """Test the keyset pagination and daily rollup queries over fee_payments"""
+
+    def test_cursor_round_trip(self):
+        payment = {'_id': ObjectId(), 'timestamp': datetime.datetime(2026, 3, 4, 10, 30, 15, 250000)}
+        timestamp, payment_id = decode_payment_cursor(encode_payment_cursor(payment))
+        self.assertEqual(timestamp, payment['timestamp'])
+        self.assertEqual(payment_id, payment['_id'])
+
+    def test_malformed_cursor_rejected(self):
+        with self.assertRaises(ValueError):
+            decode_payment_cursor('not-a-cursor')
+
+    def test_first_page_filters_on_student_only(self):
+        student_id = ObjectId()
+        self.assertEqual(payment_history_filter(student_id), {'student': student_id})
+
+    def test_next_page_continues_after_cursor_with_id_tie_break(self):
+        student_id = ObjectId()
+        payment = {'_id': ObjectId(), 'timestamp': datetime.datetime(2026, 3, 4, 10, 30)}
+        query = payment_history_filter(student_id, before=encode_payment_cursor(payment))
+        self.assertEqual(query['student'], student_id)
+        self.assertEqual(query['$or'], [
+            {'timestamp': {'$lt': payment['timestamp']}},
+            {'timestamp': payment['timestamp'], '_id': {'$lt': payment['_id']}},
+        ])
+
+    def test_daily_rollup_matches_on_indexed_date_range(self):
+        pipeline = daily_collections_pipeline(datetime.date(2026, 3, 1), datetime.date(2026, 3, 31))
+        self.assertEqual(pipeline[0], {'$match': {'date': {
+            '$gte': datetime.datetime(2026, 3, 1), '$lte': datetime.datetime(2026, 3, 31),
+        }}})
+        self.assertEqual(pipeline[-1], {'$sort': {'_id': -1}})
+
+    def test_daily_collections_url(self):
+        self.assertEqual(reverse('courses:daily-fee-collections'), '/courses/fees/collections/daily/')
+
+
+class PayrollGenerationTest(TestCase):
+    """Test the bulk month-end salary record generation"""
+
+    def test_pipeline_finds_missing_records_for_active_salaried_teachers(self):
+        pipeline = missing_salary_records_pipeline(3, 2026)
+        self.assertEqual(pipeline[0], {'$match': {'is_active': True, 'salary': {'$gt': 0}}})
+        lookup = pipeline[1]['$lookup']
+        self.assertEqual(lookup['from'], 'teacher_salary_records')
+        self.assertEqual(lookup['pipeline'][0]['$match']['month'], 3)
+        self.assertEqual(lookup['pipeline'][0]['$match']['year'], 2026)
+        facets = pipeline[-1]['$facet']
+        self.assertEqual(facets['missing'][0], {'$match': {'existing': {'$size': 0}}})
+
+    def test_new_record_matches_model_defaults(self):
+        from courses.models import TeacherSalaryRecord
+        doc = _new_salary_record(ObjectId(), 42000.0, 3, 2026, datetime.datetime.now())
+        record = TeacherSalaryRecord._from_son(doc)
+        record.validate()
+        self.assertEqual(record.net_salary, 42000.0)
+        self.assertEqual(record.payment_status, 'pending')
+        self.assertFalse(record.is_paid)
+
+    def test_unique_period_index_declared(self):
+        from courses.models import TeacherSalaryRecord
+        self.assertIn(
+            {'fields': [('teacher', 1), ('month', 1), ('year', 1)], 'unique': True},
+            TeacherSalaryRecord._meta['index_specs'],
+        )
+
+    def test_invalid_month_rejected_before_querying(self):
+        with self.assertRaises(ValueError):
+            generate_salary_records(13, 2026)
+
+    def test_duplicate_salary_records_keep_the_paid_one(self):
+        kept_id, duplicate_ids = pick_salary_record([
+            {'_id': 'old', 'created_at': datetime.datetime(2026, 3, 1), 'is_paid': False},
+            {'_id': 'paid', 'created_at': datetime.datetime(2026, 3, 2), 'is_paid': True,
+             'payment_status': 'paid', 'payment_date': datetime.datetime(2026, 3, 28)},
+            {'_id': 'new', 'created_at': datetime.datetime(2026, 3, 3), 'is_paid': False},
+        ])
+        self.assertEqual(kept_id, 'paid')
+        self.assertEqual(sorted(duplicate_ids), ['new', 'old'])
+
+    def test_duplicate_unpaid_salary_records_keep_the_oldest(self):
+        kept_id, duplicate_ids = pick_salary_record([
+            {'_id': 'b', 'created_at': datetime.datetime(2026, 3, 2)},
+            {'_id': 'a', 'created_at': datetime.datetime(2026, 3, 1)},
+        ])
+        self.assertEqual((kept_id, duplicate_ids), ('a', ['b']))
+
+
+class PayrollReportTest(TestCase):
+    """Test the aggregation-backed payroll reports"""
+
+    def test_report_periods_cross_year_boundary(self):
+        self.assertEqual(report_periods((2025, 11), (2026, 2)), [(2025, 11), (2025, 12), (2026, 1), (2026, 2)])
+
+    def test_report_periods_reject_bad_ranges(self):
+        with self.assertRaises(ValueError):
+            report_periods((2026, 5), (2026, 4))
+        with self.assertRaises(ValueError):
+            report_periods((2000, 1), (2026, 1))
+
+    def test_pipeline_totals_requested_periods_per_department(self):
+        from courses.models import Teacher, TeacherSalaryRecord
+        db = mongomock.MongoClient().db
+        math, cs, unassigned = ObjectId(), ObjectId(), ObjectId()
+        db[Teacher._get_collection_name()].insert_many([
+            {'_id': math, 'department': 'Math'},
+            {'_id': cs, 'department': 'CS'},
+            {'_id': unassigned},
+        ])
+        db[TeacherSalaryRecord._get_collection_name()].insert_many([
+            {'teacher': math, 'year': 2025, 'month': 12, 'net_salary': 100.0, 'is_paid': True},
+            {'teacher': cs, 'year': 2025, 'month': 12, 'net_salary': 80.0, 'is_paid': False},
+            {'teacher': math, 'year': 2026, 'month': 1, 'net_salary': 100.0, 'is_paid': False},
+            {'teacher': unassigned, 'year': 2026, 'month': 1, 'net_salary': 50.0, 'is_paid': True},
+            # Outside the requested periods
+            {'teacher': math, 'year': 2026, 'month': 12, 'net_salary': 999.0, 'is_paid': True},
+            {'teacher': math, 'year': 2025, 'month': 1, 'net_salary': 999.0, 'is_paid': True},
+        ])
+
+        rows = db[TeacherSalaryRecord._get_collection_name()].aggregate(
+            payroll_totals_pipeline([(2025, 12), (2026, 1), (2026, 2)])
+        )
+        totals = {
+            (row['_id']['year'], row['_id']['month'], row['_id']['department']):
+                (row['expense'], row['paid'], row['teachers'], row['paid_teachers'])
+            for row in rows
+        }
+        self.assertEqual(totals, {
+            (2025, 12, 'Math'): (100.0, 100.0, 1, 1),
+            (2025, 12, 'CS'): (80.0, 0, 1, 0),
+            (2026, 1, 'Math'): (100.0, 0, 1, 0),
+            (2026, 1, 'Unassigned'): (50.0, 50.0, 1, 1),
+        })
+
+    def test_summary_totals_departments(self):
+        summary = _summarise([
+            {'department': 'Math', 'expense': 100.0, 'paid': 40.0, 'teachers': 2, 'paid_teachers': 1},
+            {'department': 'CS', 'expense': 50.0, 'paid': 50.0, 'teachers': 1, 'paid_teachers': 1},
+        ])
+        self.assertEqual(summary['expense'], 150.0)
+        self.assertEqual(summary['paid'], 90.0)
+        self.assertEqual(summary['teachers'], 3)
+        self.assertEqual([row['department'] for row in summary['departments']], ['CS', 'Math'])
+
+    def test_payroll_report_url(self):
+        self.assertEqual(reverse('courses:payroll-report'), '/courses/salaries/reports/')
+
+
+class PayrollCacheInvalidationTest(TestCase):
+    """Test that cached payroll summaries are recomputed after every change to their months"""
+
+    def setUp(self):
+        from courses.models import Teacher, TeacherSalaryRecord
+
+        self.enterContext(mongomock_database())
+        self.teacher = Teacher(
+            teacher_id='TCH001', first_name='Dipa', last_name='Shah', email='dipa@example.com',
+            department='Math', designation='Lecturer', salary=100.0,
+        )
+        self.teacher.save()
+        TeacherSalaryRecord._get_collection().insert_many([
+            _new_salary_record(self.teacher.pk, 100.0, month, 2026, datetime.datetime(2026, month, 1))
+            for month in (1, 2)
+        ])
+        self.departments()  # Caches both months
+
+    def departments(self):
+        return {
+            period: [(row['department'], row['expense']) for row in summary['departments']]
+            for period, summary in period_summaries([(2026, 1), (2026, 2)]).items()
+        }
+
+    def test_department_change_regroups_past_months(self):
+        self.teacher.department = 'CS'
+        self.teacher.save()
+        self.assertEqual(self.departments(), {(2026, 1): [('CS', 100.0)], (2026, 2): [('CS', 100.0)]})
+
+    def test_deleted_records_leave_the_totals(self):
+        from courses.models import TeacherSalaryRecord
+
+        TeacherSalaryRecord.objects.filter(month=1).delete()
+        TeacherSalaryRecord.objects.get(month=2).delete()
+        self.assertEqual(self.departments(), {(2026, 1): [], (2026, 2): []})
+
+    def test_deleted_teacher_moves_to_unassigned(self):
+        self.teacher.delete()
+        self.assertEqual(self.departments()[(2026, 1)], [('Unassigned', 100.0)])
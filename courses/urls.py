@@ -73,12 +73,14 @@ urlpatterns = [
     path('fees/', views.StudentFeeManagementView.as_view(), name='fee-management'),
     path('fees/mark-payment/', views.mark_fee_payment, name='mark-fee-payment'),
     path('student-payment-history/<str:student_id>/', views.student_payment_history, name='student-payment-history'),
+    path('fees/collections/daily/', views.daily_fee_collections, name='daily-fee-collections'),
     path('teacher-salary-history/<str:teacher_id>/', views.teacher_salary_history, name='teacher-salary-history'),
     
     # Salary Management URLs - ADD THESE  
     path('salaries/', views.TeacherSalaryManagementView.as_view(), name='salary-management'),
     path('salaries/mark-payment/', views.mark_salary_payment, name='mark-salary-payment'),
     path('salaries/generate/', views.generate_monthly_salaries, name='generate-salaries'),
+    path('salaries/reports/', views.payroll_report_view, name='payroll-report'),
 
 
     # --- Minimal routes so existing template links work ---
@@ -17,7 +17,13 @@ from django.http import FileResponse, Http404
 from django.core.files.storage import default_storage
 from django.views.decorators.http import require_http_methods
 from .models import StudentFeeRecord, TeacherSalaryRecord
+from .payroll import generate_salary_records, payroll_report
+from .fee_ledger import (
+    HISTORY_PAGE_SIZE, SEMESTER_FEE, FeePaymentError, daily_collections, fee_overview, fee_records_by_student,
+    payment_history, placeholder_fee_record, record_fee_payment, total_paid_by_student
+)
 from django.urls import reverse
+import calendar
 import json
 import datetime
 import mimetypes
@@ -55,63 +61,54 @@ class StudentDashboardView(LoginRequiredMixin, TemplateView):
             else:
                 # *** CRITICAL FIX: Sync enrollment with student's current semester ***
                 if enrollment.current_semester != student.current_semester:
-                    print(f"DEBUG: Semester mismatch detected! Student: {student.current_semester}, Enrollment: {enrollment.current_semester}")
                     enrollment.current_semester = student.current_semester
                     enrollment.save()
-                    print(f"DEBUG: Updated enrollment semester to {student.current_semester}")
             
-            # Get current semester subjects using student's current semester (the source of truth)
-            semester_subjects_raw = BCASubject.objects.filter(semester=student.current_semester)
+            # Subjects for the student's current semester (the source of truth), with
+            # their teachers fetched in one $in query instead of one dereference each
+            current_semester = student.current_semester
+            subjects = list(BCASubject.objects.filter(semester=current_semester).no_dereference())
+            teacher_ids = {subject.assigned_teacher.id for subject in subjects if subject.assigned_teacher}
+            teachers = Teacher.objects.in_bulk(list(teacher_ids)) if teacher_ids else {}
+            
             semester_subjects = []
-            for subject in semester_subjects_raw:
-                safe_subject = {
+            broken_teacher_refs = []
+            for subject in subjects:
+                teacher = teachers.get(subject.assigned_teacher.id) if subject.assigned_teacher else None
+                if subject.assigned_teacher and teacher is None:
+                    broken_teacher_refs.append(subject.id)
+                semester_subjects.append({
                     'id': subject.id,
                     'subject_code': subject.subject_code,
                     'subject_name': subject.subject_name,
                     'description': getattr(subject, 'description', ''),
                     'credit_hours': getattr(subject, 'credit_hours', 3),
                     'semester': subject.semester,
-                    'assigned_teacher': None,
-                    'teacher_name': 'No teacher assigned'
-                }
-                try:
-                    if hasattr(subject, 'assigned_teacher') and subject.assigned_teacher:
-                        teacher = subject.assigned_teacher
-                        safe_subject['assigned_teacher'] = teacher
-                        safe_subject['teacher_name'] = f"{teacher.first_name} {teacher.last_name}"
-                except Exception as e:
-                    print(f"DEBUG: Broken teacher reference for {subject.subject_code}: {e}")
-                    try:
-                        subject.assigned_teacher = None
-                        subject.save()
-                    except:
-                        pass
-                semester_subjects.append(safe_subject)
-            # --- Fee Payment Status Logic (improved) ---
-            current_semester = student.current_semester  # Use student's semester as source of truth
-            # Create missing fee records automatically
+                    'assigned_teacher': teacher,
+                    'teacher_name': f"{teacher.first_name} {teacher.last_name}" if teacher else 'No teacher assigned'
+                })
+            if broken_teacher_refs:
+                # Teacher was deleted: clear the dangling references in one update
+                BCASubject.objects.filter(id__in=broken_teacher_refs).update(unset__assigned_teacher=True)
+            
+            # --- Fee Payment Status Logic ---
+            # All of the student's fee records up to the current semester in one query. Records
+            # are provisioned when the student is created or promoted; any semester still
+            # missing is shown as unpaid without writing anything here.
+            fee_by_semester = fee_records_by_student([student.id], current_semester).get(student.id, {})
+            fee_records = list(fee_by_semester.values())
             for sem in range(1, current_semester + 1):
-                existing = StudentFeeRecord.objects.filter(student=student, semester=sem).first()
-                if not existing:
-                    new_fee = StudentFeeRecord(
-                        student=student,
-                        semester=sem,
-                        total_fee=50000.0,
-                        paid_amount=0.0
-                    )
-                    new_fee.save()
-                    print(f"DEBUG: Created missing fee record for Semester {sem}")
-            # Re-fetch fee records after creating missing ones
-            fee_records = StudentFeeRecord.objects.filter(student=student, semester__lte=current_semester)
+                if sem not in fee_by_semester:
+                    fee_by_semester[sem] = placeholder_fee_record(student, sem)
+            
             total_paid = sum(fee.paid_amount for fee in fee_records)
-            expected_fee = current_semester * 50000  # Rs.50,000 per semester
-            # *** NEW LOGIC: Check every semester is fully paid ***
-            all_semesters_paid = True
-            for sem in range(1, current_semester + 1):
-                fee_record = StudentFeeRecord.objects.filter(student=student, semester=sem).first()
-                if not fee_record or fee_record.paid_amount < fee_record.total_fee:
-                    all_semesters_paid = False
-                    break
+            expected_fee = current_semester * SEMESTER_FEE  # Rs.50,000 per semester
+            
+            # Every semester must be fully paid for "Full Paid"
+            all_semesters_paid = all(
+                fee_by_semester[sem].paid_amount >= fee_by_semester[sem].total_fee
+                for sem in range(1, current_semester + 1)
+            )
             # Determine enrollment status with strict logic
             if all_semesters_paid:
                 enrollment_status = "Full Paid"
@@ -122,62 +119,32 @@ class StudentDashboardView(LoginRequiredMixin, TemplateView):
             else:
                 enrollment_status = "Not Paid"
             enrollment.payment_status = enrollment_status
-            # Additional detailed fee breakdown for debugging
+            
             fee_breakdown = []
             for sem in range(1, current_semester + 1):
-                fee_record = StudentFeeRecord.objects.filter(student=student, semester=sem).first()
-                if fee_record:
-                    fee_breakdown.append({
-                        'semester': sem,
-                        'expected': fee_record.total_fee,
-                        'paid': fee_record.paid_amount,
-                        'status': fee_record.payment_status,
-                        'completion': round((fee_record.paid_amount / fee_record.total_fee * 100), 1) if fee_record.total_fee > 0 else 0
-                    })
-            # Enhanced debug info
-            print(f"[DEBUG] ==========================================")
-            print(f"[DEBUG] Student: {student.full_name}")
-            print(f"[DEBUG] Email: {student.email}")
-            print(f"[DEBUG] Current Semester: {current_semester}")
-            print(f"[DEBUG] Expected Total Fee: Rs.{expected_fee:,}")
-            print(f"[DEBUG] Total Paid: Rs.{total_paid:,}")
-            print(f"[DEBUG] Enrollment Status: {enrollment_status}")
-            print(f"[DEBUG] Fee Records Count: {len(fee_records)}")
-            print(f"[DEBUG] enrollment.payment_status: {enrollment.payment_status}")
-            print(f"[DEBUG] Fee Records Detail:")
-            for fee in fee_breakdown:
-                print(f"[DEBUG]   Semester {fee['semester']}: Rs.{fee['paid']:,}/{fee['expected']:,} ({fee['completion']}%) - {fee['status']}")
-            print(f"[DEBUG] ==========================================")
-            
-            # Calculate only the count of pending assignments for stats (detailed view will be in StudentAssignmentsView)
-            total_pending_count = 0
-            
-            for subject_dict in semester_subjects:
-                try:
-                    subject = BCASubject.objects.get(subject_code=subject_dict['subject_code'])
-                    # Get assignments for this subject - ONLY THOSE CREATED AFTER STUDENT ENROLLMENT
-                    subject_assignments = Assignment.objects.filter(
-                        subject=subject,
-                        created_date__gte=student.created_at  # Only assignments created after student joined
-                    ).order_by('-created_date')
-                    print(f"DASHBOARD FILTER: Student {student.full_name} sees {subject_assignments.count()} assignments for {subject.subject_code} (created after {student.created_at})")
-                    
-                    for assignment in subject_assignments:
-                        # Check if student has submitted this assignment
-                        submission = AssignmentSubmission.objects.filter(
-                            assignment=assignment,
-                            student=student
-                        ).first()
-                        
-                        # If not submitted and not overdue, it's pending
-                        if not submission and not assignment.is_overdue:
-                            total_pending_count += 1
-                            
-                except Exception as e:
-                    print(f"DEBUG: Error processing assignments for {subject_dict['subject_code']}: {e}")
-                    continue
+                fee_record = fee_by_semester[sem]
+                fee_breakdown.append({
+                    'semester': sem,
+                    'expected': fee_record.total_fee,
+                    'paid': fee_record.paid_amount,
+                    'status': fee_record.payment_status,
+                    'completion': round((fee_record.paid_amount / fee_record.total_fee * 100), 1) if fee_record.total_fee > 0 else 0
+                })
             
-            print(f"DEBUG: Total pending assignments found: {total_pending_count}")
+            # Pending assignments: open assignments of this semester's subjects created after the
+            # student joined, minus the ones they already submitted (one query each)
+            open_assignment_ids = list(Assignment.objects.filter(
+                subject__in=[subject.id for subject in subjects],
+                created_date__gte=student.created_at,
+                due_date__gt=datetime.datetime.now()
+            ).scalar('id'))
+            submitted_ids = set()
+            if open_assignment_ids:
+                submitted_ids = set(AssignmentSubmission._get_collection().distinct('assignment', {
+                    'student': student.id,
+                    'assignment': {'$in': open_assignment_ids},
+                }))
+            total_pending_count = len(set(open_assignment_ids) - submitted_ids)
             
             context.update({
                 'student': student,
@@ -2373,6 +2340,7 @@ def delete_assignment(request, assignment_id):
 class StudentFeeManagementView(LoginRequiredMixin, TemplateView):
     """Manage student fee payments"""
     template_name = 'courses/student_fee_management.html'
+    paginate_by = 50
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         if self.request.user.role != 'admin':
@@ -2382,65 +2350,35 @@ class StudentFeeManagementView(LoginRequiredMixin, TemplateView):
         search_query = self.request.GET.get('search', '')
         semester_filter = self.request.GET.get('semester', '')
         status_filter = self.request.GET.get('status', '')
-        # Get all students with their fee records
-        students = Student.objects.filter(is_active=True).order_by('student_id')
-        if search_query:
-            students = students.filter(
-                Q(first_name__icontains=search_query) |
-                Q(last_name__icontains=search_query) |
-                Q(student_id__icontains=search_query)
-            )
-        # Prepare student fee data
-        student_fee_data = []
-        total_expected_revenue = 0
-        total_collected_revenue = 0
-        for student in students:
-            # Get or create fee records for all semesters up to current
-            max_semester = min(student.current_semester, 8)
-            student_fees = []
-            student_total_paid = 0
-            student_total_expected = max_semester * 50000
-            for sem in range(1, max_semester + 1):
-                fee_record = StudentFeeRecord.objects.filter(
-                    student=student, semester=sem
-                ).first()
-                if not fee_record:
-                    # Auto-create fee record
-                    fee_record = StudentFeeRecord(
-                        student=student,
-                        semester=sem,
-                        total_fee=50000.0
-                    )
-                    fee_record.save()
-                student_fees.append(fee_record)
-                student_total_paid += fee_record.paid_amount
-            # Apply filters
-            if semester_filter:
-                semester_fees = [f for f in student_fees if f.semester == int(semester_filter)]
-                if not semester_fees:
-                    continue
-            if status_filter:
-                if status_filter == 'pending':
-                    if student_total_paid >= student_total_expected:
-                        continue
-                elif status_filter == 'completed':
-                    if student_total_paid < student_total_expected:
-                        continue
-            student_fee_data.append({
-                'student': student,
-                'fee_records': student_fees,
-                'total_paid': student_total_paid,
-                'total_expected': student_total_expected,
-                'completion_percentage': round((student_total_paid / student_total_expected * 100), 1) if student_total_expected > 0 else 0
-            })
-            total_expected_revenue += student_total_expected
-            total_collected_revenue += student_total_paid
+        try:
+            page = max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        # One aggregation over active students joined to their fee records: totals, revenue rollups and the page
+        student_fee_data, summary = fee_overview(
+            search=search_query,
+            semester=semester_filter if semester_filter.isdigit() else None,
+            status=status_filter,
+            page=page,
+            page_size=self.paginate_by,
+        )
+        num_pages = max((summary['students'] + self.paginate_by - 1) // self.paginate_by, 1)
+        query_params = self.request.GET.copy()
+        query_params.pop('page', None)
+        total_expected_revenue = summary['expected']
+        total_collected_revenue = summary['collected']
         context.update({
             'student_fee_data': student_fee_data,
-            'total_students': len(student_fee_data),
+            'total_students': summary['students'],
             'total_expected_revenue': total_expected_revenue,
             'total_collected_revenue': total_collected_revenue,
             'collection_percentage': round((total_collected_revenue / total_expected_revenue * 100), 1) if total_expected_revenue > 0 else 0,
+            'page_number': page,
+            'num_pages': num_pages,
+            'page_range': range(max(page - 2, 1), min(page + 2, num_pages) + 1),
+            'has_previous': page > 1,
+            'has_next': page < num_pages,
+            'page_query': query_params.urlencode(),
             'search_query': search_query,
             'semester_filter': semester_filter,
             'status_filter': status_filter,
@@ -2463,52 +2401,36 @@ def mark_fee_payment(request):
                 return JsonResponse({'error': 'Amount must be greater than 0'}, status=400)
             if amount_paid > 50000:
                 return JsonResponse({'error': 'Amount cannot exceed Rs.50,000 per semester'}, status=400)
+            if not 1 <= semester <= 8:
+                return JsonResponse({'error': 'Semester must be between 1 and 8'}, status=400)
             # Get student
-            student = Student.objects.get(id=student_id)
-            # Get or create fee record
-            fee_record = StudentFeeRecord.objects.filter(
-                student=student, semester=semester
-            ).first()
-            if not fee_record:
-                fee_record = StudentFeeRecord(
-                    student=student,
-                    semester=semester,
-                    total_fee=50000.0
-                )
-            # CHECK FOR OVERPAYMENT - Prevent paying more than remaining balance
-            remaining_balance = fee_record.total_fee - fee_record.paid_amount
-            if remaining_balance <= 0:
-                return JsonResponse({
-                    'error': f'This semester is already fully paid (Rs.{fee_record.paid_amount:.2f}/Rs.{fee_record.total_fee:.2f})'
-                }, status=400)
-            if amount_paid > remaining_balance:
-                return JsonResponse({
-                    'error': f'Payment amount (Rs.{amount_paid:.2f}) exceeds remaining balance (Rs.{remaining_balance:.2f}). Please enter Rs.{remaining_balance:.2f} or less.'
-                }, status=400)
-            # Update payment details
-            fee_record.paid_amount += amount_paid
-            fee_record.payment_method = payment_method
-            fee_record.notes = notes
-            fee_record.payment_date = datetime.datetime.now()
+            student = Student.objects.only('id').get(id=student_id)
             # Get admin profile
+            recorded_by_id = None
             try:
                 from accounts.models import UserProfile
-                admin_profile = UserProfile.objects.filter(user_id=str(request.user.id)).first()
+                admin_profile = UserProfile.objects.filter(user_id=str(request.user.id)).only('id').first()
                 if admin_profile:
-                    fee_record.recorded_by = admin_profile
+                    recorded_by_id = admin_profile.id
             except:
                 pass
-            fee_record.save()  # This will auto-update status and completion
-            # Calculate new remaining balance
-            new_remaining = fee_record.total_fee - fee_record.paid_amount
+            # Balance check and increment happen in one atomic update; the payment is logged to fee_payments
+            try:
+                fee_record = record_fee_payment(
+                    student.id, semester, amount_paid,
+                    payment_method=payment_method, notes=notes, recorded_by_id=recorded_by_id
+                )
+            except FeePaymentError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            new_remaining = fee_record['remaining_amount']
             return JsonResponse({
                 'success': True,
                 'message': f'Payment of Rs.{amount_paid:.2f} recorded successfully! Remaining balance: Rs.{new_remaining:.2f}',
-                'new_status': fee_record.payment_status,
-                'is_completed': fee_record.is_completed,
+                'new_status': fee_record['payment_status'],
+                'is_completed': fee_record['is_completed'],
                 'remaining_amount': new_remaining,
-                'total_paid': fee_record.paid_amount,
-                'completion_percentage': round((fee_record.paid_amount / fee_record.total_fee * 100), 1)
+                'total_paid': fee_record['paid_amount'],
+                'completion_percentage': round((fee_record['paid_amount'] / fee_record['total_fee'] * 100), 1)
             })
         except Student.DoesNotExist:
             return JsonResponse({'error': 'Student not found'}, status=404)
@@ -2520,34 +2442,72 @@ def mark_fee_payment(request):
 # NEW: Add this view for payment history
 @login_required
 def student_payment_history(request, student_id):
-    """Get payment history for a student"""
+    """
+    Get payment history for a student from the fee_payments ledger, newest
+    first. Pages are keyset-paginated: pass the returned next_cursor back
+    as ?before= to fetch the next page.
+    """
     if request.user.role != 'admin':
         return JsonResponse({'error': 'Access denied'}, status=403)
     try:
-        student = Student.objects.get(id=student_id)
-        fee_records = StudentFeeRecord.objects.filter(student=student).order_by('-payment_date', 'semester')
-        payments = []
-        total_paid = 0
-        for record in fee_records:
-            if record.paid_amount > 0:
-                payments.append({
-                    'semester': record.semester,
-                    'paid_amount': record.paid_amount,
-                    'payment_method': record.payment_method,
-                    'payment_date': record.payment_date.isoformat() if record.payment_date else None,
-                    'notes': record.notes
-                })
-                total_paid += record.paid_amount
+        try:
+            limit = int(request.GET.get('limit', HISTORY_PAGE_SIZE))
+        except ValueError:
+            return JsonResponse({'error': 'limit must be an integer'}, status=400)
+        before = request.GET.get('before') or None
+        student = Student.objects.only('first_name', 'last_name').get(id=student_id)
+        try:
+            records, next_cursor = payment_history(student.id, before=before, limit=limit)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        payments = [{
+            'id': str(record['_id']),
+            'semester': record['semester'],
+            'paid_amount': record['amount'],
+            'payment_method': record.get('payment_method'),
+            'payment_date': record['timestamp'].isoformat(),
+            'notes': record.get('notes'),
+            'remaining_after': record.get('remaining_after'),
+        } for record in records]
         return JsonResponse({
             'success': True,
             'payments': payments,
+            'next_cursor': next_cursor,
             'student_name': student.full_name,
-            'total_paid': total_paid
+            'total_paid': total_paid_by_student(student.id)
         })
     except Student.DoesNotExist:
         return JsonResponse({'error': 'Student not found'}, status=404)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
+
+
+@login_required
+def daily_fee_collections(request):
+    """Fee collections per day, aggregated from the fee_payments ledger (default: last 30 days)"""
+    if request.user.role != 'admin':
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    try:
+        today = datetime.date.today()
+        end = datetime.date.fromisoformat(request.GET['to']) if request.GET.get('to') else today
+        start = (datetime.date.fromisoformat(request.GET['from']) if request.GET.get('from')
+                 else end - datetime.timedelta(days=29))
+    except ValueError:
+        return JsonResponse({'error': 'Dates must be in YYYY-MM-DD format'}, status=400)
+    if start > end:
+        return JsonResponse({'error': "'from' must not be after 'to'"}, status=400)
+    try:
+        days = daily_collections(start, end)
+        return JsonResponse({
+            'success': True,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'total_amount': sum(day['amount'] for day in days),
+            'total_payments': sum(day['payments'] for day in days),
+            'days': days,
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
 # ============================================================================
 # TEACHER SALARY MANAGEMENT VIEWS
 # ============================================================================
@@ -2563,36 +2523,25 @@ class TeacherSalaryManagementView(LoginRequiredMixin, TemplateView):
         current_date = datetime.datetime.now()
         selected_month = int(self.request.GET.get('month', current_date.month))
         selected_year = int(self.request.GET.get('year', current_date.year))
-        # Get all active teachers
-        teachers = Teacher.objects.filter(is_active=True).order_by('teacher_id')
-        # Get salary records for selected month/year
+        # Read-only: missing records are created by the generate endpoint or the month-start command
+        records = {
+            record.teacher.id: record
+            for record in TeacherSalaryRecord.objects.filter(
+                month=selected_month, year=selected_year
+            ).no_dereference()
+        }
+        teachers = Teacher.objects.filter(is_active=True, salary__gt=0).order_by('teacher_id')
         teacher_salary_data = []
-        total_salary_expense = 0
-        total_paid_salary = 0
+        missing_salary_records = 0
         for teacher in teachers:
-            if not teacher.salary:
-                continue  # Skip teachers without salary set
-            # Get or create salary record
-            salary_record = TeacherSalaryRecord.objects.filter(
-                teacher=teacher, month=selected_month, year=selected_year
-            ).first()
-            if not salary_record:
-                # Auto-create salary record
-                salary_record = TeacherSalaryRecord(
-                    teacher=teacher,
-                    month=selected_month,
-                    year=selected_year,
-                    base_salary=teacher.salary,
-                    net_salary=teacher.salary
-                )
-                salary_record.save()
-            teacher_salary_data.append({
-                'teacher': teacher,
-                'salary_record': salary_record
-            })
-            total_salary_expense += salary_record.net_salary
-            if salary_record.is_paid:
-                total_paid_salary += salary_record.net_salary
+            if teacher.id in records:
+                teacher_salary_data.append({'teacher': teacher, 'salary_record': records[teacher.id]})
+            else:
+                missing_salary_records += 1
+        # Month totals come from the cached payroll summary
+        totals = payroll_report((selected_year, selected_month), (selected_year, selected_month))['totals']
+        total_salary_expense = totals['expense']
+        total_paid_salary = totals['paid']
         # Generate month/year options
         months = [
             (i, datetime.datetime(2000, i, 1).strftime('%B')) 
@@ -2605,9 +2554,10 @@ class TeacherSalaryManagementView(LoginRequiredMixin, TemplateView):
             'selected_year': selected_year,
             'selected_month_name': datetime.datetime(selected_year, selected_month, 1).strftime('%B %Y'),
             'total_teachers': len(teacher_salary_data),
+            'missing_salary_records': missing_salary_records,
             'total_salary_expense': total_salary_expense,
             'total_paid_salary': total_paid_salary,
-            'payment_percentage': round((total_paid_salary / total_salary_expense * 100), 1) if total_salary_expense > 0 else 0,
+            'payment_percentage': totals['payment_percentage'],
             'months': months,
             'years': years,
         })
@@ -2660,29 +2610,24 @@ def teacher_salary_history(request, teacher_id):
     if request.user.role != 'admin':
         return JsonResponse({'error': 'Access denied'}, status=403)
     try:
-        teacher = Teacher.objects.get(id=teacher_id)
-        salary_records = TeacherSalaryRecord.objects.filter(teacher=teacher).order_by('-year', '-month')
-        salaries = []
-        total_paid = 0
-        for record in salary_records:
-            if record.is_paid:
-                month_names = [
-                    '', 'January', 'February', 'March', 'April', 'May', 'June',
-                    'July', 'August', 'September', 'October', 'November', 'December'
-                ]
-                salaries.append({
-                    'month': record.month,
-                    'year': record.year,
-                    'month_name': month_names[record.month],
-                    'base_salary': record.base_salary,
-                    'bonus': record.bonus,
-                    'deductions': record.deductions,
-                    'net_salary': record.net_salary,
-                    'payment_method': record.payment_method,
-                    'payment_date': record.payment_date.isoformat() if record.payment_date else None,
-                    'notes': record.notes
-                })
-                total_paid += record.net_salary
+        teacher = Teacher.objects.only('first_name', 'last_name').get(id=teacher_id)
+        salary_records = TeacherSalaryRecord.objects.filter(teacher=teacher, is_paid=True).only(
+            'month', 'year', 'base_salary', 'bonus', 'deductions', 'net_salary',
+            'payment_method', 'payment_date', 'notes'
+        ).order_by('-year', '-month').as_pymongo()
+        salaries = [{
+            'month': record['month'],
+            'year': record['year'],
+            'month_name': calendar.month_name[record['month']],
+            'base_salary': record['base_salary'],
+            'bonus': record.get('bonus', 0.0),
+            'deductions': record.get('deductions', 0.0),
+            'net_salary': record['net_salary'],
+            'payment_method': record.get('payment_method'),
+            'payment_date': record['payment_date'].isoformat() if record.get('payment_date') else None,
+            'notes': record.get('notes')
+        } for record in salary_records]
+        total_paid = sum(salary['net_salary'] for salary in salaries)
         return JsonResponse({
             'success': True,
             'salaries': salaries,
@@ -2693,6 +2638,37 @@ def teacher_salary_history(request, teacher_id):
         return JsonResponse({'error': 'Teacher not found'}, status=404)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
+def _parse_period(value):
+    """'YYYY-MM' -> (year, month)"""
+    year, month = (int(part) for part in value.split('-'))
+    if not 1 <= month <= 12:
+        raise ValueError(f'Invalid month: {value}')
+    return year, month
+
+
+@login_required
+def payroll_report_view(request):
+    """
+    Payroll expense/paid totals per month, department and year for
+    ?from=YYYY-MM&to=YYYY-MM (default: the last 12 months).
+    """
+    if request.user.role != 'admin':
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    try:
+        today = datetime.date.today()
+        end = _parse_period(request.GET['to']) if request.GET.get('to') else (today.year, today.month)
+        if request.GET.get('from'):
+            start = _parse_period(request.GET['from'])
+        else:
+            start = (end[0] - 1, end[1] + 1) if end[1] < 12 else (end[0], 1)
+        report = payroll_report(start, end)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse(dict(report, success=True))
+
+
 @login_required
 def generate_monthly_salaries(request):
     """Generate salary records for all teachers for a specific month"""
@@ -2702,12 +2678,16 @@ def generate_monthly_salaries(request):
         try:
             month = int(request.POST.get('month'))
             year = int(request.POST.get('year'))
-            created_count = TeacherSalaryRecord.generate_monthly_records(month, year)
+            if not 1 <= month <= 12:
+                return JsonResponse({'error': 'Month must be between 1 and 12'}, status=400)
+            counts = generate_salary_records(month, year)
             month_name = datetime.datetime(year, month, 1).strftime('%B %Y')
             return JsonResponse({
                 'success': True,
-                'message': f'Generated {created_count} salary records for {month_name}',
-                'created_count': created_count
+                'message': (f"Generated {counts['created']} salary records for {month_name}"
+                            f" ({counts['skipped']} already existed)"),
+                'skipped_count': counts['skipped'],
+                'created_count': counts['created']
             })
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
@@ -154,7 +154,7 @@ class AssignGradesView(TeacherAdminRequiredMixin, TemplateView):
                     students = Student.objects.filter(
                         current_semester=selected_semester,
                         is_active=True
-                    ).order_by('first_name', 'last_name')
+                    ).order_by('roll_sort_key', 'student_id')
                     
                     # Get existing grades for these students
                     existing_grades = {}
@@ -78,13 +78,14 @@ TEMPLATES = [
 WSGI_APPLICATION = 'student_management.wsgi.application'
 
 # MongoDB Configuration with MongoEngine
-mongoengine.connect(
-    db=os.getenv('MONGODB_NAME', 'student_management_db'),
-    host=os.getenv('MONGODB_HOST', 'localhost'),
-    port=int(os.getenv('MONGODB_PORT', 27017)),
-    username=os.getenv('MONGODB_USERNAME', ''),
-    password=os.getenv('MONGODB_PASSWORD', ''),
-)
+MONGODB_SETTINGS = {
+    'db': os.getenv('MONGODB_NAME', 'student_management_db'),
+    'host': os.getenv('MONGODB_HOST', 'localhost'),
+    'port': int(os.getenv('MONGODB_PORT', 27017)),
+    'username': os.getenv('MONGODB_USERNAME', ''),
+    'password': os.getenv('MONGODB_PASSWORD', ''),
+}
+mongoengine.connect(**MONGODB_SETTINGS)
 
 # Use a dummy database for Django's internal operations
 DATABASES = {
@@ -139,6 +140,23 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Analytics cache (feature store, trained models)
+ANALYTICS_CACHE_DIR = Path(os.getenv('ANALYTICS_CACHE_DIR', BASE_DIR / 'analytics_cache'))
+FEATURE_STORE_MAX_AGE = int(os.getenv('FEATURE_STORE_MAX_AGE', 24 * 60 * 60))  # Full rebuild after a day
+
+# K-Means clustering: incremental mode streams students in mini-batches and
+# only replaces the saved model when centroids drift past the threshold
+KMEANS_INCREMENTAL = os.getenv('KMEANS_INCREMENTAL', 'False').lower() == 'true'
+KMEANS_BATCH_SIZE = int(os.getenv('KMEANS_BATCH_SIZE', 1000))
+KMEANS_DRIFT_THRESHOLD = float(os.getenv('KMEANS_DRIFT_THRESHOLD', 0.25))
+
+# Background analysis jobs
+ANALYSIS_JOB_WORKERS = int(os.getenv('ANALYSIS_JOB_WORKERS', 2))
+ANALYSIS_JOB_TIMEOUT = int(os.getenv('ANALYSIS_JOB_TIMEOUT', 60 * 60))  # Active jobs older than this are failed
+
+# Student search index: seconds between re-syncs with changes made by other workers
+SEARCH_INDEX_SYNC_INTERVAL = int(os.getenv('SEARCH_INDEX_SYNC_INTERVAL', 5))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
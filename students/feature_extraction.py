@@ -0,0 +1,184 @@
+"""
+Bulk feature extraction for the ML analyses.
+
+Attendance, grade and submission statistics are computed for every student
+with one $group pipeline per collection and joined in memory by student id,
+so the number of queries does not grow with the number of students.
+"""
+
+PASS_MARK = 40  # Marks at or above this count as a passed grade
+
+
+def _match_students(student_ids):
+    """Build a $match stage restricting a pipeline to the given student ObjectIds"""
+    if student_ids is None:
+        return {'$match': {'student': {'$ne': None}}}
+    return {'$match': {'student': {'$in': list(student_ids)}}}
+
+
+def attendance_by_student(student_ids=None):
+    """
+    Return {student ObjectId: (total_days, present_days)}, summed from the
+    per-year attendance bitmaps' running totals. Falls back to counting
+    daily_attendance until rebuild_attendance_bitmaps has built them.
+    """
+    from attendance.bitmaps import bitmaps_built
+    from attendance.models import AttendanceBitmap, DailyAttendance
+
+    if bitmaps_built():
+        match = {'person_type': 'student'}
+        if student_ids is not None:
+            match['person'] = {'$in': list(student_ids)}
+        pipeline = [
+            {'$match': match},
+            {'$group': {
+                '_id': '$person',
+                'total': {'$sum': '$marked_days'},
+                'present': {'$sum': '$present_days'},
+            }},
+        ]
+        model = AttendanceBitmap
+    else:
+        pipeline = [
+            _match_students(student_ids),
+            {'$group': {
+                '_id': '$student',
+                'total': {'$sum': 1},
+                'present': {'$sum': {'$cond': ['$is_present', 1, 0]}},
+            }},
+        ]
+        model = DailyAttendance
+    return {
+        row['_id']: (row['total'], row['present'])
+        for row in model.objects.aggregate(pipeline)
+    }
+
+
+def grades_by_student(student_ids=None):
+    """Return {student ObjectId: {'count', 'total_marks', 'passed', 'subjects'}} from student_grades"""
+    from grades.models import StudentGrade
+
+    pipeline = [
+        _match_students(student_ids),
+        {'$group': {
+            '_id': '$student',
+            'count': {'$sum': 1},
+            'total_marks': {'$sum': '$marks_obtained'},
+            'passed': {'$sum': {'$cond': [{'$gte': ['$marks_obtained', PASS_MARK]}, 1, 0]}},
+            'subjects': {'$addToSet': '$subject'},
+        }},
+        {'$project': {
+            'count': 1,
+            'total_marks': 1,
+            'passed': 1,
+            'subjects': {'$size': '$subjects'},
+        }},
+    ]
+    return {
+        row['_id']: row
+        for row in StudentGrade.objects.aggregate(pipeline)
+    }
+
+
+def submissions_by_student(student_ids=None):
+    """Return {student ObjectId: submitted_count} for submissions that carry a file"""
+    from courses.models import AssignmentSubmission
+
+    match = _match_students(student_ids)
+    match['$match']['submission_file_path'] = {'$nin': [None, '']}
+    pipeline = [
+        match,
+        {'$group': {'_id': '$student', 'submitted': {'$sum': 1}}},
+    ]
+    return {
+        row['_id']: row['submitted']
+        for row in AssignmentSubmission.objects.aggregate(pipeline)
+    }
+
+
+def build_feature_rows(students, attendance, grades, submissions, total_assignments):
+    """
+    Join the per-student aggregates onto student records.
+
+    ``students`` is an iterable of Student documents (or objects with the same
+    attributes); the other arguments are the dicts returned by the
+    *_by_student helpers, keyed by the student's ObjectId.
+    """
+    rows = []
+    for student in students:
+        total_days, present_days = attendance.get(student.id, (0, 0))
+        attendance_percentage = (present_days / total_days) * 100 if total_days > 0 else 0.0
+
+        grade = grades.get(student.id)
+        if grade and grade['count'] > 0:
+            avg_marks = grade['total_marks'] / grade['count']
+            pass_rate = (grade['passed'] / grade['count']) * 100
+            subject_count = grade['subjects']
+        else:
+            avg_marks = 0.0
+            pass_rate = 0.0
+            subject_count = 0
+
+        submitted = submissions.get(student.id, 0)
+        submission_rate = (submitted / total_assignments) * 100 if total_assignments > 0 else 0.0
+
+        rows.append({
+            'student_id': str(student.student_id),
+            'student_name': f"{student.first_name} {student.last_name}",
+            'program': student.program,
+            'semester': student.current_semester,
+            'attendance_percentage': attendance_percentage,
+            'avg_marks': avg_marks,
+            'pass_rate': pass_rate,
+            'subject_count': subject_count,
+            'submitted_count': submitted,
+            'submission_rate': submission_rate,
+        })
+    return rows
+
+
+def collect_student_features(student_ids=None):
+    """
+    Collect raw ML features for active students in a constant number of queries.
+
+    Pass ``student_ids`` (Student ObjectIds) to restrict the run to a subset.
+    """
+    from students.models import Student
+    from courses.models import Assignment
+
+    students = Student.objects.filter(is_active=True).only(
+        'id', 'student_id', 'first_name', 'last_name', 'program', 'current_semester'
+    )
+    if student_ids is not None:
+        students = students.filter(id__in=list(student_ids))
+    students = list(students)
+
+    ids = [student.id for student in students] if student_ids is not None else None
+    return build_feature_rows(
+        students,
+        attendance_by_student(ids),
+        grades_by_student(ids),
+        submissions_by_student(ids),
+        Assignment.objects.count(),
+    )
+
+
+def iter_feature_batches(batch_size):
+    """
+    Yield feature rows for active students ``batch_size`` students at a time.
+
+    Students are paged by _id (keyset pagination), so memory use and the
+    cost of each batch stay flat however large the roster grows.
+    """
+    from students.models import Student
+
+    last_id = None
+    while True:
+        students = Student.objects.filter(is_active=True)
+        if last_id is not None:
+            students = students.filter(id__gt=last_id)
+        ids = list(students.order_by('id').limit(batch_size).scalar('id'))
+        if not ids:
+            return
+        yield collect_student_features(student_ids=ids)
+        last_id = ids[-1]
@@ -0,0 +1,179 @@
+"""
+Column-oriented student feature store shared by the ML analyses.
+
+The table produced by students.feature_extraction is kept as one pandas
+DataFrame keyed by student_id and persisted to an NPZ file together with its
+build timestamp. Later loads only re-collect the students whose records
+changed since that timestamp, so repeated analyses cost a file load instead
+of a full database crawl.
+"""
+
+import datetime
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+STRING_COLUMNS = ['student_id', 'student_name', 'program']
+NUMERIC_COLUMNS = [
+    'semester',
+    'attendance_percentage',
+    'avg_marks',
+    'pass_rate',
+    'subject_count',
+    'submitted_count',
+    'submission_rate',
+]
+COLUMNS = STRING_COLUMNS + NUMERIC_COLUMNS
+
+
+def default_store_path():
+    return os.path.join(str(settings.ANALYTICS_CACHE_DIR), 'student_features.npz')
+
+
+class StudentFeatureStore:
+    """Materialised per-student feature table with incremental refresh"""
+
+    def __init__(self, path=None, max_age=None):
+        self.path = path or default_store_path()
+        if max_age is None:
+            max_age = settings.FEATURE_STORE_MAX_AGE
+        self.max_age = datetime.timedelta(seconds=max_age)
+        self.table = None
+        self.built_at = None
+        self.total_assignments = 0
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def load(self):
+        """Load the persisted table; returns False when there is nothing usable on disk"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self.table = pd.DataFrame({column: data[column] for column in COLUMNS})
+                self.built_at = datetime.datetime.fromisoformat(str(data['built_at']))
+                self.total_assignments = int(data['total_assignments'])
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring unreadable feature store {self.path}: {e}")
+            self.table = None
+            return False
+        self.table.index = self.table['student_id'].to_numpy()
+        return True
+
+    def save(self):
+        """Atomically write the table to disk"""
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        arrays = {column: self.table[column].to_numpy(dtype=str) for column in STRING_COLUMNS}
+        arrays.update({column: self.table[column].to_numpy(dtype=float) for column in NUMERIC_COLUMNS})
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                np.savez(
+                    handle,
+                    built_at=np.array(self.built_at.isoformat()),
+                    total_assignments=np.array(self.total_assignments),
+                    **arrays
+                )
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _to_frame(rows):
+        table = pd.DataFrame(rows, columns=COLUMNS)
+        table.index = table['student_id'].to_numpy()
+        # Row order feeds the model fingerprint, so build() and refresh() must agree on it
+        return table.sort_index()
+
+    def build(self):
+        """Rebuild the whole table from the database"""
+        from courses.models import Assignment
+        from students.feature_extraction import collect_student_features
+
+        built_at = datetime.datetime.now()
+        self.table = self._to_frame(collect_student_features())
+        self.total_assignments = Assignment.objects.count()
+        self.built_at = built_at
+        self.save()
+        return self.table
+
+    def changed_student_ids(self, since):
+        """ObjectIds of students whose own record, attendance, grades or submissions changed after ``since``"""
+        from attendance.models import DailyAttendance
+        from courses.models import AssignmentSubmission
+        from grades.models import StudentGrade
+        from students.models import Student
+
+        changed = set(Student.objects.filter(updated_at__gt=since).scalar('id'))
+        sources = [
+            (DailyAttendance, 'marked_at'),
+            (StudentGrade, 'assigned_date'),
+            (AssignmentSubmission, 'submission_date'),
+        ]
+        for model, timestamp_field in sources:
+            changed.update(
+                model._get_collection().distinct('student', {timestamp_field: {'$gt': since}})
+            )
+        changed.discard(None)
+        return changed
+
+    def refresh(self):
+        """Bring a loaded table up to date by re-collecting only changed students"""
+        from courses.models import Assignment
+        from students.feature_extraction import collect_student_features
+        from students.models import Student
+
+        refreshed_at = datetime.datetime.now()
+        changed = self.changed_student_ids(self.built_at)
+
+        # Drop students that were deleted or deactivated since the last build
+        active_ids = set(Student.objects.filter(is_active=True).scalar('student_id'))
+        table = self.table[self.table['student_id'].isin(active_ids)]
+
+        if changed:
+            fresh = self._to_frame(collect_student_features(student_ids=changed))
+            table = table.drop(index=fresh.index, errors='ignore')
+            table = pd.concat([table, fresh])
+
+        missing = active_ids.difference(table['student_id'])
+        if missing:
+            missing_ids = Student.objects.filter(student_id__in=list(missing)).scalar('id')
+            table = pd.concat([table, self._to_frame(collect_student_features(student_ids=missing_ids))])
+
+        # Submission rate is relative to the global assignment count
+        total_assignments = Assignment.objects.count()
+        if total_assignments != self.total_assignments:
+            if total_assignments > 0:
+                table['submission_rate'] = table['submitted_count'] / total_assignments * 100
+            else:
+                table['submission_rate'] = 0.0
+            self.total_assignments = total_assignments
+
+        self.table = table.sort_index()
+        self.built_at = refreshed_at
+        self.save()
+        return self.table
+
+    def get_table(self):
+        """Return an up-to-date feature table, building or refreshing it as needed"""
+        if self.table is None and not self.load():
+            return self.build()
+        if datetime.datetime.now() - self.built_at > self.max_age:
+            # Periodic full rebuild catches hard deletes the incremental path cannot see
+            return self.build()
+        return self.refresh()
+
+
+def get_feature_table():
+    """Convenience accessor used by the analysis modules"""
+    return StudentFeatureStore().get_table()
@@ -0,0 +1,63 @@
+"""
+Import-time profiling for web worker start-up.
+
+Runs a fresh interpreter with ``python -X importtime`` that sets Django up
+and loads the URLconf (what every web worker does on boot), then parses the
+report. Used by the ``profile_imports`` command and by a regression test
+that keeps scikit-learn, pandas and NumPy out of the start-up path - they
+are only imported when an analysis actually runs.
+"""
+
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+
+# Packages that must only be imported lazily, by the analysis code paths
+HEAVY_PACKAGES = ('sklearn', 'pandas', 'numpy', 'scipy', 'joblib')
+
+BOOT_SCRIPT = (
+    "import django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+
+
+def profile_imports(script=BOOT_SCRIPT):
+    """
+    Return [(module, self_us, cumulative_us, depth)] for every module ``script``
+    imports, in the order -X importtime reports them. ``depth`` is 0 for
+    modules imported directly by the script.
+    """
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'student_management.settings')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        cwd=str(settings.BASE_DIR),
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Import profiling failed: {completed.stderr.strip()[-500:]}")
+
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # Header row
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(fields[0]), int(fields[1]), depth))
+    return imports
+
+
+def heavy_imports(imports):
+    """Modules from HEAVY_PACKAGES that appear in a profile_imports() report"""
+    return [
+        module for module, _, _, _ in imports
+        if module.split('.')[0] in HEAVY_PACKAGES
+    ]
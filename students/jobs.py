@@ -0,0 +1,159 @@
+"""
+Background runner for the long-running ML analyses.
+
+Analyses are executed in a process pool so web workers return immediately.
+Job state lives in the ``analysis_jobs`` collection, which makes status and
+results visible to every web worker, and a unique partial index guarantees
+that concurrent submissions of the same analysis share a single job.
+"""
+
+import datetime
+import json
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .models import AnalysisJob
+
+# Analysis kind -> "module:function" run inside the worker process
+ANALYSES = {
+    'random_forest': 'students.random_forest_analysis:run_random_forest_analysis',
+    'kmeans': 'students.kmeans_clustering:run_kmeans_clustering',
+}
+
+_executor = None
+
+
+def get_executor():
+    """Process pool shared by all submissions from this web process"""
+    global _executor
+    if _executor is None:
+        # spawn gives each worker its own MongoDB connection instead of a
+        # forked copy of the parent's client
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.ANALYSIS_JOB_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        )
+    return _executor
+
+
+def _init_worker():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'student_management.settings')
+    import django
+    django.setup()
+
+
+def _to_builtin(value):
+    """json.dumps fallback for NumPy scalars and arrays in analysis results"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _expire_stale_jobs(kind):
+    """Fail active jobs whose worker must have died so new submissions are not blocked"""
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=settings.ANALYSIS_JOB_TIMEOUT)
+    AnalysisJob.objects(kind=kind, is_active=True, created_at__lt=cutoff).update(
+        set__status='failed',
+        set__is_active=False,
+        set__error='Job timed out',
+        set__finished_at=datetime.datetime.now(),
+    )
+
+
+def submit_analysis(kind, requested_by=None):
+    """
+    Enqueue an analysis, or return the job already queued/running for it.
+
+    Returns (job, created).
+    """
+    if kind not in ANALYSES:
+        raise ValueError(f"Unknown analysis: {kind}")
+
+    _expire_stale_jobs(kind)
+
+    token = uuid.uuid4().hex
+    now = datetime.datetime.now()
+    try:
+        raw = AnalysisJob._get_collection().find_one_and_update(
+            {'kind': kind, 'is_active': True},
+            {'$setOnInsert': {
+                'status': 'queued',
+                'token': token,
+                'progress': 0,
+                'message': 'Waiting for a worker',
+                'requested_by': requested_by,
+                'created_at': now,
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Lost an insert race with an identical submission; use its job
+        raw = AnalysisJob._get_collection().find_one({'kind': kind, 'is_active': True})
+
+    job = AnalysisJob._from_son(raw)
+    created = raw.get('token') == token
+    if created:
+        get_executor().submit(run_job, str(job.id))
+    return job, created
+
+
+def run_job(job_id):
+    """Worker entry point: run the analysis and store its result on the job"""
+    from importlib import import_module
+
+    job = AnalysisJob.objects.get(id=job_id)
+    job.update(
+        set__status='running',
+        set__started_at=datetime.datetime.now(),
+        set__progress=5,
+        set__message='Starting analysis',
+    )
+
+    def report(progress, message):
+        AnalysisJob.objects(id=job_id).update(set__progress=progress, set__message=message)
+
+    try:
+        module_name, function_name = ANALYSES[job.kind].split(':')
+        analysis = getattr(import_module(module_name), function_name)
+        result = analysis(progress=report)
+        result = json.loads(json.dumps(result, default=_to_builtin))
+        AnalysisJob.objects(id=job_id).update(
+            set__status='completed',
+            set__is_active=False,
+            set__progress=100,
+            set__message=result.get('message', 'Analysis completed'),
+            set__result=result,
+            set__finished_at=datetime.datetime.now(),
+        )
+    except Exception as e:
+        print(f"Analysis job {job_id} failed: {e}")
+        AnalysisJob.objects(id=job_id).update(
+            set__status='failed',
+            set__is_active=False,
+            set__error=str(e),
+            set__finished_at=datetime.datetime.now(),
+        )
+
+
+def job_status(job):
+    """Serializable status payload for polling endpoints"""
+    return {
+        'job_id': str(job.id),
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'error': job.error,
+        'created_at': job.created_at.strftime("%Y-%m-%d %H:%M:%S") if job.created_at else None,
+        'finished_at': job.finished_at.strftime("%Y-%m-%d %H:%M:%S") if job.finished_at else None,
+    }
@@ -1,16 +1,24 @@
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+from django.conf import settings
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler
 from datetime import datetime
+from pymongo import ReplaceOne
+from .model_registry import ModelRegistry
+from .models import StudentClusterAssignment
 import warnings
 warnings.filterwarnings('ignore')
 
+MODEL_REGISTRY_NAME = 'kmeans'
+
 class StudentPerformanceClusterer:
     
-    def __init__(self):
+    N_CLUSTERS = 3
+    
+    def __init__(self, incremental=False, batch_size=None, drift_threshold=None, registry=None):
         self.kmeans_model = KMeans(
-            n_clusters=3,
+            n_clusters=self.N_CLUSTERS,
             random_state=42,
             n_init=10,
             max_iter=300
@@ -20,56 +28,26 @@ class StudentPerformanceClusterer:
         self.cluster_centers = None
         self.feature_names = ['attendance_percentage', 'avg_marks', 'assignment_completion_rate']
         
+        # Incremental (mini-batch) mode settings
+        self.incremental = incremental
+        self.batch_size = batch_size or settings.KMEANS_BATCH_SIZE
+        self.drift_threshold = drift_threshold if drift_threshold is not None else settings.KMEANS_DRIFT_THRESHOLD
+        self.registry = registry or ModelRegistry(MODEL_REGISTRY_NAME)
+        self.drift = None
+        self.model_version = None
+        # Maps KMeans' arbitrary label -> stable label (0 = highest avg_marks)
+        self.label_map = None
+        
     def collect_student_data(self):
-        from students.models import Student
-        from attendance.models import DailyAttendance
-        from grades.models import StudentGrade
-        from courses.models import AssignmentSubmission
+        from students.feature_store import get_feature_table
         
         students_data = []
         
         try:
-            students = list(Student.objects.filter(is_active=True))
-            
-            for student in students:
-                # 1. Calculate real attendance percentage
-                total_attendance = DailyAttendance.objects.filter(student=student).count()
-                present_days = DailyAttendance.objects.filter(student=student, is_present=True).count()
-                
-                if total_attendance > 0:
-                    attendance_percentage = (present_days / total_attendance) * 100
-                else:
-                    # No attendance records means student never attended classes
-                    attendance_percentage = 0.0
-                
-                # 2. Calculate real average marks
-                grades = list(StudentGrade.objects.filter(student=student))
-                if len(grades) > 0:
-                    total_marks = sum(float(grade.marks_obtained) for grade in grades)
-                    avg_marks = total_marks / len(grades)
-                else:
-                    # No grades means student hasn't been evaluated yet
-                    avg_marks = 0.0
-                
-                # 3. Calculate real assignment completion rate
-                try:
-                    # Get total assignments available in the system
-                    from courses.models import Assignment
-                    total_assignments_available = Assignment.objects.count()
-                    
-                    # Get assignments submitted by this student
-                    submitted_assignments = AssignmentSubmission.objects.filter(
-                        student=student, 
-                        submission_file_path__ne=None
-                    ).filter(submission_file_path__ne="").count()
-                    
-                    if total_assignments_available > 0:
-                        assignment_completion_rate = (submitted_assignments / total_assignments_available) * 100
-                    else:
-                        assignment_completion_rate = 0.0
-                except:
-                    # If Assignment model structure is different, use 0
-                    assignment_completion_rate = 0.0
+            # Features come from the shared column store (refreshed incrementally)
+            for features in get_feature_table().to_dict('records'):
+                attendance_percentage = features['attendance_percentage']
+                avg_marks = features['avg_marks']
                 
                 # Calculate pass rate and predicted performance for display
                 predicted_performance = self._categorize_performance(avg_marks)
@@ -82,13 +60,13 @@ class StudentPerformanceClusterer:
                     pass_probability = 0.0  # No grades means no pass chance
                 
                 student_data = {
-                    'student_id': str(student.student_id),
-                    'student_name': f"{student.first_name} {student.last_name}",
-                    'program': student.program,
-                    'semester': student.current_semester,
+                    'student_id': features['student_id'],
+                    'student_name': features['student_name'],
+                    'program': features['program'],
+                    'semester': int(features['semester']),
                     'attendance_percentage': round(attendance_percentage, 1),
                     'avg_marks': round(avg_marks, 1),
-                    'assignment_completion_rate': round(assignment_completion_rate, 1),
+                    'assignment_completion_rate': round(features['submission_rate'], 1),
                     'pass_probability': round(pass_probability, 1),
                     'predicted_performance': predicted_performance,
                     'risk_level': risk_level
@@ -162,51 +140,222 @@ class StudentPerformanceClusterer:
             
             self.kmeans_model.fit(features_scaled)
             
-            self.cluster_centers = self.scaler.inverse_transform(self.kmeans_model.cluster_centers_)
+            self._set_cluster_centers()
             self.is_trained = True
+            self._save_model(len(features))
             
             return True, "K-Means clustering model trained successfully!"
             
         except Exception as e:
             return False, f"Error training clustering model: {str(e)}"
     
-    def predict_cluster(self, student_features):
+    def _set_cluster_centers(self):
+        """
+        Order centroids by average marks (highest first) so label 0 is always
+        High Performers regardless of the label order KMeans happened to use.
+        """
+        centers = self.scaler.inverse_transform(self.kmeans_model.cluster_centers_)
+        avg_marks_index = self.feature_names.index('avg_marks')
+        order = np.argsort(-centers[:, avg_marks_index], kind='stable')
+        self.label_map = np.empty(len(order), dtype=int)
+        self.label_map[order] = np.arange(len(order))
+        self.cluster_centers = centers[order]
+    
+    def _save_model(self, n_samples):
+        """Persist the fitted scaler and model so incremental runs can warm-start from them"""
+        metadata = self.registry.save(
+            {'scaler': self.scaler, 'model': self.kmeans_model},
+            fingerprint=None,
+            metrics={'n_samples': n_samples, 'drift': self.drift},
+            params={'incremental': self.incremental, 'batch_size': self.batch_size},
+        )
+        self.model_version = metadata['version']
+    
+    def _batch_features(self, rows):
+        """Feature matrix for a batch from students.feature_extraction"""
+        df = pd.DataFrame(rows).rename(columns={'submission_rate': 'assignment_completion_rate'})
+        return df[self.feature_names].fillna(0).to_numpy(dtype=float)
+    
+    def feature_batches(self, students_data):
+        """Consecutive ``batch_size`` slices of already-collected rows, for train_incremental"""
+        return [students_data[i:i + self.batch_size] for i in range(0, len(students_data), self.batch_size)]
+    
+    def train_incremental(self, batches=None):
+        """
+        Mini-batch training over feature batches. ``batches`` must be
+        re-iterable (e.g. a list from feature_batches); without it batches
+        are streamed from the database by iter_feature_batches.
+        
+        With a previously saved model, its scaler is reused and
+        MiniBatchKMeans.partial_fit is warm-started from its centroids. The
+        updated model only replaces the saved one when the centroids moved
+        further than ``drift_threshold`` (in standardised units); otherwise
+        the previous model is kept so cluster assignments stay stable.
+        """
+        from students.feature_extraction import iter_feature_batches
+        
+        def stream():
+            if batches is not None:
+                return iter(batches)
+            return iter_feature_batches(self.batch_size)
+        
+        try:
+            previous = self.registry.load()
+            n_samples = 0
+            
+            if previous:
+                artifact, metadata = previous
+                scaler = artifact['scaler']
+                previous_model = artifact['model']
+                model = MiniBatchKMeans(
+                    n_clusters=self.N_CLUSTERS,
+                    init=previous_model.cluster_centers_,
+                    n_init=1,
+                    batch_size=self.batch_size,
+                    random_state=42
+                )
+            else:
+                # First run: one pass to fit the scaler, a second to cluster
+                scaler = StandardScaler()
+                for rows in stream():
+                    if rows:
+                        scaler.partial_fit(self._batch_features(rows))
+                model = MiniBatchKMeans(
+                    n_clusters=self.N_CLUSTERS,
+                    batch_size=self.batch_size,
+                    random_state=42
+                )
+            
+            for rows in stream():
+                if not rows:
+                    continue
+                features = self._batch_features(rows)
+                if n_samples == 0 and len(features) < self.N_CLUSTERS:
+                    break
+                model.partial_fit(scaler.transform(features))
+                n_samples += len(features)
+            
+            if n_samples < self.N_CLUSTERS:
+                return False, "Insufficient data for clustering (minimum 3 students required)"
+            
+            self.scaler = scaler
+            if previous:
+                self.drift = float(np.max(np.linalg.norm(
+                    model.cluster_centers_ - previous_model.cluster_centers_, axis=1
+                )))
+                if self.drift <= self.drift_threshold:
+                    self.kmeans_model = previous_model
+                    self.model_version = metadata['version']
+                    message = (f"Clusters stable (drift {self.drift:.3f} <= {self.drift_threshold}); "
+                               f"kept model v{self.model_version}")
+                else:
+                    self.kmeans_model = model
+                    self._save_model(n_samples)
+                    message = (f"Clusters drifted by {self.drift:.3f}; "
+                               f"re-fitted incrementally as model v{self.model_version}")
+            else:
+                self.kmeans_model = model
+                self._save_model(n_samples)
+                message = f"Mini-batch K-Means model trained on {n_samples} students"
+            
+            self._set_cluster_centers()
+            self.is_trained = True
+            return True, message
+            
+        except Exception as e:
+            return False, f"Error training clustering model: {str(e)}"
+    
+    def predict_clusters(self, students_data):
+        """
+        Assign many students to clusters at once: one scaler transform, one
+        KMeans predict and a vectorised distance to each assigned centre.
+        Returns a list of per-student result dicts in input order.
+        """
         if not self.is_trained:
             return None, "Model not trained yet"
         
         try:
-            features_array = np.array([[
-                student_features['attendance_percentage'],
-                student_features['avg_marks'],
-                student_features['assignment_completion_rate']
-            ]])
+            features_array = self.prepare_features(students_data).to_numpy(dtype=float)
             
             features_scaled = self.scaler.transform(features_array)
-            cluster_label = self.kmeans_model.predict(features_scaled)[0]
+            cluster_labels = self.label_map[self.kmeans_model.predict(features_scaled)]
             
-            cluster_names = {0: "High Performers", 1: "Medium Performers", 2: "Low Performers"}
-            cluster_colors = {0: "success", 1: "warning", 2: "danger"}
+            cluster_names = StudentClusterAssignment.CLUSTER_NAMES
+            cluster_colors = StudentClusterAssignment.CLUSTER_COLORS
             
-            cluster_center = self.cluster_centers[cluster_label]
+            distances = np.linalg.norm(features_array - self.cluster_centers[cluster_labels], axis=1)
             
-            return {
-                'cluster_label': int(cluster_label),
-                'cluster_name': cluster_names[cluster_label],
-                'cluster_color': cluster_colors[cluster_label],
-                'cluster_center': {
-                    'attendance': round(cluster_center[0], 1),
-                    'avg_marks': round(cluster_center[1], 1),
-                    'assignment_completion': round(cluster_center[2], 1)
-                },
-                'distance_to_center': float(np.linalg.norm(features_array[0] - cluster_center))
-            }, "Success"
+            center_info = {
+                label: {
+                    'attendance': round(center[0], 1),
+                    'avg_marks': round(center[1], 1),
+                    'assignment_completion': round(center[2], 1)
+                }
+                for label, center in enumerate(self.cluster_centers)
+            }
+            
+            predictions = [
+                {
+                    'cluster_label': int(label),
+                    'cluster_name': cluster_names[label],
+                    'cluster_color': cluster_colors[label],
+                    'cluster_center': center_info[label],
+                    'distance_to_center': float(distance)
+                }
+                for label, distance in zip(cluster_labels.tolist(), distances)
+            ]
+            
+            return predictions, "Success"
             
         except Exception as e:
             return None, f"Clustering prediction error: {str(e)}"
     
-    def analyze_all_students(self):
+    def predict_cluster(self, student_features):
+        predictions, message = self.predict_clusters([student_features])
+        if predictions is None:
+            return None, message
+        return predictions[0], message
+    
+    def save_assignments(self, students_data):
+        """
+        Persist every student's cluster to student_cluster_assignments in one
+        bulk write, and drop assignments of students not in this run.
+        """
+        assigned_at = datetime.now()
+        operations = []
+        for student in students_data:
+            if 'cluster_label' not in student:
+                continue
+            document = StudentClusterAssignment(
+                student_id=student['student_id'],
+                student_name=student['student_name'],
+                program=student['program'],
+                semester=student['semester'],
+                cluster_label=student['cluster_label'],
+                cluster_name=student['cluster_name'],
+                distance_to_center=student['distance_to_center'],
+                attendance_percentage=student['attendance_percentage'],
+                avg_marks=student['avg_marks'],
+                assignment_completion_rate=student['assignment_completion_rate'],
+                model_version=self.model_version,
+                assigned_at=assigned_at,
+            ).to_mongo().to_dict()
+            document.pop('_id', None)
+            operations.append(ReplaceOne({'student_id': student['student_id']}, document, upsert=True))
+        
+        if not operations:
+            return 0
+        collection = StudentClusterAssignment._get_collection()
+        collection.bulk_write(operations, ordered=False)
+        collection.delete_many({'assigned_at': {'$lt': assigned_at}})
+        return len(operations)
+    
+    def analyze_all_students(self, progress=None):
+        """Run the full pipeline; ``progress(percent, message)`` is called between stages"""
         start_time = datetime.now()
         
+        if progress:
+            progress(10, 'Collecting student features')
         students_data = self.collect_student_data()
         
         if not students_data:
@@ -216,7 +365,13 @@ class StudentPerformanceClusterer:
                 'data': []
             }
         
-        train_success, train_message = self.train_model(students_data)
+        if progress:
+            progress(40, 'Training model')
+        if self.incremental:
+            # The table is already in memory for predictions; stream it instead of re-reading the database
+            train_success, train_message = self.train_incremental(self.feature_batches(students_data))
+        else:
+            train_success, train_message = self.train_model(students_data)
         
         if not train_success:
             return {
@@ -225,9 +380,11 @@ class StudentPerformanceClusterer:
                 'data': students_data
             }
         
-        for student in students_data:
-            prediction, pred_message = self.predict_cluster(student)
-            if prediction:
+        if progress:
+            progress(70, 'Generating predictions')
+        predictions, pred_message = self.predict_clusters(students_data)
+        if predictions:
+            for student, prediction in zip(students_data, predictions):
                 student.update(prediction)
         
         total_students = len(students_data)
@@ -238,13 +395,19 @@ class StudentPerformanceClusterer:
         cluster_centers_info = {}
         if self.cluster_centers is not None:
             for i, center in enumerate(self.cluster_centers):
-                cluster_names = {0: "High Performers", 1: "Medium Performers", 2: "Low Performers"}
-                cluster_centers_info[cluster_names[i]] = {
+                cluster_centers_info[StudentClusterAssignment.CLUSTER_NAMES[i]] = {
                     'attendance': round(center[0], 1),
                     'avg_marks': round(center[1], 1),
                     'assignment_completion': round(center[2], 1)
                 }
         
+        if progress:
+            progress(90, 'Saving cluster assignments')
+        try:
+            self.save_assignments(students_data)
+        except Exception as e:
+            print(f"Error saving cluster assignments: {e}")
+        
         end_time = datetime.now()
         processing_time = (end_time - start_time).total_seconds()
         
@@ -269,6 +432,8 @@ class StudentPerformanceClusterer:
         }
 
 
-def run_kmeans_clustering():
-    clusterer = StudentPerformanceClusterer()
-    return clusterer.analyze_all_students()
\ No newline at end of file
+def run_kmeans_clustering(progress=None, incremental=None):
+    if incremental is None:
+        incremental = settings.KMEANS_INCREMENTAL
+    clusterer = StudentPerformanceClusterer(incremental=incremental)
+    return clusterer.analyze_all_students(progress=progress)
\ No newline at end of file
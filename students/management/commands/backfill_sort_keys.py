@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from students.models import Student
+from students.utils import name_sort_key, roll_sort_key
+
+
+class Command(BaseCommand):
+    help = 'Compute name_sort_key/roll_sort_key for students saved before the keys existed (or whose keys are stale)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Updates sent per bulk write (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the students that need updating')
+
+    def handle(self, *args, **options):
+        collection = Student._get_collection()
+        projection = {'first_name': 1, 'last_name': 1, 'roll_number': 1,
+                      'name_sort_key': 1, 'roll_sort_key': 1}
+
+        operations = []
+        checked = updated = 0
+        for doc in collection.find({}, projection):
+            checked += 1
+            keys = {
+                'name_sort_key': name_sort_key(doc.get('first_name'), doc.get('last_name')),
+                'roll_sort_key': roll_sort_key(doc.get('roll_number')),
+            }
+            if all(doc.get(field) == value for field, value in keys.items()):
+                continue
+
+            updated += 1
+            if options['dry_run']:
+                continue
+            # Raw update on purpose: leaves updated_at alone so caches keyed on it are not invalidated
+            operations.append(UpdateOne({'_id': doc['_id']}, {'$set': keys}))
+            if len(operations) >= options['batch_size']:
+                collection.bulk_write(operations, ordered=False)
+                operations = []
+
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+
+        verb = 'would be updated' if options['dry_run'] else 'updated'
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} students, {updated} {verb}"))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from students.import_profile import HEAVY_PACKAGES, heavy_imports, profile_imports
+
+
+class Command(BaseCommand):
+    help = 'Report web worker start-up import time and fail if the ML stack is imported eagerly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20,
+                            help='Number of slowest top-level imports to list (default: 20)')
+
+    def handle(self, *args, **options):
+        imports = profile_imports()
+
+        # Direct imports only: the cumulative time of nested imports is already counted in them
+        top_level = sorted(
+            (entry for entry in imports if entry[3] == 0),
+            key=lambda entry: entry[2],
+            reverse=True,
+        )
+        total_us = sum(entry[2] for entry in top_level)
+
+        self.stdout.write(f"{'cumulative':>12}  {'self':>10}  module")
+        for module, self_us, cumulative_us, _ in top_level[:options['top']]:
+            self.stdout.write(f"{cumulative_us / 1000:>10.1f}ms  {self_us / 1000:>8.1f}ms  {module}")
+        self.stdout.write(f"{len(imports)} modules imported in {total_us / 1000:.1f}ms")
+
+        eager = heavy_imports(imports)
+        if eager:
+            raise CommandError(
+                f"{len(eager)} modules from {', '.join(HEAVY_PACKAGES)} are imported at start-up "
+                f"(first: {eager[0]}). Import them inside the analysis code instead."
+            )
+        self.stdout.write(self.style.SUCCESS('ML stack is not imported at start-up'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from students.kmeans_clustering import StudentPerformanceClusterer
+
+
+class Command(BaseCommand):
+    help = 'Re-cluster active students (intended for a nightly cron job)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Fit a fresh KMeans over all students instead of the incremental mini-batch mode')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Students per mini-batch (default: KMEANS_BATCH_SIZE)')
+        parser.add_argument('--drift-threshold', type=float, default=None,
+                            help='Centroid movement that triggers saving a re-fitted model (default: KMEANS_DRIFT_THRESHOLD)')
+
+    def handle(self, *args, **options):
+        clusterer = StudentPerformanceClusterer(
+            incremental=not options['full'],
+            batch_size=options['batch_size'],
+            drift_threshold=options['drift_threshold'],
+        )
+        result = clusterer.analyze_all_students()
+
+        if not result['success']:
+            self.stderr.write(self.style.ERROR(result['message']))
+            return
+
+        summary = result['summary']
+        self.stdout.write(summary['model_status'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Clustered {summary['total_students']} students in {summary['processing_time']}"
+        ))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from students.model_tuning import tune_random_forest
+from students.random_forest_analysis import StudentPerformancePredictor
+
+
+class Command(BaseCommand):
+    help = 'Search Random Forest hyperparameters with k-fold CV and save the best ones for the analysis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--search', choices=['grid', 'random'], default='grid',
+                            help='Exhaustive grid search or randomised search (default: grid)')
+        parser.add_argument('--folds', type=int, default=5,
+                            help='Number of cross-validation folds (default: 5)')
+        parser.add_argument('--n-iter', type=int, default=20,
+                            help='Configurations sampled by --search random (default: 20)')
+        parser.add_argument('--jobs', type=int, default=-1,
+                            help='Worker processes for the search; -1 uses every core (default: -1)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report results without saving the winning configuration')
+
+    def handle(self, *args, **options):
+        data = StudentPerformancePredictor().collect_student_data()
+        if len(data) < 5:
+            self.stderr.write(self.style.ERROR('Insufficient data for tuning (minimum 5 students required)'))
+            return
+
+        report = tune_random_forest(
+            data,
+            search=options['search'],
+            folds=options['folds'],
+            n_iter=options['n_iter'],
+            n_jobs=options['jobs'],
+            save=not options['dry_run'],
+        )
+
+        self.stdout.write(f"{'rank':>4}  {'accuracy':>14}  {'fit time':>9}  params")
+        for config in report['configurations']:
+            self.stdout.write(
+                f"{config['rank']:>4}  {config['mean_accuracy']:>7.2%} ±{config['std_accuracy']:>5.2%}"
+                f"  {config['mean_fit_time']:>8.3f}s  {config['params']}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Best of {report['candidates']} configurations ({report['folds']}-fold CV on "
+            f"{report['samples']} students, {report['search_time']:.1f}s): "
+            f"{report['best_params']} at {report['best_accuracy']:.2%}"
+        ))
+        if options['dry_run']:
+            self.stdout.write('Dry run: configuration not saved')
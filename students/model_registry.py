@@ -0,0 +1,193 @@
+"""
+Local registry for trained ML model artifacts.
+
+Each named registry lives in ANALYTICS_CACHE_DIR/models/<name>/ and holds
+versioned joblib files plus a manifest.json describing the latest version:
+its training-data fingerprint, metrics and parameters. Any worker process
+can reuse the latest artifact as long as the fingerprint of the data it is
+about to analyse matches the one the model was trained on.
+
+Several workers may save at once: each claims its version by creating the
+artifact file exclusively (O_CREAT | O_EXCL), and the manifest is only
+replaced - under a lock file, via a temp file and os.replace - when it
+would move forward, so a slow save never points it back at an older model.
+"""
+
+import datetime
+import hashlib
+import contextlib
+import json
+import os
+import tempfile
+import time
+
+import joblib
+import pandas as pd
+from django.conf import settings
+
+# Loaded artifacts, keyed by (artifact path, version), so repeated requests in
+# one process skip the joblib load as well as the training.
+_loaded_artifacts = {}
+
+
+def data_fingerprint(*frames):
+    """Stable SHA-256 fingerprint of the given DataFrames/Series contents"""
+    digest = hashlib.sha256()
+    for frame in frames:
+        hashed = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+        digest.update(hashed.tobytes())
+        if isinstance(frame, pd.DataFrame):
+            digest.update(','.join(map(str, frame.columns)).encode())
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Versioned on-disk store for one kind of model"""
+
+    KEEP_VERSIONS = 5  # Older artifact files are pruned on save
+    LOCK_TIMEOUT = 30  # Seconds after which a manifest lock is treated as left by a crashed process
+
+    def __init__(self, name, root=None):
+        root = root or os.path.join(str(settings.ANALYTICS_CACHE_DIR), 'models')
+        self.name = name
+        self.directory = os.path.join(root, name)
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        self.tuned_params_path = os.path.join(self.directory, 'tuned_params.json')
+        self.lock_path = os.path.join(self.directory, 'manifest.lock')
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, path, data):
+        """Write JSON atomically so readers never see a half-written file"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.json')
+        with os.fdopen(fd, 'w') as handle:
+            json.dump(data, handle, indent=2)
+        os.replace(tmp_path, path)
+
+    @contextlib.contextmanager
+    def _manifest_lock(self):
+        """Exclusive lock file held while the manifest is compared and replaced"""
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > self.LOCK_TIMEOUT:
+                        os.remove(self.lock_path)
+                        continue
+                except OSError:
+                    continue  # Released meanwhile
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(self.lock_path)
+
+    def _artifact_versions(self):
+        versions = []
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith('v') and filename.endswith('.joblib')):
+                continue
+            try:
+                versions.append(int(filename[1:-len('.joblib')]))
+            except ValueError:
+                continue
+        return versions
+
+    def _claim_version(self):
+        """(version, open file) for the next free artifact name, created exclusively"""
+        previous = self.latest()
+        version = max([previous['version'] if previous else 0, *self._artifact_versions()]) + 1
+        while True:
+            artifact_name = f'v{version}.joblib'
+            try:
+                fd = os.open(os.path.join(self.directory, artifact_name), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                version += 1  # Claimed by a concurrent save
+                continue
+            return version, os.fdopen(fd, 'wb')
+
+    def latest(self):
+        """Metadata for the latest saved version, or None"""
+        return self._read_json(self.manifest_path)
+
+    def load(self, fingerprint=None):
+        """
+        Return (artifact, metadata) for the latest version.
+
+        When ``fingerprint`` is given, None is returned unless the latest
+        version was trained on data with that fingerprint.
+        """
+        metadata = self.latest()
+        if metadata is None:
+            return None
+        if fingerprint is not None and metadata.get('fingerprint') != fingerprint:
+            return None
+
+        path = os.path.join(self.directory, metadata['artifact'])
+        key = (path, metadata['version'])
+        if key not in _loaded_artifacts:
+            try:
+                _loaded_artifacts[key] = joblib.load(path)
+            except (OSError, EOFError, ValueError) as e:
+                print(f"Could not load model artifact {path}: {e}")
+                return None
+        return _loaded_artifacts[key], metadata
+
+    def save(self, artifact, fingerprint, metrics=None, params=None):
+        """Persist a new version and point the manifest at it"""
+        os.makedirs(self.directory, exist_ok=True)
+        version, handle = self._claim_version()
+        artifact_name = f'v{version}.joblib'
+        try:
+            with handle:
+                joblib.dump(artifact, handle)
+        except Exception:
+            os.remove(os.path.join(self.directory, artifact_name))
+            raise
+
+        metadata = {
+            'name': self.name,
+            'version': version,
+            'artifact': artifact_name,
+            'fingerprint': fingerprint,
+            'metrics': metrics or {},
+            'params': params or {},
+            'trained_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with self._manifest_lock():
+            current = self.latest()
+            if current is None or current['version'] < version:
+                self._write_json(self.manifest_path, metadata)
+                self._prune(version)
+
+        _loaded_artifacts[(os.path.join(self.directory, artifact_name), version)] = artifact
+        return metadata
+
+    def tuned_params(self):
+        """Hyperparameters chosen by the last tuning run, or None"""
+        tuned = self._read_json(self.tuned_params_path)
+        return tuned['params'] if tuned else None
+
+    def save_tuned_params(self, params, metrics=None):
+        """Record the winning configuration of a hyperparameter search"""
+        self._write_json(self.tuned_params_path, {
+            'params': params,
+            'metrics': metrics or {},
+            'tuned_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        })
+
+    def _prune(self, current_version):
+        """Delete artifact files more than KEEP_VERSIONS versions old"""
+        for version in self._artifact_versions():
+            if version <= current_version - self.KEEP_VERSIONS:
+                os.remove(os.path.join(self.directory, f'v{version}.joblib'))
@@ -0,0 +1,106 @@
+"""
+Hyperparameter search for the Random Forest predictor.
+
+Runs a grid or randomised search with k-fold cross-validation; the candidate
+fits are spread over a process pool (``n_jobs=-1`` uses every core). The
+winning configuration is stored in the model registry, where
+run_random_forest_analysis picks it up for the regular analysis path.
+"""
+
+import time
+
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import GridSearchCV, KFold, RandomizedSearchCV, StratifiedKFold
+
+from .model_registry import ModelRegistry
+from .random_forest_analysis import MODEL_REGISTRY_NAME, StudentPerformancePredictor
+
+PARAM_GRID = {
+    'n_estimators': [50, 100, 200],
+    'max_depth': [None, 5, 10],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': ['sqrt', 1.0],
+}
+
+
+def _cross_validator(labels, folds):
+    """Stratified folds when every class has enough members, plain k-fold otherwise"""
+    counts = labels.value_counts()
+    if len(counts) > 1 and counts.min() >= folds:
+        return StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    return KFold(n_splits=folds, shuffle=True, random_state=42)
+
+
+def tune_random_forest(data, search='grid', folds=5, n_iter=20, n_jobs=-1,
+                       param_grid=None, registry=None, save=True):
+    """
+    Search Random Forest hyperparameters on ``data`` (rows as produced by
+    StudentPerformancePredictor.collect_student_data).
+
+    Returns a dict with the best parameters, their mean CV accuracy, the
+    total search time and one entry per configuration with its mean fit
+    time and accuracy, best first.
+    """
+    param_grid = param_grid or PARAM_GRID
+    df = pd.DataFrame(data)
+    X = df[StudentPerformancePredictor.FEATURES].fillna(0)
+    y = df['pass_fail_label']
+
+    folds = min(folds, len(df))
+    if folds < 2:
+        raise ValueError("Need at least 2 students to cross-validate")
+
+    # Each candidate fits single-threaded; the search parallelises across candidates and folds
+    estimator = RandomForestClassifier(random_state=42, n_jobs=1, bootstrap=True)
+    cv = _cross_validator(y, folds)
+    if search == 'random':
+        searcher = RandomizedSearchCV(
+            estimator, param_grid, n_iter=n_iter, cv=cv, scoring='accuracy',
+            n_jobs=n_jobs, random_state=42, refit=False
+        )
+    elif search == 'grid':
+        searcher = GridSearchCV(estimator, param_grid, cv=cv, scoring='accuracy', n_jobs=n_jobs, refit=False)
+    else:
+        raise ValueError(f"Unknown search strategy: {search}")
+
+    start = time.perf_counter()
+    searcher.fit(X, y)
+    elapsed = time.perf_counter() - start
+
+    results = searcher.cv_results_
+    configurations = sorted(
+        (
+            {
+                'params': params,
+                'mean_accuracy': float(results['mean_test_score'][i]),
+                'std_accuracy': float(results['std_test_score'][i]),
+                'mean_fit_time': float(results['mean_fit_time'][i]),
+                'rank': int(results['rank_test_score'][i]),
+            }
+            for i, params in enumerate(results['params'])
+        ),
+        key=lambda config: (config['rank'], config['mean_fit_time'])
+    )
+
+    best = configurations[0]
+    report = {
+        'best_params': best['params'],
+        'best_accuracy': best['mean_accuracy'],
+        'search': search,
+        'folds': folds,
+        'candidates': len(configurations),
+        'samples': len(df),
+        'search_time': elapsed,
+        'configurations': configurations,
+    }
+
+    if save:
+        registry = registry or ModelRegistry(MODEL_REGISTRY_NAME)
+        registry.save_tuned_params(best['params'], metrics={
+            'cv_accuracy': best['mean_accuracy'],
+            'cv_folds': folds,
+            'samples': len(df),
+            'search': search,
+        })
+    return report
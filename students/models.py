@@ -1,7 +1,9 @@
 # Replace your students/models.py with this fixed version:
 
-from mongoengine import Document, StringField, EmailField, DateTimeField, ReferenceField, ListField, FloatField, IntField, BooleanField, DateField
+from mongoengine import Document, StringField, EmailField, DateTimeField, ReferenceField, ListField, FloatField, IntField, BooleanField, DateField, DictField
 from accounts.models import UserProfile
+from .search_index import index_student, unindex_student
+from .utils import name_sort_key, roll_sort_key
 import datetime
 
 class Student(Document):
@@ -48,6 +50,10 @@ class Student(Document):
     batch = StringField(max_length=20)
     roll_number = StringField(max_length=20)
     
+    # Precomputed sort keys so the student list can sort in MongoDB (set on save)
+    name_sort_key = StringField()
+    roll_sort_key = StringField()
+    
     # Emergency Contact
     emergency_contact_name = StringField(max_length=100)
     emergency_contact_phone = StringField(max_length=20)
@@ -67,20 +73,56 @@ class Student(Document):
             'email',
             'program',
             'current_semester',
-            'is_active'
+            'is_active',
+            'updated_at',
+            'name_sort_key',
+            'roll_sort_key',
+            ('current_semester', 'roll_sort_key'),
+            # Relevance-ranked search (StudentViewSet.search); no stemming for names/ids
+            {
+                'fields': ['$student_id', '$first_name', '$last_name', '$email', '$phone_number'],
+                'name': 'student_search_text',
+                'default_language': 'none',
+                'weights': {'student_id': 10, 'first_name': 5, 'last_name': 5, 'email': 3, 'phone_number': 2},
+            }
         ]
     }
     
     def save(self, *args, **kwargs):
         """Override save to update timestamp and sync enrollment"""
         self.updated_at = datetime.datetime.now()
+        self.name_sort_key = name_sort_key(self.first_name, self.last_name)
+        self.roll_sort_key = roll_sort_key(self.roll_number)
+        semester_changed = self.pk is None or 'current_semester' in (self._get_changed_fields() or [])
         result = super().save(*args, **kwargs)
         
         # Sync StudentEnrollment when student's semester changes
         self.sync_enrollment()
         
+        # New or promoted students get their fee records for every semester so far
+        if semester_changed:
+            self.provision_fee_ledger()
+        
+        # Keep this process's search index current
+        index_student(self)
+        
         return result
     
+    def delete(self, *args, **kwargs):
+        """Override delete to drop the student from the search index"""
+        result = super().delete(*args, **kwargs)
+        unindex_student(self)
+        return result
+    
+    def provision_fee_ledger(self):
+        """Create any missing StudentFeeRecord up to the current semester"""
+        from courses.fee_ledger import provision_fee_records
+        
+        try:
+            provision_fee_records([self])
+        except Exception as e:
+            print(f"Error provisioning fee records for {self.student_id}: {e}")
+    
     def sync_enrollment(self):
         """Ensure StudentEnrollment is synced with this student's current_semester"""
         from courses.models import StudentEnrollment
@@ -145,4 +187,97 @@ class StudentDocument(Document):
     }
     
     def __str__(self):
-        return f"{self.title} - {self.student.full_name}"
\ No newline at end of file
+        return f"{self.title} - {self.student.full_name}"
+
+
+class AnalysisJob(Document):
+    """Background run of one of the ML analyses (Random Forest, K-Means)"""
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = StringField(max_length=30, required=True)
+    status = StringField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    # True while queued/running; a unique partial index on (kind, is_active)
+    # lets only one active job of each kind exist at a time
+    is_active = BooleanField(default=True)
+    token = StringField(max_length=40)  # Identifies the submission that created the job
+    
+    progress = IntField(default=0)  # 0-100
+    message = StringField()
+    result = DictField()
+    error = StringField()
+    
+    requested_by = StringField(max_length=254)  # Email of the requesting user
+    created_at = DateTimeField(default=datetime.datetime.now)
+    started_at = DateTimeField()
+    finished_at = DateTimeField()
+    
+    meta = {
+        'collection': 'analysis_jobs',
+        'indexes': [
+            {
+                'fields': ['kind'],
+                'name': 'one_active_job_per_kind',
+                'unique': True,
+                'partialFilterExpression': {'is_active': True},
+            },
+            ('kind', '-created_at'),
+        ]
+    }
+    
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
+    
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+
+class StudentClusterAssignment(Document):
+    """Latest K-Means cluster of each student, written after every clustering run"""
+    
+    # Cluster labels are ordered by centroid average marks, highest first
+    CLUSTER_NAMES = {0: 'High Performers', 1: 'Medium Performers', 2: 'Low Performers'}
+    CLUSTER_COLORS = {0: 'success', 1: 'warning', 2: 'danger'}
+    
+    student_id = StringField(max_length=50, required=True, unique=True)
+    student_name = StringField(max_length=200)
+    program = StringField(max_length=10)
+    semester = IntField()
+    
+    cluster_label = IntField(required=True)
+    cluster_name = StringField(max_length=50)
+    distance_to_center = FloatField()
+    
+    # Features the assignment was computed from
+    attendance_percentage = FloatField()
+    avg_marks = FloatField()
+    assignment_completion_rate = FloatField()
+    
+    model_version = IntField()
+    assigned_at = DateTimeField(default=datetime.datetime.now)
+    
+    meta = {
+        'collection': 'student_cluster_assignments',
+        'indexes': [
+            ('cluster_label', 'semester', 'distance_to_center'),
+            'semester',
+            'assigned_at',
+        ]
+    }
+    
+    def __str__(self):
+        return f"{self.student_id}: {self.cluster_name}"
+    
+    @classmethod
+    def members(cls, cluster_label, semester=None):
+        """Students in a cluster (optionally one semester), closest to the centre first"""
+        filters = {'cluster_label': cluster_label}
+        if semester:
+            filters['semester'] = semester
+        return cls.objects.filter(**filters).order_by('distance_to_center')
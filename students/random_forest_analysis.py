@@ -4,108 +4,71 @@ from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 from datetime import datetime, timedelta
+import json
+from .model_registry import ModelRegistry, data_fingerprint
 import warnings
 warnings.filterwarnings('ignore')
 
+MODEL_REGISTRY_NAME = 'random_forest'
+
 class StudentPerformancePredictor:
     
-    def __init__(self):
+    FEATURES = ['attendance_percentage', 'avg_assignment_score', 'avg_grade_score',
+                'semester', 'total_subjects', 'pass_rate']
+    
+    # Used until a tuning run (manage.py tune_random_forest) has saved better ones
+    DEFAULT_PARAMS = {
+        'n_estimators': 3,
+        'max_depth': 3,
+        'min_samples_split': 2,
+        'min_samples_leaf': 1,
+    }
+    
+    def __init__(self, params=None):
+        self.params = {**self.DEFAULT_PARAMS, **(params or {})}
+        # Single-threaded: analyses already run ANALYSIS_JOB_WORKERS at a time in a process pool
         self.classification_model = RandomForestClassifier(
-            n_estimators=3,
             random_state=42,
-            max_depth=3,
             n_jobs=1,
-            warm_start=False,
             bootstrap=True,
-            min_samples_split=2,
-            min_samples_leaf=1
+            **self.params
         )
         self.regression_model = RandomForestRegressor(
-            n_estimators=3,
             random_state=42,
-            max_depth=3,
             n_jobs=1,
-            warm_start=False,
             bootstrap=True,
-            min_samples_split=2,
-            min_samples_leaf=1
+            **self.params
         )
         self.is_trained = False
+        self.feature_names = self.FEATURES
+        self.metrics = {}
+        self.model_version = None
         
     def collect_student_data(self):
-        from students.models import Student
-        from attendance.models import DailyAttendance
-        from grades.models import StudentGrade
-        from courses.models import AssignmentSubmission
-        # MongoDB imports - no need for Django ORM
+        from students.feature_store import get_feature_table
         
         students_data = []
         
         try:
-            students = list(Student.objects.filter(is_active=True))
-            
-            for student in students:
-                # 1. Calculate real attendance percentage
-                total_attendance = DailyAttendance.objects.filter(student=student).count()
-                present_days = DailyAttendance.objects.filter(student=student, is_present=True).count()
-                
-                if total_attendance > 0:
-                    attendance_percentage = (present_days / total_attendance) * 100
-                else:
-                    # No attendance records means student never attended classes
-                    attendance_percentage = 0.0
+            # Features come from the shared column store (refreshed incrementally)
+            for features in get_feature_table().to_dict('records'):
+                attendance_percentage = features['attendance_percentage']
+                avg_assignment_score = features['submission_rate']
+                avg_grade_score = features['avg_marks']
+                pass_rate = features['pass_rate']
                 
-                # 2. Calculate real average assignment scores
-                try:
-                    # Get total assignments available in the system
-                    from courses.models import Assignment
-                    total_assignments_available = Assignment.objects.count()
-                    
-                    # Get assignments submitted by this student
-                    submitted_assignments = AssignmentSubmission.objects.filter(
-                        student=student, 
-                        submission_file_path__ne=None
-                    ).filter(submission_file_path__ne="").count()
-                    
-                    if total_assignments_available > 0:
-                        avg_assignment_score = (submitted_assignments / total_assignments_available) * 100
-                    else:
-                        avg_assignment_score = 0.0
-                except:
-                    avg_assignment_score = 0.0
-                
-                # 3. Calculate real average grade scores
-                grades = list(StudentGrade.objects.filter(student=student))
-                if len(grades) > 0:
-                    total_marks = sum(float(grade.marks_obtained) for grade in grades)
-                    avg_grade_score = total_marks / len(grades)
-                else:
-                    # No grades means student hasn't been evaluated yet
-                    avg_grade_score = 0.0
-                
-                # 4. Calculate pass rate based on grades
-                if len(grades) > 0:
-                    passing_grades = len([g for g in grades if float(g.marks_obtained) >= 40])  # Assuming 40+ is pass
-                    pass_rate = (passing_grades / len(grades)) * 100
-                else:
-                    pass_rate = 0.0  # No grades means no pass rate
-                
-                # 5. Calculate total subjects (real count or estimate)
-                unique_subjects = set()
-                for grade in grades:
-                    if hasattr(grade, 'subject') and grade.subject:
-                        unique_subjects.add(str(grade.subject))
-                total_subjects = len(unique_subjects) if unique_subjects else 5
+                # Subject count falls back to an estimate when no grades exist yet
+                total_subjects = int(features['subject_count']) or 5
                 
                 overall_performance = avg_grade_score
                 performance_label = self._categorize_performance(overall_performance)
                 pass_fail_label = 1 if pass_rate >= 60 else 0  # 60% pass rate threshold
                 
                 student_data = {
-                    'student_id': str(student.student_id),
-                    'student_name': f"{student.first_name} {student.last_name}",
-                    'program': student.program,
-                    'semester': student.current_semester,
+                    'student_id': features['student_id'],
+                    'student_name': features['student_name'],
+                    'program': features['program'],
+                    'semester': int(features['semester']),
                     'attendance_percentage': round(attendance_percentage, 1),
                     'avg_assignment_score': round(avg_assignment_score, 1),
                     'avg_grade_score': round(avg_grade_score, 1),
@@ -177,8 +140,7 @@ class StudentPerformancePredictor:
         try:
             df = pd.DataFrame(data)
             
-            features = ['attendance_percentage', 'avg_assignment_score', 'avg_grade_score', 
-                       'semester', 'total_subjects', 'pass_rate']
+            features = self.FEATURES
             
             X = df[features].fillna(0)
             
@@ -205,28 +167,71 @@ class StudentPerformancePredictor:
             
             self.is_trained = True
             self.feature_names = features
+            self.metrics = {'accuracy': float(accuracy), 'training_samples': len(X)}
             
             return True, f"Model trained successfully! Accuracy: {accuracy:.2%}"
             
         except Exception as e:
             return False, f"Error training model: {str(e)}"
     
-    def predict_student_performance(self, student_features):
+    def training_fingerprint(self, data):
+        """Fingerprint of the features and labels a model would be trained on"""
+        df = pd.DataFrame(data)
+        # Hyperparameters are part of the fingerprint so newly tuned ones trigger a retrain
+        params = pd.Series([json.dumps(self.params, sort_keys=True)])
+        return data_fingerprint(df[self.FEATURES].fillna(0), df['pass_fail_label'], df['avg_grade_score'], params)
+    
+    def load_or_train(self, data, registry=None):
+        """
+        Reuse the registered model when it was trained on identical data,
+        otherwise train a new one and register it as the next version.
+        """
+        if len(data) < 5:
+            return False, "Insufficient data for training (minimum 5 students required)"
+        
+        registry = registry or ModelRegistry(MODEL_REGISTRY_NAME)
+        fingerprint = self.training_fingerprint(data)
+        
+        cached = registry.load(fingerprint)
+        if cached:
+            artifact, metadata = cached
+            self.classification_model = artifact['classifier']
+            self.regression_model = artifact['regressor']
+            self.feature_names = artifact['feature_names']
+            self.metrics = metadata['metrics']
+            self.model_version = metadata['version']
+            self.is_trained = True
+            return True, f"Using saved model v{self.model_version}. Accuracy: {self.metrics.get('accuracy', 0):.2%}"
+        
+        train_success, train_message = self.train_model(data)
+        if train_success:
+            metadata = registry.save(
+                {
+                    'classifier': self.classification_model,
+                    'regressor': self.regression_model,
+                    'feature_names': self.feature_names,
+                },
+                fingerprint,
+                metrics=self.metrics,
+                params=self.params,
+            )
+            self.model_version = metadata['version']
+        return train_success, train_message
+    
+    def predict_batch(self, students_data):
+        """
+        Predict for many students at once: one predict_proba and one predict
+        call over the whole feature matrix. Returns a list of per-student
+        result dicts in the same order as ``students_data``.
+        """
         if not self.is_trained:
             return None, "Model not trained yet"
         
         try:
-            features_array = np.array([[
-                student_features['attendance_percentage'],
-                student_features['avg_assignment_score'], 
-                student_features['avg_grade_score'],
-                student_features['semester'],
-                student_features['total_subjects'],
-                student_features['pass_rate']
-            ]])
+            features = pd.DataFrame(students_data)[self.feature_names].fillna(0)
             
-            pass_fail_prob = self.classification_model.predict_proba(features_array)[0]
-            predicted_grade = self.regression_model.predict(features_array)[0]
+            pass_fail_prob = self.classification_model.predict_proba(features)
+            predicted_grades = np.round(self.regression_model.predict(features), 2)
             
             feature_importance = dict(zip(
                 self.feature_names, 
@@ -234,30 +239,48 @@ class StudentPerformancePredictor:
             ))
             
             # Handle single class prediction scenario
-            if len(pass_fail_prob) == 1:
+            if pass_fail_prob.shape[1] == 1:
                 # If only one class exists, assume it's the pass class
-                pass_probability = 100.0
-                fail_probability = 0.0
+                pass_probability = np.full(len(features), 100.0)
+                fail_probability = np.zeros(len(features))
             else:
-                pass_probability = round(pass_fail_prob[1] * 100, 2)
-                fail_probability = round(pass_fail_prob[0] * 100, 2)
+                pass_probability = np.round(pass_fail_prob[:, 1] * 100, 2)
+                fail_probability = np.round(pass_fail_prob[:, 0] * 100, 2)
             
-            prediction_result = {
-                'pass_probability': pass_probability,
-                'fail_probability': fail_probability,
-                'predicted_grade_score': round(predicted_grade, 2),
-                'predicted_performance': self._categorize_performance(predicted_grade),
-                'feature_importance': feature_importance
-            }
+            predicted_performance = np.select(
+                [predicted_grades >= 75, predicted_grades >= 60], ['High', 'Medium'], default='Low'
+            )
             
-            return prediction_result, "Prediction successful"
+            predictions = [
+                {
+                    'pass_probability': float(pass_p),
+                    'fail_probability': float(fail_p),
+                    'predicted_grade_score': float(grade),
+                    'predicted_performance': str(performance),
+                    'feature_importance': feature_importance
+                }
+                for pass_p, fail_p, grade, performance in zip(
+                    pass_probability, fail_probability, predicted_grades, predicted_performance
+                )
+            ]
+            
+            return predictions, "Prediction successful"
             
         except Exception as e:
             return None, f"Prediction error: {str(e)}"
     
-    def analyze_all_students(self):
+    def predict_student_performance(self, student_features):
+        predictions, message = self.predict_batch([student_features])
+        if predictions is None:
+            return None, message
+        return predictions[0], message
+    
+    def analyze_all_students(self, progress=None):
+        """Run the full pipeline; ``progress(percent, message)`` is called between stages"""
         start_time = datetime.now()
         
+        if progress:
+            progress(10, 'Collecting student features')
         students_data = self.collect_student_data()
         
         if not students_data:
@@ -267,7 +290,9 @@ class StudentPerformancePredictor:
                 'data': []
             }
         
-        train_success, train_message = self.train_model(students_data)
+        if progress:
+            progress(40, 'Training model')
+        train_success, train_message = self.load_or_train(students_data)
         
         if not train_success:
             return {
@@ -276,9 +301,11 @@ class StudentPerformancePredictor:
                 'data': students_data
             }
         
-        for student in students_data:
-            prediction, pred_message = self.predict_student_performance(student)
-            if prediction:
+        if progress:
+            progress(70, 'Generating predictions')
+        predictions, pred_message = self.predict_batch(students_data)
+        if predictions:
+            for student, prediction in zip(students_data, predictions):
                 student.update(prediction)
         
         total_students = len(students_data)
@@ -295,6 +322,7 @@ class StudentPerformancePredictor:
             'medium_risk_count': medium_risk, 
             'low_risk_count': low_risk,
             'model_accuracy': train_message,
+            'model_version': self.model_version,
             'processing_time': f"{processing_time:.2f} seconds",
             'analysis_date': end_time.strftime("%Y-%m-%d %H:%M:%S")
         }
@@ -309,6 +337,6 @@ class StudentPerformancePredictor:
         }
 
 
-def run_random_forest_analysis():
-    predictor = StudentPerformancePredictor()
-    return predictor.analyze_all_students()
\ No newline at end of file
+def run_random_forest_analysis(progress=None):
+    predictor = StudentPerformancePredictor(params=ModelRegistry(MODEL_REGISTRY_NAME).tuned_params())
+    return predictor.analyze_all_students(progress=progress)
\ No newline at end of file
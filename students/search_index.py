@@ -0,0 +1,277 @@
+"""
+In-memory search index for the student list.
+
+Every searchable field is normalised to lower case and broken into
+trigrams; a query of three or more characters intersects the posting sets
+of its trigrams, so only students sharing all of them are checked for a
+real substring match. Shorter queries use a sorted word list and bisect
+for prefix matches. Results are ranked by where and how well each field
+matched, or sorted by name or roll number. The student list's filters
+(semester, program, active) are stored and applied here too, so a broad
+query never sends every matching id to MongoDB - only the page's.
+
+One index is kept per process. It is built on first use, updated in place
+by Student.save()/delete(), and re-synced from MongoDB every
+SEARCH_INDEX_SYNC_INTERVAL seconds so changes made by other web workers
+show up as well.
+"""
+
+import bisect
+import datetime
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from .utils import roll_sort_key
+
+# Field -> weight of a match in that field when ranking results
+SEARCH_FIELDS = {
+    'student_id': 4,
+    'first_name': 3,
+    'last_name': 3,
+    'email': 2,
+    'phone_number': 1,
+}
+
+# Derived fields indexed alongside, so "alice smith" finds Alice Smith
+DERIVED_FIELDS = {'full_name': 2}
+
+# Stored as-is (not searched) to filter and sort matches
+ATTRIBUTE_FIELDS = ('current_semester', 'program', 'is_active', 'roll_number')
+SORTS = ('relevance', 'name', 'roll')
+
+GRAM_SIZE = 3
+
+# Match quality multipliers
+EXACT_MATCH = 3
+PREFIX_MATCH = 2
+INFIX_MATCH = 1
+
+_WORD_SPLIT = re.compile(r'[^a-z0-9]+')
+
+
+def _normalise(value):
+    return str(value).strip().lower() if value else ''
+
+
+def _grams(text):
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def _words(text):
+    return {word for word in _WORD_SPLIT.split(text) if word} | ({text} if text else set())
+
+
+class StudentSearchIndex:
+    """Trigram + prefix index over the student search fields"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._fields = {}       # doc key -> {field: normalised value}
+        self._attributes = {}   # doc key -> {attribute: raw value}
+        self._grams = {}        # trigram -> set of doc keys
+        self._words = []        # sorted words, for short prefix queries
+        self._words_dirty = False
+        self._word_docs = {}    # word -> set of doc keys
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def keys(self):
+        return list(self._fields)
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    def add(self, student):
+        """Index (or re-index) one student document or dict"""
+        if isinstance(student, dict):
+            key = str(student.get('_id', student.get('id')))
+            values = {field: _normalise(student.get(field)) for field in SEARCH_FIELDS}
+            attributes = {field: student.get(field) for field in ATTRIBUTE_FIELDS}
+        else:
+            key = str(student.id)
+            values = {field: _normalise(getattr(student, field, '')) for field in SEARCH_FIELDS}
+            attributes = {field: getattr(student, field, None) for field in ATTRIBUTE_FIELDS}
+        values['full_name'] = f"{values['first_name']} {values['last_name']}".strip()
+
+        with self._lock:
+            if self._fields.get(key) == values:
+                self._attributes[key] = attributes  # Only filters/sort keys changed
+                return
+            self.remove(key)
+            self._fields[key] = values
+            self._attributes[key] = attributes
+            for value in values.values():
+                for gram in _grams(value):
+                    self._grams.setdefault(gram, set()).add(key)
+                for word in _words(value):
+                    docs = self._word_docs.get(word)
+                    if docs is None:
+                        docs = self._word_docs[word] = set()
+                        self._words_dirty = True
+                    docs.add(key)
+
+    def remove(self, key):
+        """Drop a student from the index; unknown keys are ignored"""
+        key = str(key)
+        with self._lock:
+            values = self._fields.pop(key, None)
+            self._attributes.pop(key, None)
+            if values is None:
+                return
+            for value in values.values():
+                for gram in _grams(value):
+                    docs = self._grams.get(gram)
+                    if docs is not None:
+                        docs.discard(key)
+                        if not docs:
+                            del self._grams[gram]
+                for word in _words(value):
+                    docs = self._word_docs.get(word)
+                    if docs is not None:
+                        docs.discard(key)
+                        if not docs:
+                            del self._word_docs[word]
+                            self._words_dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._fields.clear()
+            self._attributes.clear()
+            self._grams.clear()
+            self._words.clear()
+            self._words_dirty = False
+            self._word_docs.clear()
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+    def _candidates(self, query):
+        if len(query) >= GRAM_SIZE:
+            postings = [self._grams.get(gram) for gram in _grams(query)]
+            if not all(postings):
+                return set()
+            postings.sort(key=len)
+            return set(postings[0]).intersection(*postings[1:])
+
+        # Short query: every word starting with it, found by bisecting the sorted word list
+        if self._words_dirty:
+            # Re-sorted lazily so bulk builds and writes do not pay for it per word
+            self._words = sorted(self._word_docs)
+            self._words_dirty = False
+        candidates = set()
+        position = bisect.bisect_left(self._words, query)
+        while position < len(self._words) and self._words[position].startswith(query):
+            candidates.update(self._word_docs[self._words[position]])
+            position += 1
+        return candidates
+
+    def _score(self, key, query):
+        score = 0
+        for field, value in self._fields[key].items():
+            if not value or query not in value:
+                continue
+            if value == query:
+                quality = EXACT_MATCH
+            elif value.startswith(query) or any(word.startswith(query) for word in _WORD_SPLIT.split(value)):
+                quality = PREFIX_MATCH
+            else:
+                quality = INFIX_MATCH
+            score += (SEARCH_FIELDS.get(field) or DERIVED_FIELDS[field]) * quality
+        return score
+
+    def _sort_key(self, key, sort):
+        fields = self._fields[key]
+        if sort == 'roll':
+            return roll_sort_key(self._attributes[key].get('roll_number')), fields['student_id'], key
+        return f"{fields['first_name']} {fields['last_name']}", fields['student_id'], key
+
+    def search(self, query, limit=None, filters=None, sort='relevance'):
+        """
+        Keys of students matching ``query`` in any search field and every
+        ``filters`` attribute (exact values), best match first or sorted by
+        'name'/'roll'. Queries shorter than three characters match word
+        prefixes only.
+        """
+        query = _normalise(query)
+        if not query:
+            return []
+        filters = filters or {}
+
+        with self._lock:
+            scored = []
+            for key in self._candidates(query):
+                attributes = self._attributes[key]
+                if any(attributes.get(field) != value for field, value in filters.items()):
+                    continue
+                score = self._score(key, query)
+                if score:
+                    if sort == 'relevance':
+                        fields = self._fields[key]
+                        scored.append((-score, fields['first_name'], fields['last_name'], key))
+                    else:
+                        scored.append(self._sort_key(key, sort))
+        scored.sort()
+        keys = [entry[-1] for entry in scored]
+        return keys[:limit] if limit else keys
+
+
+# ----------------------------------------------------------------------
+# Process-wide index
+# ----------------------------------------------------------------------
+_index = StudentSearchIndex()
+_sync_lock = threading.Lock()
+_state = {'synced_at': None, 'checked_at': 0.0}
+
+
+def _load_students(**filters):
+    from students.models import Student
+    return Student.objects.filter(**filters).only(*SEARCH_FIELDS, *ATTRIBUTE_FIELDS).as_pymongo()
+
+
+def get_search_index():
+    """The process-wide index, built on first use and periodically re-synced"""
+    from students.models import Student
+
+    interval = settings.SEARCH_INDEX_SYNC_INTERVAL
+    if _state['synced_at'] is not None and time.monotonic() - _state['checked_at'] < interval:
+        return _index
+
+    with _sync_lock:
+        now = datetime.datetime.now()
+        if _state['synced_at'] is None:
+            _index.clear()
+            for student in _load_students():
+                _index.add(student)
+        else:
+            for student in _load_students(updated_at__gte=_state['synced_at']):
+                _index.add(student)
+            # Deletes leave no trace to query for; resync keys when the counts disagree
+            if Student.objects.count() != len(_index):
+                live = {str(key) for key in Student.objects.scalar('id')}
+                for key in _index.keys():
+                    if key not in live:
+                        _index.remove(key)
+                for student in _load_students(id__in=[key for key in live if key not in _index]):
+                    _index.add(student)
+        _state['synced_at'] = now
+        _state['checked_at'] = time.monotonic()
+    return _index
+
+
+def index_student(student):
+    """Called from Student.save(); a no-op until the index has been built"""
+    if _state['synced_at'] is not None:
+        _index.add(student)
+
+
+def unindex_student(student):
+    """Called from Student.delete()"""
+    if _state['synced_at'] is not None:
+        _index.remove(student.id)
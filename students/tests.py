@@ -5,9 +5,30 @@ Tests: utility functions, algorithms, views access control, API endpoints.
 from django.test import TestCase
 from django.urls import reverse, resolve
 from accounts.models import User
-from test_helpers import SafeClient as Client
-from students.utils import sort_students_by_name, sort_students_by_roll
+from test_helpers import SafeClient as Client, mongomock_database
+from students.utils import (
+    SEARCH_RESULT_FIELDS, sort_students_by_name, sort_students_by_roll, build_search_pipeline, roll_sort_key,
+    name_sort_key
+)
 from students.algorithms import binary_search_students
+from students.search_index import StudentSearchIndex
+from students.feature_extraction import (
+    attendance_by_student, build_feature_rows, grades_by_student, iter_feature_batches, submissions_by_student
+)
+from students.feature_store import StudentFeatureStore
+from students.model_registry import ModelRegistry, data_fingerprint
+from students.model_tuning import tune_random_forest
+from students.import_profile import heavy_imports, profile_imports
+from students.random_forest_analysis import StudentPerformancePredictor
+from students.kmeans_clustering import StudentPerformanceClusterer
+from students.models import AnalysisJob
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from bson import ObjectId
+import datetime
+import mongomock
+import os
+import tempfile
 import string
 import secrets
 
@@ -145,6 +166,32 @@ class SortStudentsByRollTest(TestCase):
         self.assertEqual(sorted_students[1].roll_number, '10')
 
 
+class SortKeyTest(TestCase):
+    """Test the stored sort keys match the in-Python sort order"""
+
+    def test_roll_sort_key_matches_sort_students_by_roll(self):
+        rolls = ['10', None, 'A2', '2', '', '007', 'A10', '100']
+        students = [MockStudent(str(i), str(i), roll_number=roll) for i, roll in enumerate(rolls)]
+        expected = [s.roll_number or '' for s in sort_students_by_roll(students)]
+        by_key = sorted(students, key=lambda s: roll_sort_key(s.roll_number))
+        self.assertEqual([s.roll_number or '' for s in by_key], expected)
+
+    def test_roll_sort_key_is_numeric_aware(self):
+        self.assertLess(roll_sort_key('9'), roll_sort_key('10'))
+        self.assertLess(roll_sort_key('10'), roll_sort_key('A1'))
+        self.assertLess(roll_sort_key('A1'), roll_sort_key(None))
+
+    def test_sort_students_by_roll_uses_stored_key(self):
+        first = MockStudent('A', 'A', roll_number='2')
+        second = MockStudent('B', 'B', roll_number='1')
+        first.roll_sort_key = roll_sort_key('0')  # Stored key wins over re-parsing roll_number
+        self.assertEqual(sort_students_by_roll([second, first])[0].first_name, 'A')
+
+    def test_name_sort_key_is_case_insensitive(self):
+        self.assertLess(name_sort_key('alice', 'Z'), name_sort_key('Bob', 'A'))
+        self.assertEqual(name_sort_key('ALICE', 'Smith'), name_sort_key('alice', 'smith'))
+
+
 class BinarySearchStudentsTest(TestCase):
     """Test the binary search algorithm"""
 
@@ -194,6 +241,547 @@ class BinarySearchStudentsTest(TestCase):
         self.assertTrue(any(s.first_name == 'Alice' for s in results))
 
 
+class StudentSearchIndexTest(TestCase):
+    """Test the in-memory trigram/prefix search index"""
+
+    def setUp(self):
+        self.index = StudentSearchIndex()
+        self.students = [
+            MockStudent('Alice', 'Smith', student_id='STU001',
+                         email='alice@test.com', phone_number='1234567890'),
+            MockStudent('Bob', 'Jones', student_id='STU002',
+                         email='bob@test.com', phone_number='0987654321'),
+            MockStudent('Charlie', 'Brown', student_id='STU003',
+                         email='charlie@test.com', phone_number='5555555555'),
+            MockStudent('Malice', 'Alister', student_id='STU004',
+                         email='malice@test.com', phone_number='1112223333'),
+        ]
+        for i, student in enumerate(self.students):
+            student.id = f'id{i}'
+            self.index.add(student)
+
+    def test_infix_match(self):
+        self.assertEqual(self.index.search('arli'), ['id2'])
+
+    def test_exact_and_prefix_rank_above_infix(self):
+        results = self.index.search('alice')
+        self.assertEqual(results[0], 'id0')
+        self.assertIn('id3', results)
+
+    def test_short_query_matches_word_prefixes(self):
+        self.assertEqual(set(self.index.search('jo')), {'id1'})
+        self.assertEqual(set(self.index.search('al')), {'id0', 'id3'})
+
+    def test_full_name_and_phone(self):
+        self.assertEqual(self.index.search('alice smith'), ['id0'])
+        self.assertEqual(self.index.search('5555'), ['id2'])
+
+    def test_case_insensitive_and_empty(self):
+        self.assertEqual(self.index.search('STU002'), ['id1'])
+        self.assertEqual(self.index.search(''), [])
+        self.assertEqual(self.index.search('zzzz'), [])
+
+    def test_update_and_remove(self):
+        self.students[1].last_name = 'Marley'
+        self.index.add(self.students[1])
+        self.assertEqual(self.index.search('jones'), [])
+        self.assertEqual(self.index.search('marley'), ['id1'])
+
+        self.index.remove('id1')
+        self.assertEqual(self.index.search('marley'), [])
+        self.assertEqual(self.index.search('bo'), [])
+        self.assertEqual(len(self.index), 3)
+
+    def test_indexes_pymongo_dicts(self):
+        self.index.add({'_id': 'id9', 'first_name': 'Zed', 'last_name': 'Ray', 'student_id': 'STU009'})
+        self.assertEqual(self.index.search('stu009'), ['id9'])
+
+    def test_filters_apply_inside_the_index(self):
+        for i, student in enumerate(self.students):
+            student.current_semester = 1 + i % 2
+            student.is_active = i != 3
+            self.index.add(student)
+        self.assertEqual(set(self.index.search('stu', filters={'current_semester': 1})), {'id0', 'id2'})
+        self.assertEqual(self.index.search('al', filters={'is_active': True}), ['id0'])
+        self.assertEqual(self.index.search('stu', filters={'program': 'MCA'}), [])
+
+    def test_sorted_by_name_or_roll(self):
+        for student, roll in zip(self.students, ['10', '9', '2', '1']):
+            student.roll_number = roll
+            self.index.add(student)
+        self.assertEqual(self.index.search('stu', sort='name'), ['id0', 'id1', 'id2', 'id3'])
+        self.assertEqual(self.index.search('stu', sort='roll'), ['id3', 'id2', 'id1', 'id0'])
+
+
+class SearchPipelineTest(TestCase):
+    """Test the text-index search pipeline used by the search API"""
+
+    def test_match_uses_text_index_and_anchored_prefixes(self):
+        pipeline = build_search_pipeline('stu00', skip=20, limit=10)
+        clauses = pipeline[0]['$match']['$or']
+        self.assertEqual(clauses[0], {'$text': {'$search': 'stu00'}})
+        for clause in clauses[1:]:
+            patterns = list(clause.values())[0]['$in']
+            self.assertTrue(all(p.pattern.startswith('^') for p in patterns))
+            self.assertTrue(any(p.match('STU001') or p.match('stu001') for p in patterns))
+
+    def test_results_are_projected_sorted_and_paginated(self):
+        pipeline = build_search_pipeline('alice', skip=2, limit=2)
+        projection = next(stage['$project'] for stage in pipeline if '$project' in stage)
+        self.assertEqual(projection['_id'], 0)
+        self.assertEqual(set(projection) - {'_id', 'id', 'score'}, set(SEARCH_RESULT_FIELDS))
+
+        # Ranking and paging run as-is; mongomock has no text index, so scores are given
+        collection = mongomock.MongoClient().db.students
+        collection.insert_many([
+            {'student_id': f'STU00{i}', 'score': score}
+            for i, score in enumerate([1.0, 5.0, 5.0, 3.0, 0.5])
+        ])
+        ranking = [stage for stage in pipeline if '$sort' in stage or '$facet' in stage]
+        page = next(collection.aggregate(ranking))
+        self.assertEqual(page['total'], [{'count': 5}])
+        self.assertEqual([row['student_id'] for row in page['results']], ['STU003', 'STU000'])
+
+    def test_regex_characters_are_escaped(self):
+        pipeline = build_search_pipeline('a.b(')
+        patterns = pipeline[0]['$match']['$or'][1]['student_id']['$in']
+        self.assertTrue(any(p.match('a.b(') for p in patterns))
+        self.assertFalse(any(p.match('axb(') for p in patterns))
+
+
+class BuildFeatureRowsTest(TestCase):
+    """Test joining bulk aggregation results onto students"""
+
+    def setUp(self):
+        self.alice = MockStudent('Alice', 'Smith', student_id='STU001')
+        self.alice.id = 'oid-alice'
+        self.alice.current_semester = 2
+        self.bob = MockStudent('Bob', 'Jones', student_id='STU002')
+        self.bob.id = 'oid-bob'
+        self.bob.current_semester = 3
+
+    def test_join_by_student_id(self):
+        rows = build_feature_rows(
+            [self.alice, self.bob],
+            attendance={'oid-alice': (10, 8)},
+            grades={'oid-alice': {'count': 4, 'total_marks': 200, 'passed': 3, 'subjects': 2}},
+            submissions={'oid-alice': 3},
+            total_assignments=6,
+        )
+        alice = rows[0]
+        self.assertEqual(alice['student_id'], 'STU001')
+        self.assertEqual(alice['attendance_percentage'], 80.0)
+        self.assertEqual(alice['avg_marks'], 50.0)
+        self.assertEqual(alice['pass_rate'], 75.0)
+        self.assertEqual(alice['subject_count'], 2)
+        self.assertEqual(alice['submission_rate'], 50.0)
+
+    def test_students_without_records_get_zeroes(self):
+        rows = build_feature_rows([self.bob], {}, {}, {}, total_assignments=0)
+        bob = rows[0]
+        self.assertEqual(bob['attendance_percentage'], 0.0)
+        self.assertEqual(bob['avg_marks'], 0.0)
+        self.assertEqual(bob['submission_rate'], 0.0)
+        self.assertEqual(bob['semester'], 3)
+
+
+class FeatureExtractionPipelineTest(TestCase):
+    """Test the per-collection $group pipelines and keyset batching on mongomock"""
+
+    def setUp(self):
+        from attendance.models import AttendanceBitmap, DailyAttendance
+        from courses.models import Assignment, AssignmentSubmission
+        from grades.models import StudentGrade
+        from students.models import Student
+
+        self.enterContext(mongomock_database())
+        # Ascending ObjectIds, so keyset order is s1, s2, s3, s4
+        self.s1, self.s2, self.s3, self.s4 = ids = [ObjectId() for _ in range(4)]
+        Student._get_collection().insert_many([
+            {'_id': oid, 'student_id': f'STU00{i}', 'first_name': f'Student{i}', 'last_name': 'Rai',
+             'email': f'student{i}@test.com', 'program': 'BCA', 'current_semester': 2, 'is_active': i != 4}
+            for i, oid in enumerate(ids, start=1)
+        ])
+
+        day = datetime.datetime(2025, 1, 6)
+        DailyAttendance._get_collection().insert_many(
+            [{'person_type': 'student', 'student': self.s1, 'date': day + datetime.timedelta(days=n),
+              'is_present': n != 0} for n in range(4)]
+            + [{'person_type': 'student', 'student': self.s2, 'date': day, 'is_present': False}]
+            + [{'person_type': 'teacher', 'student': None, 'teacher': ObjectId(), 'date': day, 'is_present': True}]
+        )
+        # Running totals per academic year; differ from daily_attendance to tell the sources apart
+        AttendanceBitmap._get_collection().insert_many([
+            {'person_type': 'student', 'person': self.s1, 'academic_year': 2023, 'marked_days': 10,
+             'present_days': 8},
+            {'person_type': 'student', 'person': self.s1, 'academic_year': 2024, 'marked_days': 5,
+             'present_days': 5},
+            {'person_type': 'teacher', 'person': ObjectId(), 'academic_year': 2024, 'marked_days': 7,
+             'present_days': 7},
+        ])
+
+        maths, physics = ObjectId(), ObjectId()
+        StudentGrade._get_collection().insert_many([
+            {'student': self.s1, 'subject': maths, 'marks_obtained': 50},
+            {'student': self.s1, 'subject': maths, 'marks_obtained': 30},
+            {'student': self.s1, 'subject': physics, 'marks_obtained': 40},
+            {'student': self.s3, 'subject': physics, 'marks_obtained': 20},
+        ])
+
+        assignments = [ObjectId() for _ in range(4)]
+        Assignment._get_collection().insert_many([{'_id': oid, 'title': 'A'} for oid in assignments])
+        AssignmentSubmission._get_collection().insert_many([
+            {'assignment': assignments[0], 'student': self.s1, 'submission_file_path': 'a.pdf'},
+            {'assignment': assignments[1], 'student': self.s1, 'submission_file_path': 'b.pdf'},
+            {'assignment': assignments[2], 'student': self.s1, 'submission_file_path': ''},
+            {'assignment': assignments[3], 'student': self.s1, 'submission_file_path': None},
+            {'assignment': assignments[0], 'student': self.s2, 'submission_file_path': 'c.pdf'},
+        ])
+
+    def mark_bitmaps_built(self):
+        from attendance.bitmaps import BUILD_NAME
+        from attendance.models import AttendanceSummaryBuild
+
+        AttendanceSummaryBuild._get_collection().insert_one({'name': BUILD_NAME, 'built_at': datetime.datetime.now()})
+
+    def test_attendance_counts_daily_records_until_bitmaps_are_built(self):
+        self.assertEqual(attendance_by_student(), {self.s1: (4, 3), self.s2: (1, 0)})
+        self.assertEqual(attendance_by_student([self.s2]), {self.s2: (1, 0)})
+
+    def test_attendance_sums_bitmap_totals_once_built(self):
+        self.mark_bitmaps_built()
+        self.assertEqual(attendance_by_student(), {self.s1: (15, 13)})
+        self.assertEqual(attendance_by_student([self.s2]), {})
+
+    def test_grades_group_counts_passes_and_distinct_subjects(self):
+        grades = grades_by_student()
+        self.assertEqual(set(grades), {self.s1, self.s3})
+        s1 = grades[self.s1]
+        self.assertEqual((s1['count'], s1['total_marks'], s1['passed'], s1['subjects']), (3, 120, 2, 2))
+        self.assertEqual(grades_by_student([self.s3])[self.s3]['passed'], 0)
+
+    def test_submissions_count_only_those_with_a_file(self):
+        self.assertEqual(submissions_by_student(), {self.s1: 2, self.s2: 1})
+        self.assertEqual(submissions_by_student([self.s3]), {})
+
+    def test_batches_page_active_students_by_id(self):
+        batches = list(iter_feature_batches(batch_size=2))
+        self.assertEqual([[row['student_id'] for row in batch] for batch in batches],
+                         [['STU001', 'STU002'], ['STU003']])
+        s1 = batches[0][0]
+        self.assertEqual(s1['attendance_percentage'], 75.0)
+        self.assertEqual(s1['avg_marks'], 40.0)
+        self.assertEqual(s1['subject_count'], 2)
+        self.assertEqual(s1['submission_rate'], 50.0)
+
+        self.mark_bitmaps_built()
+        s1 = next(iter_feature_batches(batch_size=2))[0]
+        self.assertAlmostEqual(s1['attendance_percentage'], 13 / 15 * 100)
+
+
+class StudentFeatureStoreTest(TestCase):
+    """Test persisting the feature table without touching MongoDB"""
+
+    def test_save_and_load_round_trip(self):
+        alice = MockStudent('Alice', 'Smith', student_id='STU001')
+        alice.id = 'oid-alice'
+        alice.current_semester = 4
+        rows = build_feature_rows(
+            [alice], {'oid-alice': (4, 3)}, {}, {'oid-alice': 1}, total_assignments=2
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'features.npz')
+            store = StudentFeatureStore(path=path, max_age=60)
+            store.table = store._to_frame(rows)
+            store.built_at = datetime.datetime(2025, 1, 1, 9, 30)
+            store.total_assignments = 2
+            store.save()
+
+            loaded = StudentFeatureStore(path=path, max_age=60)
+            self.assertTrue(loaded.load())
+            self.assertEqual(loaded.built_at, store.built_at)
+            self.assertEqual(loaded.total_assignments, 2)
+            record = loaded.table.loc['STU001']
+            self.assertEqual(record['student_name'], 'Alice Smith')
+            self.assertEqual(record['attendance_percentage'], 75.0)
+            self.assertEqual(record['submission_rate'], 50.0)
+            self.assertEqual(int(record['semester']), 4)
+
+    def test_load_missing_file(self):
+        store = StudentFeatureStore(path='/nonexistent/features.npz', max_age=60)
+        self.assertFalse(store.load())
+
+    def test_frame_order_does_not_depend_on_row_order(self):
+        students = []
+        for name, student_id in [('Cara', 'STU003'), ('Alice', 'STU001'), ('Bob', 'STU002')]:
+            student = MockStudent(name, 'Smith', student_id=student_id)
+            student.id = f'oid-{name}'
+            student.current_semester = 2
+            students.append(student)
+        rows = build_feature_rows(students, {}, {}, {}, total_assignments=0)
+
+        store = StudentFeatureStore(path='/nonexistent/features.npz', max_age=60)
+        shuffled = store._to_frame(rows)
+        ordered = store._to_frame(sorted(rows, key=lambda row: row['student_id']))
+        self.assertEqual(list(shuffled['student_id']), ['STU001', 'STU002', 'STU003'])
+        self.assertEqual(data_fingerprint(shuffled), data_fingerprint(ordered))
+
+
+def make_training_rows(count=10):
+    """Synthetic rows in the shape StudentPerformancePredictor.collect_student_data returns"""
+    rows = []
+    for i in range(count):
+        grade = 30 + i * 5
+        rows.append({
+            'student_id': f'STU{i:03d}',
+            'student_name': f'Student {i}',
+            'program': 'BCA',
+            'semester': 1 + i % 8,
+            'attendance_percentage': 50.0 + i * 4,
+            'avg_assignment_score': 40.0 + i * 3,
+            'avg_grade_score': float(grade),
+            'pass_rate': 100.0 if grade >= 40 else 0.0,
+            'total_subjects': 5,
+            'performance_label': 'Low',
+            'pass_fail_label': 1 if grade >= 40 else 0,
+            'risk_level': 'High Risk',
+        })
+    return rows
+
+
+class ModelRegistryTest(TestCase):
+    """Test that trained Random Forest models are reused until the data changes"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.registry = ModelRegistry('random_forest', root=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_same_data_reuses_saved_version(self):
+        rows = make_training_rows()
+        first = StudentPerformancePredictor()
+        success, _ = first.load_or_train(rows, registry=self.registry)
+        self.assertTrue(success)
+        self.assertEqual(first.model_version, 1)
+
+        second = StudentPerformancePredictor()
+        success, message = second.load_or_train(rows, registry=self.registry)
+        self.assertTrue(success)
+        self.assertEqual(second.model_version, 1)
+        self.assertIn('saved model v1', message)
+
+    def test_changed_data_trains_new_version(self):
+        rows = make_training_rows()
+        StudentPerformancePredictor().load_or_train(rows, registry=self.registry)
+
+        rows[0]['attendance_percentage'] = 99.0
+        predictor = StudentPerformancePredictor()
+        predictor.load_or_train(rows, registry=self.registry)
+        self.assertEqual(predictor.model_version, 2)
+        self.assertEqual(self.registry.latest()['version'], 2)
+
+    def test_concurrent_saves_claim_distinct_versions(self):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            saved = list(pool.map(lambda i: self.registry.save({'model': i}, f'fp{i}'), range(8)))
+        self.assertEqual(sorted(metadata['version'] for metadata in saved), list(range(1, 9)))
+        self.assertEqual(self.registry.latest()['version'], 8)
+        self.assertFalse(os.path.exists(self.registry.lock_path))
+
+    def test_older_save_does_not_move_manifest_back(self):
+        # A save that claimed v1 but only finishes after v2 was published
+        os.makedirs(self.registry.directory, exist_ok=True)
+        version, handle = self.registry._claim_version()
+        self.registry.save({'model': 'new'}, 'new')
+        self.assertEqual(self.registry.latest()['version'], 2)
+
+        with patch.object(self.registry, '_claim_version', return_value=(version, handle)):
+            metadata = self.registry.save({'model': 'old'}, 'old')
+        self.assertEqual(metadata['version'], 1)
+        self.assertEqual(self.registry.latest()['fingerprint'], 'new')
+
+
+class ModelTuningTest(TestCase):
+    """Test the cross-validated hyperparameter search"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.registry = ModelRegistry('random_forest', root=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_search_reports_each_configuration_and_saves_best(self):
+        grid = {'n_estimators': [5, 10], 'max_depth': [2, None]}
+        report = tune_random_forest(
+            make_training_rows(20), folds=3, n_jobs=1, param_grid=grid, registry=self.registry
+        )
+        self.assertEqual(report['candidates'], 4)
+        for config in report['configurations']:
+            self.assertIn('mean_fit_time', config)
+            self.assertTrue(0.0 <= config['mean_accuracy'] <= 1.0)
+        self.assertEqual(self.registry.tuned_params(), report['best_params'])
+
+    def test_tuned_params_change_fingerprint(self):
+        rows = make_training_rows()
+        default = StudentPerformancePredictor()
+        tuned = StudentPerformancePredictor(params={'n_estimators': 10, 'max_depth': None})
+        self.assertEqual(tuned.classification_model.n_estimators, 10)
+        self.assertEqual(tuned.classification_model.n_jobs, 1)
+        self.assertNotEqual(default.training_fingerprint(rows), tuned.training_fingerprint(rows))
+
+    def test_unknown_search_strategy(self):
+        with self.assertRaises(ValueError):
+            tune_random_forest(make_training_rows(), search='bayes', save=False)
+
+
+class BatchPredictionTest(TestCase):
+    """Test that batch inference matches one-student-at-a-time inference"""
+
+    def test_random_forest_batch_matches_single(self):
+        rows = make_training_rows(12)
+        predictor = StudentPerformancePredictor()
+        predictor.train_model(rows)
+
+        batch, _ = predictor.predict_batch(rows)
+        self.assertEqual(len(batch), len(rows))
+        for row, predicted in zip(rows, batch):
+            single, _ = predictor.predict_student_performance(row)
+            self.assertAlmostEqual(single['pass_probability'], predicted['pass_probability'])
+            self.assertAlmostEqual(single['predicted_grade_score'], predicted['predicted_grade_score'])
+            self.assertEqual(single['predicted_performance'], predicted['predicted_performance'])
+
+    def test_kmeans_batch_matches_single(self):
+        rows = [
+            {'attendance_percentage': 40.0 + i * 5, 'avg_marks': 20.0 + i * 4,
+             'assignment_completion_rate': 10.0 + i * 7}
+            for i in range(9)
+        ]
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        clusterer = StudentPerformanceClusterer(registry=ModelRegistry('kmeans', root=tmp.name))
+        success, _ = clusterer.train_model(rows)
+        self.assertTrue(success)
+
+        batch, _ = clusterer.predict_clusters(rows)
+        for row, predicted in zip(rows, batch):
+            single, _ = clusterer.predict_cluster(row)
+            self.assertEqual(single['cluster_label'], predicted['cluster_label'])
+            self.assertAlmostEqual(single['distance_to_center'], predicted['distance_to_center'])
+
+    def test_kmeans_labels_ordered_by_avg_marks(self):
+        rows = [
+            {'attendance_percentage': 90.0, 'avg_marks': 90.0 + i, 'assignment_completion_rate': 90.0}
+            for i in range(3)
+        ] + [
+            {'attendance_percentage': 60.0, 'avg_marks': 55.0 + i, 'assignment_completion_rate': 60.0}
+            for i in range(3)
+        ] + [
+            {'attendance_percentage': 30.0, 'avg_marks': 20.0 + i, 'assignment_completion_rate': 30.0}
+            for i in range(3)
+        ]
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for seed in (0, 1, 7):
+            clusterer = StudentPerformanceClusterer(registry=ModelRegistry('kmeans', root=tmp.name))
+            clusterer.kmeans_model.set_params(random_state=seed)
+            clusterer.train_model(rows)
+            batch, _ = clusterer.predict_clusters(rows)
+            self.assertEqual([p['cluster_label'] for p in batch], [0] * 3 + [1] * 3 + [2] * 3)
+            self.assertEqual(batch[0]['cluster_name'], 'High Performers')
+            self.assertTrue(all(
+                a >= b for a, b in zip(clusterer.cluster_centers[:, 1], clusterer.cluster_centers[1:, 1])
+            ))
+
+    def test_untrained_model_returns_none(self):
+        predictions, message = StudentPerformancePredictor().predict_batch(make_training_rows(3))
+        self.assertIsNone(predictions)
+        self.assertEqual(message, "Model not trained yet")
+
+
+class IncrementalClusteringTest(TestCase):
+    """Test mini-batch clustering over streamed batches"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.registry = ModelRegistry('kmeans', root=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_batches(self, shift=0.0):
+        rows = [
+            {'attendance_percentage': 40.0 + i * 5 + shift, 'avg_marks': 20.0 + i * 4 + shift,
+             'submission_rate': 10.0 + i * 7 + shift}
+            for i in range(12)
+        ]
+        return [rows[:5], rows[5:10], rows[10:]]
+
+    def test_first_run_trains_and_saves(self):
+        clusterer = StudentPerformanceClusterer(incremental=True, batch_size=5, registry=self.registry)
+        success, _ = clusterer.train_incremental(self.make_batches())
+        self.assertTrue(success)
+        self.assertEqual(clusterer.model_version, 1)
+        self.assertEqual(clusterer.cluster_centers.shape, (3, 3))
+
+    def test_trains_from_collected_rows(self):
+        clusterer = StudentPerformanceClusterer(incremental=True, batch_size=5, registry=self.registry)
+        rows = [
+            dict(row, assignment_completion_rate=row.pop('submission_rate'))
+            for batch in self.make_batches() for row in batch
+        ]
+        batches = clusterer.feature_batches(rows)
+        self.assertEqual([len(batch) for batch in batches], [5, 5, 2])
+
+        success, message = clusterer.train_incremental(batches)
+        self.assertTrue(success)
+        self.assertIn('trained on 12 students', message)
+
+    def test_stable_data_keeps_previous_model(self):
+        StudentPerformanceClusterer(
+            incremental=True, batch_size=5, registry=self.registry
+        ).train_incremental(self.make_batches())
+
+        clusterer = StudentPerformanceClusterer(
+            incremental=True, batch_size=5, drift_threshold=10.0, registry=self.registry
+        )
+        success, message = clusterer.train_incremental(self.make_batches())
+        self.assertTrue(success)
+        self.assertIn('kept model v1', message)
+        self.assertEqual(self.registry.latest()['version'], 1)
+
+    def test_drift_saves_new_version(self):
+        StudentPerformanceClusterer(
+            incremental=True, batch_size=5, registry=self.registry
+        ).train_incremental(self.make_batches())
+
+        clusterer = StudentPerformanceClusterer(
+            incremental=True, batch_size=5, drift_threshold=0.0, registry=self.registry
+        )
+        clusterer.train_incremental(self.make_batches(shift=30.0))
+        self.assertEqual(clusterer.model_version, 2)
+
+    def test_insufficient_data(self):
+        clusterer = StudentPerformanceClusterer(incremental=True, registry=self.registry)
+        success, _ = clusterer.train_incremental([[{'attendance_percentage': 1, 'avg_marks': 1, 'submission_rate': 1}]])
+        self.assertFalse(success)
+
+
+class StartupImportTest(TestCase):
+    """Guard against the ML stack being imported when a web worker boots"""
+
+    def test_urlconf_does_not_import_ml_stack(self):
+        imports = profile_imports()
+        modules = [module for module, _, _, _ in imports]
+        self.assertIn('students.views', modules)
+        self.assertEqual(heavy_imports(imports), [])
+
+    def test_heavy_imports_detects_ml_modules(self):
+        imports = [('students.views', 10, 10, 0), ('sklearn.ensemble', 5, 50, 1)]
+        self.assertEqual(heavy_imports(imports), ['sklearn.ensemble'])
+
+
 # ============================================================================
 # View Access Control Tests (using Django test client, no MongoDB needed)
 # ============================================================================
@@ -255,6 +843,24 @@ class StudentURLResolutionTest(TestCase):
         url = reverse('students:kmeans-clustering')
         self.assertEqual(url, '/students/kmeans-clustering/')
 
+    def test_analysis_job_urls(self):
+        self.assertEqual(
+            reverse('students:analysis-job-start', args=['kmeans']),
+            '/students/jobs/kmeans/start/'
+        )
+        self.assertEqual(
+            reverse('students:analysis-job-status', args=['abc123']),
+            '/students/jobs/abc123/'
+        )
+        self.assertEqual(
+            reverse('students:analysis-job-result', args=['abc123']),
+            '/students/jobs/abc123/result/'
+        )
+
+    def test_cluster_members_url(self):
+        url = reverse('students:cluster-members', args=[0])
+        self.assertEqual(url, '/students/clusters/0/')
+
 
 class StudentDashboardStatsTest(TestCase):
     """Test the student dashboard stats endpoint"""
@@ -305,3 +911,62 @@ class AnalysisViewsTest(TestCase):
         self.client.login(email='admin@test.com', password='pass123')
         response = self.client.get(reverse('students:kmeans-clustering'))
         self.assertNotEqual(response.status_code, 302)
+
+    def test_job_status_requires_login(self):
+        response = self.client.get(reverse('students:analysis-job-status', args=['abc123']))
+        self.assertEqual(response.status_code, 302)
+
+    def test_start_job_rejects_get(self):
+        self.client.login(email='admin@test.com', password='pass123')
+        response = self.client.get(reverse('students:analysis-job-start', args=['kmeans']))
+        self.assertEqual(response.status_code, 405)
+
+    def test_cluster_members_rejects_unknown_cluster(self):
+        self.client.login(email='admin@test.com', password='pass123')
+        response = self.client.get(reverse('students:cluster-members', args=[7]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_cluster_members_rejects_bad_page(self):
+        self.client.login(email='admin@test.com', password='pass123')
+        response = self.client.get(reverse('students:cluster-members', args=[0]), {'page': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AnalysisJobSubmissionTest(TestCase):
+    """Test the analysis job endpoints on mongomock"""
+
+    def setUp(self):
+        self.enterContext(mongomock_database())
+        self.executor = self.enterContext(patch('students.jobs.get_executor')).return_value
+        self.client = Client()
+        User.objects.create_user(email='teacher@test.com', password='pass123', role='teacher')
+        User.objects.create_user(email='student@test.com', password='pass123', role='student')
+
+    def test_students_cannot_start_or_read_jobs(self):
+        self.client.login(email='student@test.com', password='pass123')
+        response = self.client.post(reverse('students:analysis-job-start', args=['kmeans']))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(AnalysisJob.objects.count(), 0)
+
+        job = AnalysisJob(kind='kmeans', status='completed', is_active=False, result={'success': True})
+        job.save()
+        for name in ('students:analysis-job-status', 'students:analysis-job-result'):
+            self.assertEqual(self.client.get(reverse(name, args=[str(job.id)])).status_code, 403)
+
+    def test_second_submit_while_active_returns_existing_job(self):
+        self.client.login(email='teacher@test.com', password='pass123')
+        url = reverse('students:analysis-job-start', args=['kmeans'])
+        first = self.client.post(url).json()
+        second = self.client.post(url).json()
+
+        self.assertFalse(first['deduplicated'])
+        self.assertTrue(second['deduplicated'])
+        self.assertEqual(second['job_id'], first['job_id'])
+        self.assertEqual(AnalysisJob.objects(kind='kmeans', is_active=True).count(), 1)
+        self.executor.submit.assert_called_once()
+
+        # Once finished, the next submit starts a new job
+        AnalysisJob.objects(id=first['job_id']).update(set__status='completed', set__is_active=False)
+        third = self.client.post(url).json()
+        self.assertFalse(third['deduplicated'])
+        self.assertNotEqual(third['job_id'], first['job_id'])
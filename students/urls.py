@@ -21,6 +21,12 @@ urlpatterns = [
     
     # K-Means Clustering Analysis - MUST come before parameterized routes
     path('kmeans-clustering/', views.kmeans_clustering_view, name='kmeans-clustering'),
+    path('clusters/<int:cluster_label>/', views.cluster_members, name='cluster-members'),
+    
+    # Background analysis jobs - MUST come before parameterized routes
+    path('jobs/<str:kind>/start/', views.start_analysis_job, name='analysis-job-start'),
+    path('jobs/<str:job_id>/', views.analysis_job_status, name='analysis-job-status'),
+    path('jobs/<str:job_id>/result/', views.analysis_job_result, name='analysis-job-result'),
     
     # Bulk actions - MUST come before parameterized routes
     path('bulk-status/', views.bulk_activate_students, name='bulk-status'),
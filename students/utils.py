@@ -1,20 +1,114 @@
 # students/utils.py
 
+import re
+
 def sort_students_by_name(students):
     """
     Sorts a list of student objects by first_name (A-Z).
     """
     return sorted(students, key=lambda s: s.first_name.lower())
 
+def roll_sort_key(roll):
+    """
+    String key that orders roll numbers like sort_students_by_roll: numeric
+    rolls first by value, then other rolls alphabetically, then missing ones.
+    Stored on Student.roll_sort_key so MongoDB can sort by it.
+    """
+    roll = (roll or '').strip()
+    if not roll:
+        return '2'
+    if roll.isdigit():
+        return '0' + roll.lstrip('0').rjust(20, '0')
+    return '1' + roll
+
+def name_sort_key(first_name, last_name):
+    """Case-insensitive name key stored on Student.name_sort_key"""
+    return f"{(first_name or '').lower()} {(last_name or '').lower()}"
+
 def sort_students_by_roll(students):
     """
     Sorts a list of student objects by roll_number (as integer, if possible).
+    Uses the stored roll_sort_key when the object has one.
     """
-    def roll_sort_key(s):
-        roll = s.roll_number
-        if not roll:
-            return (1, '', 0)  # Put students without roll_number at the end
-        if roll.isdigit():
-            return (0, '', int(roll))
-        return (0, roll, 0)
-    return sorted(students, key=roll_sort_key)
+    def key(s):
+        return getattr(s, 'roll_sort_key', None) or roll_sort_key(s.roll_number)
+    return sorted(students, key=key)
+
+
+# ---------------------------------------------------------------------------
+# Database-side search (StudentViewSet.search)
+# ---------------------------------------------------------------------------
+
+# Fields returned for each search hit - enough for a result list / typeahead
+SEARCH_RESULT_FIELDS = ['student_id', 'first_name', 'last_name', 'email',
+                        'program', 'current_semester', 'is_active']
+
+# Added to the text score of students whose id or email starts with the query
+PREFIX_MATCH_BOOST = 10
+
+
+def _prefix_patterns(query):
+    """Anchored, case-variant regexes so the student_id/email indexes can be used"""
+    variants = {query, query.lower(), query.upper()}
+    return [re.compile('^' + re.escape(variant)) for variant in variants]
+
+
+def build_search_pipeline(query, skip=0, limit=20):
+    """
+    Aggregation pipeline for a relevance-ranked student search.
+
+    Matches the 'student_search_text' text index, or an anchored prefix of
+    student_id / email. The result is a single document with 'total' and
+    the projected 'results' page.
+    """
+    query = query.strip()
+    lowered = query.lower()
+    patterns = _prefix_patterns(query)
+
+    def starts_with(field):
+        return {'$eq': [{'$indexOfCP': [{'$toLower': {'$ifNull': [field, '']}}, lowered]}, 0]}
+
+    projection = {field: 1 for field in SEARCH_RESULT_FIELDS}
+    projection.update({
+        '_id': 0,
+        'id': {'$toString': '$_id'},
+        'score': {'$add': [
+            {'$ifNull': [{'$meta': 'textScore'}, 0]},
+            {'$cond': [{'$or': [starts_with('$student_id'), starts_with('$email')]}, PREFIX_MATCH_BOOST, 0]},
+        ]},
+    })
+
+    return [
+        {'$match': {'$or': [
+            {'$text': {'$search': query}},
+            {'student_id': {'$in': patterns}},
+            {'email': {'$in': patterns}},
+        ]}},
+        {'$project': projection},
+        {'$sort': {'score': -1, 'student_id': 1}},
+        {'$facet': {
+            'total': [{'$count': 'count'}],
+            'results': [{'$skip': skip}, {'$limit': limit}],
+        }},
+    ]
+
+
+def search_students(query, page=1, page_size=20):
+    """Run build_search_pipeline and return (total, results) for one page"""
+    from .models import Student
+
+    skip = (page - 1) * page_size
+    if not query.strip():
+        students = Student.objects.order_by('student_id').only(*SEARCH_RESULT_FIELDS)
+        total = students.count()
+        results = []
+        for row in students.skip(skip).limit(page_size).as_pymongo():
+            row['id'] = str(row.pop('_id'))
+            results.append(row)
+        return total, results
+
+    facet = next(iter(Student.objects.aggregate(build_search_pipeline(query, skip, page_size))), None)
+    if not facet:
+        return 0, []
+    total = facet['total'][0]['count'] if facet['total'] else 0
+    return total, facet['results']
@@ -8,14 +8,13 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
-from mongoengine import DoesNotExist
+from mongoengine import DoesNotExist, ValidationError
 from mongoengine import Q
-from .models import Student, StudentDocument
+from .models import Student, StudentDocument, AnalysisJob, StudentClusterAssignment
 from .serializers import StudentSerializer, StudentDocumentSerializer
-from .utils import sort_students_by_name, sort_students_by_roll
-from .algorithms import binary_search_students
-from .random_forest_analysis import run_random_forest_analysis
-from .kmeans_clustering import run_kmeans_clustering
+from .utils import search_students
+from .search_index import SORTS as SEARCH_SORTS, get_search_index
+from .jobs import ANALYSES, submit_analysis, job_status
 import datetime
 import string
 import secrets
@@ -26,48 +25,74 @@ User = get_user_model()
 
 
 class StudentListView(LoginRequiredMixin, TemplateView):
-    """Display list of students with search and filter functionality using custom algorithms"""
+    """Display list of students with search, filters, sorting and pagination done in MongoDB"""
     template_name = 'students/list.html'
+    paginate_by = 25
+    
+    # Only the columns the list template displays
+    LIST_FIELDS = ('student_id', 'first_name', 'last_name', 'email', 'program',
+                   'current_semester', 'is_active')
+    SORT_FIELDS = {
+        'name': ('name_sort_key', 'student_id'),
+        'roll': ('roll_sort_key', 'student_id'),
+    }
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Get all students from MongoDB
-        students = Student.objects.all()
-        
-        # Apply semester filter
+        # Filters as exact field values, applied by MongoDB or, for a search, by the index
+        filters = {}
         semester = self.request.GET.get('semester', '')
         if semester:
-            students = students.filter(current_semester=int(semester))
-        
-        # Apply program filter
+            filters['current_semester'] = int(semester)
         program = self.request.GET.get('program', '')
         if program:
-            students = students.filter(program=program)
-        
-        # Apply status filter
+            filters['program'] = program
         status_filter = self.request.GET.get('status', '')
-        if status_filter == 'active':
-            students = students.filter(is_active=True)
-        elif status_filter == 'inactive':
-            students = students.filter(is_active=False)
+        if status_filter in ('active', 'inactive'):
+            filters['is_active'] = status_filter == 'active'
         
-        # Convert queryset to list for custom algorithm usage
-        students_list = list(students)
+        try:
+            page = max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        offset = (page - 1) * self.paginate_by
         
-        # Apply custom binary search algorithm for faster search
         search = self.request.GET.get('search', '')
+        sort_type = self.request.GET.get('sort', 'relevance' if search else 'name')
         if search:
-            students_list = binary_search_students(students_list, search)
-        
-        # Sorting (using your custom sort algorithm)
-        sort_type = self.request.GET.get('sort', 'name')  # Default sort by name
-        if sort_type == 'roll':
-            students_sorted = sort_students_by_roll(students_list)
+            # Matched, filtered and ordered in the in-memory index; only the page's ids go to MongoDB
+            if sort_type not in SEARCH_SORTS:
+                sort_type = 'relevance'
+            matched_ids = get_search_index().search(search, filters=filters, sort=sort_type)
+            total = len(matched_ids)
+            page_ids = matched_ids[offset:offset + self.paginate_by]
+            by_id = {str(s.id): s for s in Student.objects.filter(id__in=page_ids).only(*self.LIST_FIELDS)}
+            students_page = [by_id[student_id] for student_id in page_ids if student_id in by_id]
         else:
-            students_sorted = sort_students_by_name(students_list)
+            if sort_type not in self.SORT_FIELDS:
+                sort_type = 'name'
+            students = Student.objects.filter(**filters)
+            total = students.count()
+            students_page = list(
+                students.order_by(*self.SORT_FIELDS[sort_type])
+                .only(*self.LIST_FIELDS)
+                .skip(offset)
+                .limit(self.paginate_by)
+            )
+        
+        num_pages = max((total + self.paginate_by - 1) // self.paginate_by, 1)
+        query_params = self.request.GET.copy()
+        query_params.pop('page', None)
         
-        context['students'] = students_sorted
+        context['students'] = students_page
+        context['total_students'] = total
+        context['page_number'] = page
+        context['num_pages'] = num_pages
+        context['page_range'] = range(max(page - 2, 1), min(page + 2, num_pages) + 1)
+        context['has_previous'] = page > 1
+        context['has_next'] = page < num_pages
+        context['page_query'] = query_params.urlencode()
         context['search'] = search
         context['sort_type'] = sort_type
         return context
@@ -602,22 +627,31 @@ class StudentViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def search(self, request):
-        """Search students by various fields including phone number"""
+        """
+        Relevance-ranked, paginated student search (text index on name, email,
+        student ID and phone number plus anchored student ID/email prefixes).
+        
+        Query params: q, page, page_size
+        """
         try:
             query = request.query_params.get('q', '')
-            if query:
-                students = Student.objects.filter(
-                    Q(first_name__icontains=query) |
-                    Q(last_name__icontains=query) |
-                    Q(email__icontains=query) |
-                    Q(student_id__icontains=query) |
-                    Q(phone_number__icontains=query)
+            try:
+                page = max(int(request.query_params.get('page', 1)), 1)
+                page_size = min(max(int(request.query_params.get('page_size', 20)), 1), 100)
+            except ValueError:
+                return Response(
+                    {'error': 'page and page_size must be integers'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-            else:
-                students = Student.objects.all()
             
-            serializer = StudentSerializer(students, many=True)
-            return Response(serializer.data)
+            total, results = search_students(query, page=page, page_size=page_size)
+            return Response({
+                'query': query,
+                'page': page,
+                'page_size': page_size,
+                'total': total,
+                'results': results,
+            })
         except Exception as e:
             return Response(
                 {'error': str(e)}, 
@@ -724,6 +758,65 @@ def student_dashboard_stats(request):
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 
+# ============================================================================
+# ML ANALYSIS VIEWS (run as background jobs)
+# ============================================================================
+
+def _get_analysis_job(job_id):
+    """Fetch an AnalysisJob by id, returning None for unknown or malformed ids"""
+    try:
+        return AnalysisJob.objects(id=job_id).first()
+    except ValidationError:
+        return None
+
+
+def _submit_analysis_page(request, kind, template_name):
+    """Queue an analysis from a page form and redirect to its progress view"""
+    try:
+        job, created = submit_analysis(kind, requested_by=request.user.email)
+    except Exception as e:
+        print(f"❌ Could not queue {kind} analysis: {e}")
+        messages.error(request, f"Analysis failed: {str(e)}")
+        return render(request, template_name, {
+            'analysis_completed': False,
+            'error': str(e)
+        })
+    
+    if not created:
+        messages.info(request, 'This analysis is already running - showing its progress.')
+    return redirect(f"{request.path}?job={job.id}")
+
+
+def _render_analysis_page(request, template_name):
+    """Show the analysis page, with progress or results when a job id is given"""
+    context = {
+        'analysis_completed': False,
+        'show_results': False
+    }
+    
+    job_id = request.GET.get('job')
+    if job_id:
+        job = _get_analysis_job(job_id)
+        if job is None:
+            messages.error(request, 'Analysis job not found.')
+        elif job.status == 'completed':
+            analysis_result = job.result
+            if not analysis_result.get('success'):
+                messages.error(request, f"❌ {analysis_result.get('message')}")
+            context.update({
+                'analysis_completed': True,
+                'analysis_result': analysis_result,
+                'show_results': True
+            })
+        elif job.status == 'failed':
+            messages.error(request, f"Analysis failed: {job.error}")
+            context['error'] = job.error
+        else:
+            context['job'] = job_status(job)
+    
+    return render(request, template_name, context)
+
+
 @login_required
 def random_forest_analysis_view(request):
     """
@@ -738,38 +831,11 @@ def random_forest_analysis_view(request):
     """
     
     if request.method == 'POST':
-        # Run the Random Forest analysis only when form is submitted
-        try:
-            print("🚀 Starting Random Forest Analysis...")
-            
-            # Run the analysis
-            analysis_result = run_random_forest_analysis()
-            
-            if not analysis_result['success']:
-                messages.error(request, f"❌ {analysis_result['message']}")
-            
-            # Pass results to template
-            context = {
-                'analysis_completed': True,
-                'analysis_result': analysis_result,
-                'show_results': True
-            }
-            
-            return render(request, 'students/random_forest_analysis.html', context)
-            
-        except Exception as e:
-            print(f"❌ Random Forest Analysis Error: {e}")
-            messages.error(request, f"Analysis failed: {str(e)}")
-            return render(request, 'students/random_forest_analysis.html', {
-                'analysis_completed': False,
-                'error': str(e)
-            })
+        # Queue the analysis in the background and follow its progress
+        return _submit_analysis_page(request, 'random_forest', 'students/random_forest_analysis.html')
     
-    # For GET requests (including refresh), show clean initial page
-    return render(request, 'students/random_forest_analysis.html', {
-        'analysis_completed': False,
-        'show_results': False
-    })
+    # GET shows a clean page, or the progress/results of ?job=<id>
+    return _render_analysis_page(request, 'students/random_forest_analysis.html')
 
 
 @login_required
@@ -786,33 +852,101 @@ def kmeans_clustering_view(request):
     """
     
     if request.method == 'POST':
-        try:
-            print("🎯 Starting K-Means Clustering Analysis...")
-            
-            analysis_result = run_kmeans_clustering()
-            
-            if not analysis_result['success']:
-                messages.error(request, f"❌ {analysis_result['message']}")
-            
-            context = {
-                'analysis_completed': True,
-                'analysis_result': analysis_result,
-                'show_results': True
-            }
-            
-            return render(request, 'students/kmeans_clustering.html', context)
-            
-        except Exception as e:
-            print(f"❌ K-Means Clustering Analysis Error: {e}")
-            messages.error(request, f"Clustering analysis failed: {str(e)}")
-            return render(request, 'students/kmeans_clustering.html', {
-                'analysis_completed': False,
-                'error': str(e)
-            })
+        return _submit_analysis_page(request, 'kmeans', 'students/kmeans_clustering.html')
     
-    return render(request, 'students/kmeans_clustering.html', {
-        'analysis_completed': False,
-        'show_results': False
-    })
+    return _render_analysis_page(request, 'students/kmeans_clustering.html')
 
 
+@login_required
+def start_analysis_job(request, kind):
+    """API endpoint: queue an analysis and return its job id immediately"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if request.user.role not in ['admin', 'teacher']:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    if kind not in ANALYSES:
+        return JsonResponse({'error': f'Unknown analysis: {kind}'}, status=404)
+    
+    try:
+        job, created = submit_analysis(kind, requested_by=request.user.email)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    payload = job_status(job)
+    payload['deduplicated'] = not created
+    return JsonResponse(payload, status=202)
+
+
+@login_required
+def analysis_job_status(request, job_id):
+    """API endpoint: poll progress of an analysis job"""
+    if request.user.role not in ['admin', 'teacher']:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    job = _get_analysis_job(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    return JsonResponse(job_status(job))
+
+
+@login_required
+def analysis_job_result(request, job_id):
+    """API endpoint: fetch the result of a finished analysis job"""
+    if request.user.role not in ['admin', 'teacher']:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    job = _get_analysis_job(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    if job.status == 'failed':
+        return JsonResponse({'error': job.error, 'status': job.status}, status=500)
+    if job.status != 'completed':
+        return JsonResponse(job_status(job), status=202)
+    return JsonResponse(job.result)
+
+
+@login_required
+def cluster_members(request, cluster_label):
+    """
+    API endpoint: students in a K-Means cluster, served from the stored
+    assignments of the last clustering run (no model is loaded).
+    
+    Query params: semester, page, page_size
+    """
+    if cluster_label not in StudentClusterAssignment.CLUSTER_NAMES:
+        return JsonResponse({'error': f'Unknown cluster: {cluster_label}'}, status=404)
+    
+    try:
+        semester = int(request.GET.get('semester') or 0)
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = min(max(int(request.GET.get('page_size', 50)), 1), 500)
+    except ValueError:
+        return JsonResponse({'error': 'semester, page and page_size must be integers'}, status=400)
+    
+    assignments = StudentClusterAssignment.members(cluster_label, semester=semester or None)
+    total = assignments.count()
+    rows = assignments.skip((page - 1) * page_size).limit(page_size).as_pymongo()
+    
+    students = [
+        {
+            'student_id': row['student_id'],
+            'student_name': row.get('student_name'),
+            'program': row.get('program'),
+            'semester': row.get('semester'),
+            'distance_to_center': row.get('distance_to_center'),
+            'attendance_percentage': row.get('attendance_percentage'),
+            'avg_marks': row.get('avg_marks'),
+            'assignment_completion_rate': row.get('assignment_completion_rate'),
+            'model_version': row.get('model_version'),
+            'assigned_at': row['assigned_at'].strftime("%Y-%m-%d %H:%M:%S") if row.get('assigned_at') else None,
+        }
+        for row in rows
+    ]
+    
+    return JsonResponse({
+        'cluster_label': cluster_label,
+        'cluster_name': StudentClusterAssignment.CLUSTER_NAMES[cluster_label],
+        'semester': semester or None,
+        'page': page,
+        'page_size': page_size,
+        'total': total,
+        'students': students,
+    })
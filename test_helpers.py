@@ -4,8 +4,19 @@ Test helper to handle Django 4.2 + Python 3.14 compatibility issue.
 Python 3.14 changed the behavior of super().__copy__() which breaks
 Django's test client template context copying. This is NOT a code bug
 but a known compatibility issue. Views render fine at runtime.
+
+forbid_dereferences() is a lint-style guard for read paths that should
+never follow a ReferenceField one row at a time. mongomock_database()
+runs a block against an in-memory database, so views can be exercised
+with real documents without a MongoDB server.
 """
+from contextlib import contextmanager
+
+import mongomock
+from django.conf import settings
 from django.test import Client
+from mongoengine.connection import connect, disconnect, get_db
+from mongoengine.fields import ReferenceField
 
 
 class SafeClient(Client):
@@ -26,3 +37,48 @@ class SafeClient(Client):
                 from django.http import HttpResponse
                 return HttpResponse(status=500, content=f'Missing template: {e}'.encode())
             raise
+
+
+class DereferenceError(AssertionError):
+    """A ReferenceField was dereferenced inside forbid_dereferences()"""
+
+
+@contextmanager
+def forbid_dereferences():
+    """
+    Fail when code inside the block dereferences a ReferenceField.
+
+    Every lazy dereference raises DereferenceError instead of querying the
+    referenced collection, and is recorded; views catch broad exceptions,
+    so the block also fails on exit if anything was recorded. Yields the
+    list of (collection, id) pairs.
+    """
+    dereferenced = []
+    original = ReferenceField.__dict__['_lazy_load_ref']
+
+    def refuse(ref_cls, dbref):
+        dereferenced.append((dbref.collection, dbref.id))
+        raise DereferenceError(f'{ref_cls.__name__} {dbref.id} dereferenced')
+
+    ReferenceField._lazy_load_ref = staticmethod(refuse)
+    try:
+        yield dereferenced
+    finally:
+        ReferenceField._lazy_load_ref = original
+    if dereferenced:
+        raise DereferenceError(f'{len(dereferenced)} reference(s) dereferenced: {dereferenced}')
+
+
+@contextmanager
+def mongomock_database():
+    """
+    Point MongoEngine at an empty mongomock database for the block (yielded
+    as a pymongo-style database), then reconnect to the configured server.
+    """
+    disconnect()
+    connect('test_student_management', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+    try:
+        yield get_db()
+    finally:
+        disconnect()
+        connect(**settings.MONGODB_SETTINGS)